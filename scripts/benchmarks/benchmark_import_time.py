@@ -0,0 +1,88 @@
+'''
+Startup time regression check based on python -X importtime.
+
+Imports every target in a fresh interpreter `-r` times and reports the fastest total import
+time, plus any provider SDK that was loaded along the way. Modules that only build prompts or
+write templates must not load openai, langchain or google, those are imported on the first
+request to a provider. Exits with status 1 when a target goes over its budget or loads an SDK,
+so the check can run in CI. No server or API keys needed.
+
+    python scripts/benchmarks/benchmark_import_time.py -r 5
+'''
+import os
+import sys
+import argparse
+import subprocess
+
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Target -> import time budget in milliseconds. Scripts are run with --help, so only their imports count
+TARGETS = {"propeterra_internship_2025.utils.prompt_templates": 100,
+           "propeterra_internship_2025.utils.model_query":      250,
+           "propeterra_internship_2025.utils.async_query":      250,
+           "propeterra_internship_2025.utils.prompt_matrix":    150,
+           "submit_query.py":                                   400,
+           "submit_real_estate_questions.py":                   400}
+
+# Packages that may only be imported once a request is sent or a token is counted
+LAZY_PACKAGES = ("openai", "httpx", "tiktoken", "langchain_core", "langchain_openai", "langchain_perplexity",
+                 "langchain_google_genai", "google.generativeai")
+
+
+def import_profile(target:str) -> tuple[float, set[str]]:
+    ''' Total import time in milliseconds of one cold start of the target, and every module it imported '''
+    if target.endswith(".py"):
+        command = [os.path.join(SCRIPTS_DIR, target), "--help"]
+    else:
+        command = ["-c", f"import {target}"]
+    result = subprocess.run([sys.executable, "-X", "importtime", *command], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{target} failed to start:\n{result.stderr[-2000:]}")
+
+    total_us = 0
+    modules = set()
+    after_startup = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # Everything up to site is interpreter startup, the same for every target
+        if not after_startup:
+            after_startup = name.strip() == "site"
+            continue
+        modules.add(name.strip())
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def main(args: argparse.Namespace) -> None:
+    failures = []
+    for target, budget_ms in TARGETS.items():
+        profiles = [import_profile(target) for _ in range(args.repeats)]
+        best_ms = min(milliseconds for milliseconds, _ in profiles)
+        loaded = sorted(package for package in LAZY_PACKAGES
+                        if any(module == package or module.startswith(package + ".") for module in profiles[0][1]))
+
+        status = "ok"
+        if best_ms > budget_ms * args.budget_factor:
+            status = "OVER BUDGET"
+            failures.append(target)
+        if loaded:
+            status = f"LOADS {', '.join(loaded)}"
+            failures.append(target)
+        print(f"{target:<52} {best_ms:8.1f} ms   budget {budget_ms * args.budget_factor:6.0f} ms   {status}")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--repeats", type=int, default=5, help="Cold starts per target, the fastest one is reported")
+    parser.add_argument("--budget_factor", type=float, default=1.0, help="Scales every budget, e.g. 2 on a slow CI machine")
+    args = parser.parse_args()
+
+    main(args)
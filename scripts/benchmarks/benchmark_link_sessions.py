@@ -0,0 +1,67 @@
+'''
+Measures what pooled sessions save when many links share a host.
+
+Checks --links_per_host links on each of --hosts local fixture hosts (see fake_link_server.py)
+through LinkValidator, once with a new connection per link (module level requests.head, the old
+check_link), once with pooled keep-alive requests sessions and, when h2 is installed, once with
+httpx clients. The fixture is plain HTTP, so the httpx run negotiates HTTP/1.1 keep-alive, not
+HTTP/2 (that needs TLS), and every new connection costs the fixture's simulated handshake delay
+rather than a real TCP and TLS handshake.
+
+    python scripts/benchmarks/benchmark_link_sessions.py --hosts 5 --links_per_host 20
+'''
+import time
+import argparse
+import importlib.util
+
+from fake_link_server import start_server
+from propeterra_internship_2025.utils.link_sessions import LinkSessions
+from propeterra_internship_2025.utils.link_validation import LinkValidator, check_link, link_host
+
+
+class UnpooledValidator(LinkValidator):
+    ''' The same limits, but every link opens its own connection '''
+
+    def check_one(self, link:str):
+        with self.host_limiter(link_host(link)):
+            return check_link(link, timeout=self.timeout)
+
+
+def run(name:str, validator:LinkValidator, links:list[str], server) -> None:
+    connections = server.connections
+    start = time.perf_counter()
+    statuses = validator.check_many(links)
+    elapsed = time.perf_counter() - start
+    validator.close()
+
+    failed = sum(status[0] is None for status in statuses)
+    print(f"{name:<28} {elapsed:7.3f} s   {1000*elapsed/len(links):7.2f} ms/link   "
+          f"{server.connections - connections:5d} connections   {failed} unchecked")
+
+
+def main(args: argparse.Namespace) -> None:
+    server = start_server(handshake_delay=args.handshake_delay)
+    links = [f"http://127.0.0.{host + 1}:{server.server_port}/{'dead' if i % 10 == 9 else 'page'}/{i}"
+             for i in range(args.links_per_host) for host in range(args.hosts)]
+    limits = {"max_workers": args.workers, "per_host": args.per_host, "host_delay": 0.0}
+
+    try:
+        run("new connection per link", UnpooledValidator(**limits), links, server)
+        run("pooled requests sessions", LinkValidator(**limits, sessions=LinkSessions(pool_size=args.per_host)), links, server)
+        if importlib.util.find_spec("h2") is not None:
+            run("pooled httpx clients", LinkValidator(**limits, sessions=LinkSessions(pool_size=args.per_host, http2=True)), links, server)
+        else:
+            print('h2 is not installed, skipping the httpx run (pip install "httpx[http2]")')
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", type=int, default=5, help="Number of fixture hosts")
+    parser.add_argument("--links_per_host", type=int, default=20, help="Links checked on every host")
+    parser.add_argument("--workers", type=int, default=16, help="Links checked at the same time")
+    parser.add_argument("--per_host", type=int, default=2, help="Links of one host checked at the same time, also the pool size")
+    parser.add_argument("--handshake_delay", type=float, default=0.02, help="Simulated seconds a new connection costs")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,79 @@
+'''
+Measures rendering the full country x prompt x system prompt matrix.
+
+Compares the old construct_prompt replace chain (ten str.replace passes over the full text per
+render, re-joining the reference links every time), create_prompt on the precompiled templates,
+and a single render_many call over the whole matrix. Every variant is checked to produce the
+same prompts. No server or API keys needed.
+
+    python scripts/benchmarks/benchmark_prompt_templates.py -r 5
+'''
+import time
+import argparse
+import itertools
+
+from propeterra_internship_2025.data.reference_material import clean_reference_material
+from propeterra_internship_2025.data.country_catalog import get_country_catalog
+from propeterra_internship_2025.utils.user_prompts import user_prompt_dictionary
+from propeterra_internship_2025.utils.system_prompts import system_prompt_dictionary
+from propeterra_internship_2025.utils.prompt_templates import create_prompt, render_many
+
+
+N_SOURCES = 60
+
+
+def legacy_construct_prompt(country:str, prompt_num:int, system_prompt_num:int) -> tuple[str, str]:
+    ''' The replace chain Prompt.construct_prompt used before the templates were precompiled '''
+    user_prompt = user_prompt_dictionary[prompt_num]
+    system_prompt = system_prompt_dictionary[system_prompt_num]
+    native_language = get_country_catalog().language(country) or ""
+
+    system_prompt = system_prompt.replace('__num_sources__', str(N_SOURCES))
+    system_prompt = system_prompt.replace('__country_of_interest__', country)
+    system_prompt = system_prompt.replace('__native_language__', native_language)
+    system_prompt = system_prompt.replace('__links__', " \n".join(clean_reference_material[:30]))
+    system_prompt = system_prompt.replace('__prompt_num__', str(prompt_num))
+
+    user_prompt = user_prompt.replace('__num_sources__', str(N_SOURCES))
+    user_prompt = user_prompt.replace('__country_of_interest__', country)
+    user_prompt = user_prompt.replace('__native_language__', native_language)
+    user_prompt = user_prompt.replace('__links__', " \n".join(clean_reference_material[:30]))
+    user_prompt = user_prompt.replace('__prompt_num__', str(prompt_num))
+
+    return system_prompt, user_prompt
+
+
+def best_of(repeats:int, render) -> tuple[float, dict]:
+    ''' Fastest wall time of `repeats` full matrix renders, and the prompts of the last one '''
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rendered = render()
+        timings.append(time.perf_counter() - start)
+    return min(timings), rendered
+
+
+def main(args: argparse.Namespace) -> None:
+    countries = list(get_country_catalog().countries)
+    prompt_nums = list(user_prompt_dictionary)
+    system_prompt_nums = list(system_prompt_dictionary)
+    matrix = list(itertools.product(countries, prompt_nums, system_prompt_nums))
+    print(f"{len(countries)} countries x {len(prompt_nums)} prompts x {len(system_prompt_nums)} system prompts = {len(matrix)} renders")
+
+    legacy_time, legacy = best_of(args.repeats, lambda: {key: legacy_construct_prompt(*key) for key in matrix})
+    compiled_time, compiled = best_of(args.repeats, lambda: {(c, p, s): create_prompt(N_SOURCES, c, p, s) for c, p, s in matrix})
+    bulk_time, bulk = best_of(args.repeats, lambda: render_many(countries, prompt_nums, system_prompt_nums, N_SOURCES))
+
+    assert legacy == compiled == bulk, "Precompiled templates render different prompts than the replace chain"
+
+    for name, seconds in (("replace chain", legacy_time), ("create_prompt", compiled_time), ("render_many", bulk_time)):
+        print(f"{name:<15} {1000*seconds:9.2f} ms   {1e6*seconds/len(matrix):7.2f} us/render   {legacy_time/seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--repeats", type=int, default=5, help="Full matrix renders per variant, the fastest one is reported")
+    args = parser.parse_args()
+
+    main(args)
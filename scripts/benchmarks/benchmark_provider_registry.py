@@ -0,0 +1,61 @@
+'''
+Measures the per request overhead saved by the provider registry.
+
+Sends the same chat completion to a local fake OpenAI endpoint N times, once building a new
+OpenAI client for every request (the old QueryModel behaviour) and once through the pooled
+client from provider_registry. A plain HTTP fake server has no TLS, so the real saving against
+api.openai.com / api.perplexity.ai is larger than what is reported here.
+
+    python scripts/benchmarks/benchmark_provider_registry.py -n 200
+'''
+import time
+import argparse
+import statistics
+
+from openai import OpenAI
+from fake_openai_server import start_server
+from propeterra_internship_2025.utils.provider_registry import get_openai_client, clear_registry
+
+
+MESSAGES = [{"role": "system", "content": "benchmark"}, {"role": "user", "content": "ping"}]
+
+
+def time_requests(make_client, n_requests:int) -> list[float]:
+    ''' Returns the wall time of each request in seconds '''
+    timings = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        client = make_client()
+        client.chat.completions.create(model="gpt-4.1", messages=MESSAGES)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name:str, timings:list[float]) -> None:
+    print(f"{name:<22} mean {1000*statistics.mean(timings):7.3f} ms   median {1000*statistics.median(timings):7.3f} ms   total {sum(timings):6.3f} s")
+
+
+def main(args: argparse.Namespace) -> None:
+    server = start_server()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    try:
+        per_call = time_requests(lambda: OpenAI(api_key="benchmark", base_url=base_url), args.n_requests)
+        clear_registry()
+        pooled = time_requests(lambda: get_openai_client("benchmark", base_url=base_url), args.n_requests)
+    finally:
+        clear_registry()
+        server.shutdown()
+
+    report("new client per call", per_call)
+    report("pooled registry client", pooled)
+    saved = statistics.mean(per_call) - statistics.mean(pooled)
+    print(f"\nOverhead saved per request: {1000*saved:.3f} ms ({100*saved/statistics.mean(per_call):.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--n_requests", type=int, default=200, help="Number of requests to send for each strategy")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,130 @@
+'''
+Local fixture server for the link checking benchmarks: one HTTP/1.1 keep-alive server that
+answers on every loopback address, so http://127.0.0.1:<port>/, http://127.0.0.2:<port>/, ...
+behave like separate hosts (Linux routes all of 127.0.0.0/8 to the loopback interface).
+Every new connection waits HANDSHAKE_DELAY seconds before it is served, standing in for the
+TCP and TLS handshakes a real host costs, and is counted, so the benchmarks can report how many
+connections each strategy opened. Paths containing "dead" answer 404, all others 200, and
+/robots.txt disallows everything under /private/. /redirect/<path> redirects (302) to /<path>,
+paths containing "nohead" answer HEAD with 405, and paths containing "large" serve a
+LARGE_BODY_BYTES body that honours Range requests; the body bytes sent are counted too.
+
+    python scripts/benchmarks/fake_link_server.py --port 8766
+'''
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+HANDSHAKE_DELAY = 0.02
+ROBOTS_TXT = "User-agent: *\nDisallow: /private/\n"
+LARGE_BODY_BYTES = 8 * 1024 * 1024
+
+
+class LinkServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handshake_delay:float = HANDSHAKE_DELAY):
+        super().__init__(address, FakeLinkHandler)
+        self.handshake_delay = handshake_delay
+        self.connections = 0
+        self.requests = 0
+        self.body_bytes = 0
+        self.lock = threading.Lock()
+
+    def count(self, field:str, amount:int = 1) -> None:
+        with self.lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+
+class FakeLinkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+        time.sleep(self.server.handshake_delay)
+
+    def respond(self, send_body:bool) -> None:
+        self.server.count("requests")
+        if self.path.startswith("/redirect/"):
+            self.send_response(302)
+            self.send_header("Location", self.path[len("/redirect"):])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if "large" in self.path:
+            self.respond_large(send_body)
+            return
+
+        status = 404 if "dead" in self.path else 200
+        body = (ROBOTS_TXT if self.path == "/robots.txt" else f"{status} {self.path}\n").encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+            self.server.count("body_bytes", len(body))
+
+    def respond_large(self, send_body:bool) -> None:
+        ''' A large "PDF", the whole of it or the single byte range asked for '''
+        first, last = 0, LARGE_BODY_BYTES - 1
+        requested = self.headers.get("Range", "")
+        if requested.startswith("bytes="):
+            start, _, end = requested[len("bytes="):].partition("-")
+            first, last = int(start or 0), min(int(end) if end else last, last)
+        self.send_response(206 if requested else 200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(last - first + 1))
+        if requested:
+            self.send_header("Content-Range", f"bytes {first}-{last}/{LARGE_BODY_BYTES}")
+        self.end_headers()
+        if not send_body:
+            return
+        chunk = b"%" * 65536
+        remaining = last - first + 1
+        try:
+            while remaining > 0:
+                sent = min(remaining, len(chunk))
+                self.wfile.write(chunk[:sent])
+                self.server.count("body_bytes", sent)
+                remaining -= sent
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def do_HEAD(self):
+        if "nohead" in self.path:
+            self.server.count("requests")
+            self.send_response(405)
+            self.send_header("Allow", "GET")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port:int = 0, handshake_delay:float = HANDSHAKE_DELAY) -> LinkServer:
+    ''' Starts the fixture on a background thread and returns the server, server.server_port holds the bound port '''
+    server = LinkServer(("", port), handshake_delay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--port", type=int, default=8766, help="Port to listen on")
+    parser.add_argument("--handshake_delay", type=float, default=HANDSHAKE_DELAY, help="Seconds every new connection waits before it is served")
+    args = parser.parse_args()
+
+    server = LinkServer(("", args.port), args.handshake_delay)
+    print(f"Fake link hosts listening on http://127.0.0.1:{args.port}/, http://127.0.0.2:{args.port}/, ...")
+    server.serve_forever()
@@ -0,0 +1,252 @@
+'''
+Minimal local stand-in for the OpenAI HTTP API, used by the benchmarks so they can run
+without API keys or network access. Speaks HTTP/1.1 with keep-alive so connection reuse
+shows up in the timings. Also implements the files and batches endpoints, so the
+--batch mode of submit_real_estate_questions.py can be exercised end to end with
+--base_url http://127.0.0.1:8765/v1. Batches complete after BATCH_POLLS_UNTIL_DONE polls, with
+their output lines in reverse input order (the real API does not keep the order either) and
+questions containing BATCH_FAILURE_MARKER answered with a 500 in the error file.
+Requests with "stream": true are answered as server-sent events, STREAM_CHUNKS chunks
+STREAM_CHUNK_DELAY seconds apart, with a citations list on the chat completion chunks
+like Perplexity sends. Prompt caching is emulated: once a leading system/developer message has
+been seen, later requests starting with it report its tokens (characters / 4) as cached.
+/embeddings returns a bag of words vector, so texts sharing most words come out similar.
+
+    python scripts/benchmarks/fake_openai_server.py --port 8765
+'''
+import json
+import math
+import time
+import uuid
+import zlib
+import base64
+import struct
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+BATCH_POLLS_UNTIL_DONE = 2
+BATCH_FAILURE_MARKER = "[fail in batch]"
+STREAM_CHUNKS = 5
+STREAM_CHUNK_DELAY = 0.01
+FAKE_CITATIONS = ["https://example.com/source-1", "https://example.com/source-2"]
+EMBEDDING_DIMENSIONS = 256
+
+# Uploaded files and created batches, shared by every handler thread
+files: dict[str, bytes] = {}
+batches: dict[str, dict] = {}
+# Reentrant, completing a batch answers its lines and prompt_usage takes the lock again
+state_lock = threading.RLock()
+# Leading system messages already "cached", for the emulated prompt caching
+cached_prefixes: set[str] = set()
+
+
+def prompt_usage(messages:list | str) -> tuple[int, int]:
+    ''' (input tokens, cached tokens) of a request, the leading system message counts as cached from its second use on '''
+    if isinstance(messages, str):
+        return len(messages) // 4 + 1, 0
+    contents = [message.get("content") if isinstance(message.get("content"), str) else "" for message in messages]
+    input_tokens = sum(len(content) // 4 for content in contents) + 1
+    if not messages or messages[0].get("role") not in ("system", "developer"):
+        return input_tokens, 0
+    with state_lock:
+        cached = contents[0] in cached_prefixes
+        cached_prefixes.add(contents[0])
+    return input_tokens, len(contents[0]) // 4 if cached else 0
+
+
+def fake_embedding(text:str) -> list[float]:
+    ''' Unit length bag of words vector of the text '''
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for word in text.lower().split():
+        vector[zlib.crc32(word.strip("?.,!").encode("utf8")) % EMBEDDING_DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def parse_multipart_file(content_type:str, body:bytes) -> bytes:
+    ''' Pulls the uploaded file out of a multipart/form-data body '''
+    boundary = content_type.split("boundary=")[1].strip('"').encode()
+    for part in body.split(b"--" + boundary):
+        headers, _, content = part.partition(b"\r\n\r\n")
+        if b'name="file"' in headers:
+            return content.rsplit(b"\r\n", 1)[0]
+    return b""
+
+
+def answer_batch_line(line:dict) -> dict:
+    ''' Fake chat completion result for one batch input line '''
+    question = line["body"]["messages"][-1]["content"]
+    if BATCH_FAILURE_MARKER in question:
+        return {"id": f"batch_req_{uuid.uuid4().hex[:8]}", "custom_id": line["custom_id"], "error": None,
+                "response": {"status_code": 500, "request_id": uuid.uuid4().hex,
+                             "body": {"error": {"message": "The server had an error processing your request", "type": "server_error"}}}}
+    input_tokens, cached_tokens = prompt_usage(line["body"]["messages"])
+    return {"id": f"batch_req_{uuid.uuid4().hex[:8]}", "custom_id": line["custom_id"], "error": None,
+            "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                         "body": {"id": "chatcmpl-fake", "object": "chat.completion", "model": line["body"]["model"],
+                                  "choices": [{"index": 0, "finish_reason": "stop",
+                                               "message": {"role": "assistant", "content": f"fake answer to: {question}"}}],
+                                  "usage": {"prompt_tokens": input_tokens, "completion_tokens": 8, "total_tokens": input_tokens + 8,
+                                            "prompt_tokens_details": {"cached_tokens": cached_tokens}}}}}
+
+
+def batch_object(batch_id:str, advance:bool = True) -> dict:
+    ''' Advances the fake batch one poll towards completion and returns its API representation '''
+    with state_lock:
+        batch = batches[batch_id]
+        batch["polls"] += advance
+        if batch["status"] != "completed" and batch["polls"] >= BATCH_POLLS_UNTIL_DONE:
+            lines = [json.loads(line) for line in files[batch["input_file_id"]].decode("utf8").splitlines() if line.strip()]
+            answers = [answer_batch_line(line) for line in reversed(lines)]
+            output_file_id, error_file_id = f"file-{uuid.uuid4().hex[:12]}", f"file-{uuid.uuid4().hex[:12]}"
+            files[output_file_id] = "\n".join(json.dumps(answer) for answer in answers if answer["response"]["status_code"] == 200).encode("utf8")
+            files[error_file_id] = "\n".join(json.dumps(answer) for answer in answers if answer["response"]["status_code"] != 200).encode("utf8")
+            failed = sum(answer["response"]["status_code"] != 200 for answer in answers)
+            batch.update(status="completed", output_file_id=output_file_id, error_file_id=error_file_id if failed else None,
+                         total=len(lines), failed=failed)
+
+        return {"id": batch_id, "object": "batch", "endpoint": batch["endpoint"], "status": batch["status"],
+                "input_file_id": batch["input_file_id"], "output_file_id": batch.get("output_file_id"),
+                "error_file_id": batch.get("error_file_id"), "completion_window": "24h", "created_at": batch["created_at"],
+                "request_counts": {"total": batch.get("total", 0),
+                                   "completed": batch.get("total", 0) - batch.get("failed", 0) if batch["status"] == "completed" else 0,
+                                   "failed": batch.get("failed", 0)}}
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload:dict, status:int = 200) -> None:
+        body = json.dumps(payload).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, events:list[dict]) -> None:
+        ''' Streams the events as server-sent events, one chunk of the chunked body per event '''
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in events + ["[DONE]"]:
+            data = f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n".encode("utf8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(STREAM_CHUNK_DELAY)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def stream_chat_completion(self, model:str) -> None:
+        chunks = [{"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                   "citations": FAKE_CITATIONS,
+                   "choices": [{"index": 0, "delta": {"content": f"fake answer part {i} "}, "finish_reason": None}]}
+                  for i in range(STREAM_CHUNKS)]
+        chunks[-1]["choices"][0]["finish_reason"] = "stop"
+        self.send_events(chunks)
+
+    def stream_response(self, model:str, messages:list | str) -> None:
+        input_tokens, cached_tokens = prompt_usage(messages)
+        response = {"id": "resp-fake", "object": "response", "created_at": int(time.time()), "model": model, "output": []}
+        events = [{"type": "response.created", "sequence_number": 0, "response": {**response, "status": "in_progress"}}]
+        events += [{"type": "response.output_text.delta", "sequence_number": i + 1, "item_id": "msg-fake", "output_index": 0,
+                    "content_index": 0, "delta": f"fake answer part {i} "} for i in range(STREAM_CHUNKS)]
+        events.append({"type": "response.completed", "sequence_number": STREAM_CHUNKS + 1,
+                       "response": {**response, "status": "completed",
+                                    "usage": {"input_tokens": input_tokens, "output_tokens": STREAM_CHUNKS * 4, "total_tokens": input_tokens + STREAM_CHUNKS * 4,
+                                              "input_tokens_details": {"cached_tokens": cached_tokens}, "output_tokens_details": {"reasoning_tokens": 0}}}})
+        self.send_events(events)
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        parts = path.split("/")
+
+        if "batches" in parts and parts[-1] in batches:
+            self.send_json(batch_object(parts[-1]))
+        elif path.endswith("/content") and parts[-2] in files:
+            body = files[parts[-2]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json({"error": {"message": f"Unknown endpoint {self.path}"}}, status=404)
+
+    def do_POST(self):
+        raw = self.read_body()
+        path = self.path.split("?")[0].rstrip("/")
+
+        if path.endswith("/files"):
+            file_id = f"file-{uuid.uuid4().hex[:12]}"
+            content = parse_multipart_file(self.headers["Content-Type"], raw)
+            with state_lock:
+                files[file_id] = content
+            self.send_json({"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                            "filename": "batch.jsonl", "purpose": "batch", "status": "processed"})
+            return
+
+        request = json.loads(raw) if raw else {}
+
+        if path.endswith("/batches"):
+            batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+            with state_lock:
+                batches[batch_id] = {"status": "in_progress", "polls": 0, "created_at": int(time.time()),
+                                     "input_file_id": request["input_file_id"], "endpoint": request["endpoint"]}
+            self.send_json(batch_object(batch_id, advance=False))
+        elif path.endswith("/embeddings"):
+            texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            data = []
+            for index, text in enumerate(texts):
+                vector = fake_embedding(text)
+                if request.get("encoding_format") == "base64":
+                    vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode()
+                data.append({"object": "embedding", "index": index, "embedding": vector})
+            self.send_json({"object": "list", "data": data, "model": request.get("model", "fake"),
+                            "usage": {"prompt_tokens": sum(len(text) // 4 + 1 for text in texts), "total_tokens": sum(len(text) // 4 + 1 for text in texts)}})
+        elif path.endswith("/chat/completions") and request.get("stream"):
+            self.stream_chat_completion(request.get("model", "fake"))
+        elif path.endswith("/responses") and request.get("stream"):
+            self.stream_response(request.get("model", "fake"), request.get("input", ""))
+        elif path.endswith("/chat/completions"):
+            self.send_json({"id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                            "model": request.get("model", "fake"),
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": "fake answer"}}],
+                            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}})
+        elif path.endswith("/responses"):
+            self.send_json({"id": "resp-fake", "object": "response", "created_at": int(time.time()),
+                            "model": request.get("model", "fake"), "status": "completed",
+                            "output": [{"type": "message", "id": "msg-fake", "role": "assistant", "status": "completed",
+                                        "content": [{"type": "output_text", "text": "fake answer", "annotations": []}]}],
+                            "usage": {"input_tokens": 10, "output_tokens": 2, "total_tokens": 12}})
+        else:
+            self.send_json({"error": {"message": f"Unknown endpoint {self.path}"}}, status=404)
+
+
+def start_server(port:int = 0) -> ThreadingHTTPServer:
+    ''' Starts the fake API on a background thread and returns the server, server.server_port holds the bound port '''
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenAIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--port", type=int, default=8765, help="Port to listen on")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FakeOpenAIHandler)
+    print(f"Fake OpenAI API listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,62 @@
+import os
+import logging
+import argparse
+from propeterra_internship_2025.data.country_catalog import get_country_catalog
+from propeterra_internship_2025.utils.user_prompts import user_prompt_dictionary, real_estate_professionals_prompt_dictionary
+from propeterra_internship_2025.utils.system_prompts import system_prompt_dictionary
+from propeterra_internship_2025.utils.prompt_matrix import (matrix_countries, parse_number_list, generate_prompt_matrix,
+                                                            load_prompt_hashes, mark_changes, write_prompt_matrix, NEW, CHANGED, UNCHANGED)
+
+
+logging.basicConfig(level=logging.INFO)
+
+MODEL_CHOICES = ["gpt-4.1","sonar", "sonar-pro", "sonar-deep-research", "ms_copilot", "mistral", "gemini-2.5-flash","gemini-2.5-pro"]
+
+
+def main(args: argparse.Namespace) -> None:
+    '''
+    Renders every prompt for every country of the selected regions into one compressed JSONL
+    file, marking which prompts are new or changed since the previous run of the same file
+    '''
+    user_dictionary = real_estate_professionals_prompt_dictionary if args.professional else user_prompt_dictionary
+    countries = matrix_countries(args.regions)
+    prompt_nums = parse_number_list(args.prompt_nums, user_dictionary)
+    system_prompt_nums = parse_number_list(args.system_prompt_nums, system_prompt_dictionary)
+
+    print(f"{len(countries)} countries x {len(prompt_nums)} prompts x {len(system_prompt_nums)} system prompts")
+
+    records = generate_prompt_matrix(countries, prompt_nums, system_prompt_nums, args.n_sources, model=args.model,
+                                     professional=args.professional, cache_layout=not args.inline_links, workers=args.workers)
+
+    counts = mark_changes(records, load_prompt_hashes(args.outfile))
+    write_prompt_matrix(args.outfile, records)
+
+    print(f"Wrote {len(records)} prompts to {args.outfile}: {counts[NEW]} new, {counts[CHANGED]} changed, {counts[UNCHANGED]} unchanged")
+
+
+if __name__ == "__main__":
+
+    regions = get_country_catalog().regions
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--region", type=str, default="all", help=f"Comma separated regions to render, or 'all'. Choose from {', '.join(regions)}")
+    parser.add_argument("-pn", "--prompt_nums", type=str, default="all", help="Prompt templates to render, e.g. '1-7,12' or 'all'")
+    parser.add_argument("-spn", "--system_prompt_nums", type=str, default="all", help="System prompt templates to render, e.g. '1,2' or 'all'")
+    parser.add_argument("-ns", "--n_sources", type=int, default=60, help="The number of links you want to get back from the model")
+    parser.add_argument("-m", "--model", type=str, default=None, choices=MODEL_CHOICES, help="Pack the reference links into this model's token budget and count tokens with its encoding")
+    parser.add_argument("--professional", action="store_true", help="Render the real estate professional prompts instead of the link prompts")
+    parser.add_argument("--inline_links", action="store_true", help="Keep the reference links inside the user prompt instead of after the system prompt")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes, defaults to the number of CPUs")
+    parser.add_argument("-o", "--outfile", type=str, default=None, help="Output file, defaults to model_output/prompt_matrix/<prompts|professional>_<region>_<model>.jsonl.gz")
+    args = parser.parse_args()
+
+    args.regions = list(regions) if args.region == "all" else [region.strip() for region in args.region.split(",")]
+    if args.outfile is None:
+        kind = "professional" if args.professional else "prompts"
+        region = args.region.replace(",", "_").replace(" ", "_").lower()
+        args.outfile = os.path.join("model_output", "prompt_matrix", f"{kind}_{region}_{args.model or 'default'}.jsonl.gz")
+
+    try:
+        main(args)
+    except ValueError as e:
+        parser.error(str(e))
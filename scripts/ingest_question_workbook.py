@@ -0,0 +1,40 @@
+import os
+import logging
+import argparse
+from propeterra_internship_2025.utils.workbook_ingest import ingest_workbook
+
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main(args: argparse.Namespace) -> None:
+    '''
+    Converts the orientation question workbook into the question CSV (and its index) that
+    submit_real_estate_questions.py reads, without a manual export from Excel
+    '''
+    counts = ingest_workbook(args.infile, args.outfile, sheet=args.sheet, force=args.force)
+
+    if counts["skipped_unchanged"]:
+        print(f"{args.infile} is unchanged, {args.outfile} is up to date")
+        return
+    print(f"Wrote {counts['typed'] + counts['untyped']} questions from {counts['rows']} rows to {args.outfile}: "
+          f"{counts['typed']} with a question type, {counts['untyped']} without, "
+          f"{counts['sections']} section headers and {counts['skipped']} other rows skipped")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--infile", type=str, default="data/2025_INTERNSHIP_ORIENTATION-1000_questions.xlsx", help="The question workbook")
+    parser.add_argument("-o", "--outfile", type=str, default=None, help="The question CSV to write, defaults to the workbook name with .csv")
+    parser.add_argument("-s", "--sheet", type=str, default=None, help="The sheet with the questions, defaults to the first one")
+    parser.add_argument("--force", action="store_true", help="Import the workbook even if it did not change since the last import")
+    args = parser.parse_args()
+
+    if args.outfile is None:
+        args.outfile = os.path.splitext(args.infile)[0] + ".csv"
+
+    try:
+        main(args)
+    except ValueError as e:
+        parser.error(str(e))
@@ -3,7 +3,9 @@ import sys
 import logging
 import argparse
 from propeterra_internship_2025.utils.model_query import QueryModel
-from propeterra_internship_2025.data.all_countries import regions, all_countries
+from propeterra_internship_2025.utils.result_store import ResultStore, render_text_views
+from propeterra_internship_2025.utils.metrics import export_run_metrics
+from propeterra_internship_2025.data.country_catalog import get_country_catalog
 from propeterra_internship_2025.utils.prompt_templates import create_real_estate_professional_prompt
 
 
@@ -11,19 +13,22 @@ from propeterra_internship_2025.utils.prompt_templates import create_real_estate
 logging.basicConfig(level=logging.INFO)
 
 
-def main(args: argparse.Namespace) -> None:
+def main(args: argparse.Namespace, result_store:ResultStore) -> None:
     '''
     Create prompts for manus to search for real estate professionals in a specific country.
     '''
 
-    system_prompt, user_prompt = create_real_estate_professional_prompt(
+    rendered = create_real_estate_professional_prompt(
                                     country_of_interest=args.country,
                                     system_prompt_num=args.system_prompt_num,
-                                    prompt_num=args.prompt_num)
+                                    prompt_num=args.prompt_num,
+                                    model=args.model)
+    system_prompt, user_prompt = rendered
     
     query = QueryModel(model=args.model,  country=args.country, system_prompt=system_prompt,
                        user_prompt=user_prompt, prompt_number=args.prompt_num,
-                       system_prompt_number=args.system_prompt_num)
+                       system_prompt_number=args.system_prompt_num, result_store=result_store,
+                       prompt_tokens=rendered.estimated_tokens)
     
     query.initialize_real_estate_professional_search_file()
     
@@ -41,6 +46,23 @@ if __name__ == "__main__":
     parser.add_argument("-m", "--model",   type=str, default="manus", choices=["manus","gpt-4.1","sonar", "sonar-pro", "sonar-deep-research", "ms_copilot", "mistral", "gemini_2.5_flash"], help="The model that you want to query")
     parser.add_argument("-spn", "--system_prompt_num", type=int, default=4, help="The system prompt template that you want to submit to the model. List of all prompts is located in 'prompt templates'")
     parser.add_argument("-pn", "--prompt_num", type=int, default=2, help="The specific question number that you want to query, this is used to select the question from the CSV file")
+    parser.add_argument("--run_id", type=str, default=None, help="Append to an existing run in model_output/runs instead of starting a new one")
+    parser.add_argument("--metrics_textfile", type=str, default=None, help="Also write the run metrics to this Prometheus textfile, e.g. for the node_exporter textfile collector")
     args = parser.parse_args()
 
-    main(args)   
+    try:
+        args.country = get_country_catalog().resolve(args.country)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # All output of the run goes to one result store, the .txt files are rendered from it once the run ends
+    try:
+        result_store = ResultStore(run_id=args.run_id)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        main(args, result_store)
+    finally:
+        result_store.close()
+        render_text_views(result_store)
+        export_run_metrics(result_store.run_dir, args.metrics_textfile)
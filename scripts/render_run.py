@@ -0,0 +1,33 @@
+import logging
+import argparse
+from propeterra_internship_2025.utils.result_store import ResultStore, render_text_views, DEFAULT_RUNS_DIR
+
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main(args: argparse.Namespace) -> None:
+    '''
+    Re-renders the documentation .txt files of a run from its result store,
+    e.g. after a crash or into a separate folder for review.
+    '''
+    with ResultStore(runs_dir=args.runs_dir, run_id=args.run_id) as store:
+        written = render_text_views(store, output_dir=args.output_dir, overwrite=args.overwrite, only_new=False)
+
+    for path in written:
+        print(path)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(dest="run_id", type=str, help="The run to render, i.e. the folder name in model_output/runs")
+    parser.add_argument("--runs_dir", type=str, default=DEFAULT_RUNS_DIR, help="Where the runs are stored")
+    parser.add_argument("-o", "--output_dir", type=str, default="model_output", help="Folder the country sub folders and .txt files are written to")
+    parser.add_argument("--overwrite", action="store_true", help="Replace the .txt files instead of appending to them")
+    args = parser.parse_args()
+
+    try:
+        main(args)
+    except ValueError as e:
+        parser.error(str(e))
@@ -22,6 +22,7 @@ import logging
 from urllib.parse import urljoin, urlparse
 import re
 from typing import Dict, List, Set, Optional
+from propeterra_internship_2025.utils.robots import RobotsCache
 
 # Configure logging
 logging.basicConfig(
@@ -44,14 +45,21 @@ class PropertystarAgentScraper:
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        # robots.txt is fetched once per site through the same session and consulted before every request
+        self.robots = RobotsCache(get=self.session.get)
         self.base_url = "https://www.properstar.com"
         self.agents_data = []
         self.processed_agents = set()  # Track processed agent URLs to avoid duplicates
         
     def make_request(self, url: str) -> Optional[BeautifulSoup]:
         """Make a request with proper error handling and rate limiting."""
+        user_agent = self.session.headers['User-Agent']
+        if not self.robots.can_fetch(user_agent, url):
+            logging.warning(f"robots.txt disallows fetching {url}, skipping it")
+            return None
         try:
-            time.sleep(self.delay)  # Rate limiting
+            # Rate limiting, slower if the site asks for a longer Crawl-delay
+            time.sleep(max(self.delay, self.robots.crawl_delay(user_agent, url) or 0))
             response = self.session.get(url, timeout=15)
             response.raise_for_status()
             return BeautifulSoup(response.content, 'html.parser')
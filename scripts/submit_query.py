@@ -1,16 +1,29 @@
 import os
 import logging
 import argparse
-from openai import OpenAI
-from propeterra_internship_2025.data.all_countries import regions, all_countries
-from propeterra_internship_2025.utils.prompt_templates import Prompt, create_prompt, create_real_estate_professional_prompt
+from propeterra_internship_2025.data.country_catalog import get_country_catalog
+from propeterra_internship_2025.utils.prompt_templates import Prompt, create_prompt, create_real_estate_professional_prompt, link_token_budget
 from propeterra_internship_2025.utils.model_query import QueryModel
+from propeterra_internship_2025.utils.result_store import ResultStore, render_text_views
+from propeterra_internship_2025.utils.metrics import export_run_metrics
+from propeterra_internship_2025.utils.response_cache import ResponseCache
+from propeterra_internship_2025.utils.async_query import fan_out, parse_model_list, parse_provider_limits
 
 
 logging.basicConfig(level=logging.INFO)
 
+MODEL_CHOICES = ["gpt-4.1","sonar", "sonar-pro", "sonar-deep-research", "ms_copilot", "mistral", "gemini-2.5-flash", "gemini-2.5-pro", "manus"]
+# Models with a query path, ms_copilot, mistral and manus are queried by hand from the written templates
+SUBMIT_MODEL_CHOICES = ["gpt-4.1","sonar", "sonar-pro", "sonar-deep-research", "gemini-2.5-flash", "gemini-2.5-pro"]
 
-def main(args: argparse.Namespace) -> None:
+
+def write_query_result(query:QueryModel, message_text:str) -> None:
+    ''' Writes the documentation template followed by the model response '''
+    query.initialize_file()
+    query.write_response(message_text)
+
+
+def main(args: argparse.Namespace, result_store:ResultStore) -> None:
     '''
     Iterate over the countries in the region of interest and submit a query to the
     LLM (Which can be specified) 
@@ -22,36 +35,50 @@ def main(args: argparse.Namespace) -> None:
     # Initialize prompt
     prompt = ""
 
+    cache = None if args.no_cache else ResponseCache()
+
     # Selecting just 1 country
     if args.country:
-        if args.country not in all_countries:
-            raise TypeError('Selected country {} not found, maybe typo. Please double check.')
-         
-        system_prompt, user_prompt = create_prompt(n_sources=args.n_sources,
+        # One prompt for every model, so the links are packed into the tightest of their token budgets
+        rendered = create_prompt(n_sources=args.n_sources,
                                country_of_interest=args.country,
                                prompt_num=args.prompt_num,
-                               system_prompt_num=args.system_prompt_num)
-
-        # Feeding the prompt to the query framework to be submitted
-        query = QueryModel(args.model, args.country, system_prompt, user_prompt, args.prompt_num, args.system_prompt_num)
-        query.initialize_file()
-        print(prompt, "\n\n")
-
-        # Submitting the actual query
-        # query.submit_query()
+                               system_prompt_num=args.system_prompt_num,
+                               model=args.models[0],
+                               link_token_budget=link_token_budget(args.models),
+                               cache_layout=not args.inline_links)
+        system_prompt, user_prompt = rendered
+
+        # Feeding the prompt to the query framework to be submitted, the prompt is rendered once for every model
+        queries = [QueryModel(model, args.country, system_prompt, user_prompt, args.prompt_num, args.system_prompt_num,
+                              cache=cache, refresh=args.refresh, result_store=result_store,
+                              # The estimate is in the encoding of the model the prompt was rendered for, the others count their own
+                              prompt_tokens=rendered.estimated_tokens if model == rendered.model else None)
+                   for model in args.models]
+
+        if args.submit:
+            # Fan out: every model gets the same prompt at the same time, a single model is just a fan out of one
+            print(f"Submitting prompt {args.prompt_num} for {args.country} to {', '.join(args.models)}")
+            fan_out(queries, write_query_result, provider_limits=parse_provider_limits(args.provider_limits))
+        else:
+            # Without --submit only the documentation templates are written, for one model or several
+            for query in queries:
+                query.initialize_file()
+            print(prompt, "\n\n")
         
     else:
 
-        countries = regions.get(region_of_interest)
-        if not countries:
-            raise ValueError(f"Could not find {region_of_interest} in list of regions, please choose from available list of regions.")
+        countries = get_country_catalog().region(region_of_interest)
 
         # Loop over all countries in a region
         for country in countries:
             prompt = create_prompt(n_sources=args.n_sources,
                                    country_of_interest=country,
                                    prompt_num=args.prompt_num,
-                                   system_prompt_num=args.system_prompt_num)
+                                   system_prompt_num=args.system_prompt_num,
+                                   model=args.models[0],
+                                   link_token_budget=link_token_budget(args.models),
+                                   cache_layout=not args.inline_links)
             
             print(prompt, "\n\n")
 
@@ -66,14 +93,38 @@ def main(args: argparse.Namespace) -> None:
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("-r","--region", type=str, default="Latin America", choices=regions.keys(), help="The regions that you want to probe, will loop over all countries in region")
+    parser.add_argument("-r","--region", type=str, default="Latin America", choices=get_country_catalog().regions.keys(), help="The regions that you want to probe, will loop over all countries in region")
     parser.add_argument("-ns","--n_sources", type=int, default=60, help="The number of links you want to get back from the model")
     parser.add_argument("-pn", "--prompt_num", type=int, default=12, help="The prompt template that you want to submit to the model. List of all prompts is located in 'prompt templates'")
     parser.add_argument("-spn", "--system_prompt_num", type=int, default=2, help="The system prompt template that you want to submit to the model. List of all prompts is located in 'prompt templates'")
     parser.add_argument("-c", '--country', type=str, default="Mexico", help="Specify a single country you would like to generate a prompt for")
-    parser.add_argument("-m", "--model", type=str, default="sonar-pro", choices=["gpt-4.1","sonar", "sonar-pro", "sonar-deep-research", "ms_copilot", "mistral", "gemini-2.5-flash", "manus"], help="The model that you want to query")
+    parser.add_argument("-m", "--model", type=str, default="sonar-pro", help=f"The model that you want to query, or a comma separated list to submit the prompt to several models at once. Choose from {', '.join(MODEL_CHOICES)}")
+    parser.add_argument("--submit", action="store_true", help=f"Submit the prompt to every selected model ({', '.join(SUBMIT_MODEL_CHOICES)}), without it only the documentation templates are written")
+    parser.add_argument("--inline_links", action="store_true", help="Keep the reference links inside the user prompt instead of after the system prompt, where the provider can cache them as part of the shared prefix")
+    parser.add_argument("--provider_limits", type=str, default="", help="Per provider concurrency caps when fanning out, e.g. 'openai=8,perplexity=4,gemini=4'")
 
 
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Do not read or write the on-disk response cache")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached responses and re-query the model, the new responses replace the cached ones")
+    parser.add_argument("--run_id", type=str, default=None, help="Append to an existing run in model_output/runs instead of starting a new one")
+    parser.add_argument("--metrics_textfile", type=str, default=None, help="Also write the run metrics to this Prometheus textfile, e.g. for the node_exporter textfile collector")
     args = parser.parse_args()
 
-    main(args)   
+    try:
+        args.models = parse_model_list(args.model, SUBMIT_MODEL_CHOICES if args.submit else MODEL_CHOICES)
+        if args.country:
+            args.country = get_country_catalog().resolve(args.country)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # All output of the run goes to one result store, the .txt files are rendered from it once the run ends
+    try:
+        result_store = ResultStore(run_id=args.run_id)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        main(args, result_store)
+    finally:
+        result_store.close()
+        render_text_views(result_store)
+        export_run_metrics(result_store.run_dir, args.metrics_textfile)
@@ -1,17 +1,36 @@
-import csv
-import sys
+import os
 import logging
 import argparse
-from propeterra_internship_2025.data.all_countries import regions, all_countries
-from propeterra_internship_2025.utils.prompt_templates import create_real_estate_question_prompt
+from datetime import date
+from propeterra_internship_2025.data.country_catalog import get_country_catalog
+from propeterra_internship_2025.utils.prompt_templates import create_real_estate_question_prompt, link_token_budget
 from propeterra_internship_2025.utils.model_query import QueryModel
+from propeterra_internship_2025.utils.result_store import ResultStore, render_text_views
+from propeterra_internship_2025.utils.metrics import export_run_metrics
+from propeterra_internship_2025.utils.run_manifest import RunManifest, manifest_key
+from propeterra_internship_2025.utils.response_cache import ResponseCache
+from propeterra_internship_2025.utils.workbook_ingest import ingest_workbook
+from propeterra_internship_2025.utils.question_index import QuestionIndex, load_question_index, parse_question_numbers, question_file_type
+from propeterra_internship_2025.utils.semantic_cache import SemanticCache, EMBEDDERS, MODES, DEFAULT_SIMILARITY_THRESHOLD
+from propeterra_internship_2025.utils.async_query import run_queries_concurrently, parse_provider_limits, parse_model_list
+from propeterra_internship_2025.utils.batch_submission import run_batch
+from propeterra_internship_2025.utils.provider_registry import get_openai_client
 
 
 
 logging.basicConfig(level=logging.INFO)
 
+# Only models with a query path, ms_copilot and mistral are queried by hand
+MODEL_CHOICES = ["gpt-4.1","sonar", "sonar-pro", "sonar-deep-research", "gemini-2.5-flash","gemini-2.5-pro"]
 
-def main(args: argparse.Namespace) -> None:
+
+def write_question_result(query:QueryModel, message_text:str) -> None:
+    ''' Writes the documentation template followed by the model response for one question '''
+    query.initialize_real_estate_questions_file()
+    query.write_response(message_text, real_estate_questions=True)
+
+
+def main(args: argparse.Namespace, result_store:ResultStore, manifest:RunManifest, index:QuestionIndex) -> None:
     '''
     Iterate over the 100 or 1000 questions about the region of interest and submit a query to the
     LLM (Which can be specified) 
@@ -21,78 +40,214 @@ def main(args: argparse.Namespace) -> None:
 
 
     file_path = args.infile  # Replace with the path to your CSV file
-    
-    
-    
-    # Extracting the 100_questions or 1000_questions from the file name
-    if "1000_questions" in file_path:
-        file_type = "_of_1000_questions"
-    elif "100_questions" in file_path:
-        file_type = "_of_100_questions"
-    else:
-        raise ValueError("The file name must contain either '100_questions' or '1000_questions' to determine the type of questions.")
-
-
-    with open(file_path, 'r', newline='', encoding="utf8") as csvfile:
-        reader = csv.reader(csvfile)
-
-
-        # Select only 1 question specified by the user to submit to the model
-        if args.question_num != -1:
-            query_limit = 1.0
-            reader = [row for idx, row in enumerate(reader) if idx == args.question_num - 1]
-            print(f"Querying question number {args.question_num} from the file.")
-            print(f"[{args.question_num}] {reader[0][0]}")
-        else:
-            print(f"Querying all questions from the file: {file_path}")
 
+    # One cache shared by every question in the run
+    cache = None if args.no_cache else ResponseCache()
+    # Near duplicate questions, compared per model, country and system prompt
+    semantic_cache = None
+    if args.semantic_cache != "off":
+        semantic_cache = SemanticCache(embedder=EMBEDDERS[args.embedder](), threshold=args.semantic_threshold, mode=args.semantic_cache)
 
+    file_type = question_file_type(file_path, len(index))
+    question_numbers = args.question_numbers
 
-        for idx, row in enumerate(reader):
-
-            # Changing the prompt index to match the question number that will be printed on the output file
-            if args.question_num != -1:
-                prompt_index = args.question_num
-            else:
-                prompt_index = idx + 1
+    if len(question_numbers) < len(index):
+        print(f"Querying {len(question_numbers)} of the {len(index)} questions from the file: {file_path}")
+    else:
+        print(f"Querying all questions from the file: {file_path}")
+
+    # Every question is rendered up front so the whole sweep can be registered in the manifest
+    queries = []
+    # Placeholders the prompt builder could not fill, per question number
+    unresolved = {}
+
+    # Seeks straight to the selected questions instead of parsing the rows before them
+    for prompt_index, question in index.read(question_numbers):
+        if len(question_numbers) == 1:
+            print(f"[{prompt_index}] {question}")
+        if not question:
+            logging.warning(f"[{prompt_index}] Row {prompt_index} of {file_path} is empty, skipping it")
+            continue
+
+        rendered = create_real_estate_question_prompt(
+                                        country_of_interest=args.country,
+                                        system_prompt_num=args.system_prompt_num,
+                                        user_prompt=question,
+                                        model=args.models[0],
+                                        link_token_budget=link_token_budget(args.models)
+                                        )
+        system_prompt, user_prompt = rendered
+        unresolved[prompt_index] = rendered.unresolved
+
+        # Rendered once, submitted to every selected model
+        for model in args.models:
+            queries.append(QueryModel(model,  args.country, system_prompt,
+                                      user_prompt, prompt_index, args.system_prompt_num,
+                                      outfile_comment=file_type,
+                                      cache=cache, refresh=args.refresh, semantic_cache=semantic_cache,
+                                      result_store=result_store,
+                                      # The estimate is in the encoding of the model the prompt was rendered for, the others count their own
+                                      prompt_tokens=rendered.estimated_tokens if model == rendered.model else None))
+
+    # Questions from the same file share a sweep, restarting the sweep skips the questions that are done
+    sweep = os.path.basename(file_path)
+    if args.fresh:
+        manifest.reset(manifest_key(query, sweep) for query in queries)
+    manifest.register(manifest_key(query, sweep) for query in queries)
+
+    # Queries are collected here when running concurrently or in batch mode and submitted once all prompts are built
+    # With several models every question is fanned out, so at least one request per model is in flight
+    concurrency = max(args.concurrency, len(args.models))
+    pending_queries = []
+    skipped = 0
+
+    def show_prompts(query:QueryModel) -> None:
+        print(query.system_prompt+"\n")
+        print(query.user_prompt+"\n")
+
+    def claim_before_sending(query:QueryModel) -> bool:
+        ''' Claims a concurrent query once it has a slot, so a long sweep never holds claims it is not working on '''
+        nonlocal skipped
+        if not manifest.claim(manifest_key(query, sweep)):
+            skipped += 1
+            return False
+        show_prompts(query)
+        return True
+
+    try:
+        for query in queries:
+            key = manifest_key(query, sweep)
 
-            system_prompt, user_prompt = create_real_estate_question_prompt(
-                                            country_of_interest=args.country,
-                                            system_prompt_num=args.system_prompt_num,
-                                            user_prompt=row[0]
-                                            )
-            
-            query = QueryModel(args.model,  args.country, system_prompt,
-                               user_prompt, prompt_index, args.system_prompt_num,
-                               outfile_comment=file_type)
-            
-            print(query.system_prompt+"\n")
-            print(query.user_prompt+"\n")
-            
             # Ensuring that all prompts have had their respective [country] specific data filled
-            # print(f"[{idx+1}] {query.user_prompt}")
-            if "[" in query.user_prompt:
-                print(f"[{prompt_index}] {query.user_prompt}")
-                sys.exit(f"Error: The user prompt contains a placeholder for the country name. Please ensure that the prompt is correctly formatted before submitting to the model.")
-
-            query.initialize_real_estate_questions_file()
-            query.query_model_langchain(real_estate_questions=True)
-
-
-        # print(f"country specific: {100*counter/query_limit}")
-
-
+            if unresolved[query.prompt_number]:
+                if not manifest.claim(key):
+                    skipped += 1
+                    continue
+                print(f"[{query.prompt_number}] {query.user_prompt}")
+                logging.error(f"[{query.prompt_number}] The user prompt contains unresolved placeholders {unresolved[query.prompt_number]}, skipping the question")
+                manifest.mark_failed(key, f"unresolved placeholders in the user prompt: {', '.join(unresolved[query.prompt_number])}")
+                continue
+
+            # Claimed by the query engine right before each one is sent
+            if concurrency > 1 and not args.batch:
+                pending_queries.append(query)
+                continue
+
+            # A batch is one submission, so its questions are claimed together; the manifest's
+            # heartbeat keeps the claims fresh while the batch runs
+            if not manifest.claim(key):
+                skipped += 1
+                continue
+            show_prompts(query)
+
+            if args.batch:
+                pending_queries.append(query)
+                continue
+
+            try:
+                query.initialize_real_estate_questions_file()
+                query.query_model_langchain(real_estate_questions=True)
+            except Exception as e:
+                logging.error(f"[{query.prompt_number}] {query.model} failed: {e}")
+                manifest.mark_failed(key, repr(e))
+                continue
+            manifest.mark_done(key)
+
+        def write_and_check_off(query:QueryModel, message_text:str) -> None:
+            write_question_result(query, message_text)
+            manifest.mark_done(manifest_key(query, sweep))
+
+        if pending_queries and args.batch:
+            client = get_openai_client(pending_queries[0].supported_models[args.models[0]], base_url=args.base_url)
+            batch_path = f"{args.batch_dir}/{args.models[0]}_{args.country}_{date.today()}_real_estate_questions{file_type}_spn_{args.system_prompt_num}.jsonl"
+
+            written, failed = run_batch(client, pending_queries, batch_path, write_and_check_off,
+                                        batch_id=args.batch_id, poll_interval=args.poll_interval)
+            print(f"Batch finished: {len(written)} questions written, {len(failed)} failed")
+
+        elif pending_queries:
+            results = run_queries_concurrently(pending_queries, write_and_check_off,
+                                               concurrency=concurrency,
+                                               provider_limits=parse_provider_limits(args.provider_limits),
+                                               real_estate_questions=True,
+                                               claim=claim_before_sending)
+            for query, result in zip(pending_queries, results):
+                if isinstance(result, BaseException):
+                    manifest.mark_failed(manifest_key(query, sweep), repr(result))
+
+        # Whatever is still in flight here got no answer (e.g. missing from the batch output)
+        manifest.fail_in_flight("no response received")
+
+        if skipped:
+            print(f"Skipped {skipped} questions that are already done or claimed by another worker")
+
+    except BaseException:
+        # Interrupted, the questions that were in flight are picked up again by the next run
+        manifest.release_in_flight()
+        raise
+
+    finally:
+        counts = manifest.state_counts(sweep)
+        print(f"Manifest {manifest.path}: {counts['done']} done, {counts['failed']} failed, {counts['pending']} pending, {counts['in_flight']} in flight")
+        for country, model, question_number, system_prompt_number, error in manifest.failures(sweep):
+            if country == args.country and model in args.models:
+                print(f"  failed [{question_number}] {model} spn {system_prompt_number}: {error}")
 
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--infile",  type=str, default="data/2025_INTERNSHIP_ORIENTATION-100_questions.csv", help="The regions that you want to probe, will loop over all countries in region")
+    parser.add_argument("-i", "--infile",  type=str, default="data/2025_INTERNSHIP_ORIENTATION-100_questions.csv", help="The question CSV, or the orientation workbook (.xlsx) which is imported into a CSV next to it")
     parser.add_argument("-c", '--country', type=str, default="Mexico", help="Specify a single country you would like to generate a prompt for")
-    parser.add_argument("-m", "--model",   type=str, default="gpt-4.1", choices=["gpt-4.1","sonar", "sonar-pro", "sonar-deep-research", "ms_copilot", "mistral", "gemini-2.5-flash","gemini-2.5-pro"], help="The model that you want to query")
+    parser.add_argument("-m", "--model",   type=str, default="gpt-4.1", help=f"The model that you want to query, or a comma separated list to submit every question to several models at once. Choose from {', '.join(MODEL_CHOICES)}")
     parser.add_argument("-spn", "--system_prompt_num", type=int, default=3, help="The system prompt template that you want to submit to the model. List of all prompts is located in 'prompt templates'")
-    parser.add_argument("-qn", "--question_num", type=int, default=-1, help="The specific question number that you want to query, this is used to select the question from the CSV file")
+    parser.add_argument("-qn", "--question_num", type=str, default="all", help="The questions to query by their number in the CSV file, e.g. 12, 200-350 or 1-10,40")
+    parser.add_argument("-qt", "--question_type", type=str, default=None, help="Only query the questions of this type, e.g. 'Investment Strategy & ROI'")
+    parser.add_argument("-j", "--concurrency", type=int, default=1, help="Number of questions to keep in flight at once, values above 1 use the asyncio query engine")
+    parser.add_argument("--provider_limits", type=str, default="", help="Per provider concurrency caps, e.g. 'openai=8,perplexity=4,gemini=4'")
+    parser.add_argument("--batch", action="store_true", help="Submit all questions through the OpenAI Batch API instead of one request per question")
+    parser.add_argument("--batch_dir", type=str, default="model_output/batches", help="Where the batch input JSONL files are written")
+    parser.add_argument("--batch_id", type=str, default=None, help="Resume polling an already submitted batch instead of submitting a new one")
+    parser.add_argument("--poll_interval", type=float, default=60, help="Seconds between batch status checks")
+    parser.add_argument("--base_url", type=str, default=None, help="Alternative OpenAI compatible endpoint, e.g. the local fake server in scripts/benchmarks")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Do not read or write the on-disk response cache")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached responses and re-query the model, the new responses replace the cached ones")
+    parser.add_argument("--semantic_cache", type=str, default="off", choices=["off", *MODES], help="Look up near duplicate questions answered before: 'serve' returns their answer, 'flag' queries anyway and records the match")
+    parser.add_argument("--semantic_threshold", type=float, default=DEFAULT_SIMILARITY_THRESHOLD, help="Cosine similarity from which a previous question counts as a near duplicate")
+    parser.add_argument("--embedder", type=str, default="hashing", choices=list(EMBEDDERS), help="How questions are embedded: 'hashing' runs locally, 'openai' calls the embeddings endpoint")
+    parser.add_argument("--run_id", type=str, default=None, help="Append to an existing run in model_output/runs instead of starting a new one")
+    parser.add_argument("--manifest", type=str, default="model_output/run_manifest.sqlite", help="Checkpoint manifest, questions marked done there are skipped when the sweep is restarted")
+    parser.add_argument("--fresh", action="store_true", help="Forget the manifest state of this sweep and query every question again")
+    parser.add_argument("--metrics_textfile", type=str, default=None, help="Also write the run metrics to this Prometheus textfile, e.g. for the node_exporter textfile collector")
     args = parser.parse_args()
 
-    main(args)   
+    try:
+        args.models = parse_model_list(args.model, MODEL_CHOICES)
+        args.country = get_country_catalog().resolve(args.country)
+        # A workbook is imported into a CSV next to it first, a no-op while the workbook is unchanged
+        if args.infile.endswith(".xlsx"):
+            csv_path = os.path.splitext(args.infile)[0] + ".csv"
+            ingest_workbook(args.infile, csv_path)
+            args.infile = csv_path
+        # The sidecar index of the question file is built on the first run over it
+        question_index = load_question_index(args.infile)
+        args.question_numbers = question_index.select(parse_question_numbers(args.question_num), args.question_type)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.batch and (len(args.models) > 1 or "gpt" not in args.models[0]):
+        parser.error("--batch supports a single OpenAI model")
+
+    # All output of the run goes to one result store, the .txt files are rendered from it once the run ends
+    try:
+        result_store = ResultStore(run_id=args.run_id)
+    except ValueError as e:
+        parser.error(str(e))
+    manifest = RunManifest(args.manifest)
+    try:
+        main(args, result_store, manifest, question_index)
+    finally:
+        manifest.close()
+        result_store.close()
+        render_text_views(result_store)
+        export_run_metrics(result_store.run_dir, args.metrics_textfile)
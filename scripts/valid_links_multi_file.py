@@ -1,9 +1,15 @@
+import os
 import json
-import requests
 import argparse
 import logging
 import sys
 
+from propeterra_internship_2025.utils.link_validation import LinkValidator, DEFAULT_MAX_WORKERS, DEFAULT_PER_HOST, DEFAULT_HOST_DELAY_SECONDS, DEFAULT_TIMEOUT_SECONDS
+from propeterra_internship_2025.utils.link_sessions import LinkSessions, DEFAULT_DNS_TTL_SECONDS
+from propeterra_internship_2025.utils.link_store import LinkStore, DEFAULT_LINK_STORE_PATH
+
+# The script is run from inside model_output/<country>, the store is shared by every country
+REPO_LINK_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), DEFAULT_LINK_STORE_PATH)
 
 
 def setup_logger(country):
@@ -50,61 +56,9 @@ def extract_first_json_object(text):
 
     return None  # No valid JSON block found
 
-def check_link(link: str) -> tuple[bool| None, int]:
-    """
-    Check if a link returns 404 or any other fail type.
-    returns: Bool
-        True if link is broken and matches any of the failure codes
-        False if link is valid
-        None if link could not be checked
+def read_returned_json(filename):
     """
-    fail_types = [204, 400, 401, 404, 405, 408, 410, 429, 502, 503, 504]
-    try:
-        response = requests.head(link, timeout=5)
-        # print(response.status_code)
-        if response.status_code in fail_types:
-            return True, response.status_code
-        else:
-            return False, response.status_code
-    # except requests.RequestException as e:
-    except requests.RequestException:
-        # print(f"Error checking link {link}: {e}")
-        return None, -1
-
-def scrapeable_link(link:str) -> tuple[bool | None, int]:
-    """
-    Checks web pages robots.txt for indicators that it does not want to be scraped.
-    If 'Disallow: / ' is found, it returns False (Not scrape-able).
-
-    returns: Bool
-        True is can be scraped
-        False if it cannot be scraped
-        None if robots.txt could not be checked
-    """
-
-    root_link = link.split('/')[0] + '//' + link.split('/')[2] + '/robots.txt'
-    print(f"Checking robots.txt for {root_link}")
-
-    disallow_strings = ["Disallow: / ", "Disallow:/ "]
-
-    try:
-        response = requests.get(root_link)
-        # print(response.text)
-        if response.text in disallow_strings:
-            # print(f"Robots.txt disallows scraping for {root_link}")
-            return False, -100
-        else:
-            # print(f"Robots.txt allows scraping for {root_link}")
-            return True, 200
-        
-    except requests.RequestException as e:
-        print(f"Error checking link {root_link}: {e}")
-        return None, -1
-    
-
-def process_file(filename, logger, valid_link_tracker):
-    """
-    Process a single file and return valid entries + notes.
+    The JSON block the model returned in a file, None if there is none
     """
     with open(filename, 'r', encoding="utf8") as f:
         text = f.read()
@@ -112,19 +66,39 @@ def process_file(filename, logger, valid_link_tracker):
         text = text[text.find("AI Returned Links:"):]
 
     json_block = extract_first_json_object(text)
-
     if not json_block:
-        logger.warning(f"[WARN] No JSON block found in '{filename}'")
-        return [], [], {}
+        return None
+    return json.loads(json_block)
+
 
+def file_links(filename):
+    """
+    Every link of a file, without logging, so the links of all files can be checked together.
+    """
+    try:
+        data = read_returned_json(filename)
+    except json.JSONDecodeError:
+        return []
+    if not data:
+        return []
+    return [item.get('link') for item in data.get("data_sources", []) if item.get('link')]
 
+
+def process_file(filename, logger, valid_link_tracker, validator, non_scrapable_tracker=None):
+    """
+    Process a single file and return valid entries + notes.
+    """
     try:
-        data = json.loads(json_block)
+        data = read_returned_json(filename)
         # print(data)
     except json.JSONDecodeError as e:
         logger.error(f"[ERR] JSON decode error in '{filename}': {e}")
         return [], [], {}
 
+    if not data:
+        logger.warning(f"[WARN] No JSON block found in '{filename}'")
+        return [], [], {}
+
     data_sources = data.get("data_sources", [])
     notes = data.get('notes', {})
 
@@ -136,11 +110,17 @@ def process_file(filename, logger, valid_link_tracker):
 
     non_scrapable_links = []
 
+    # Checked concurrently, logged in the order of the file
+    links = [item.get('link') for item in data_sources if item.get('link')]
+    statuses = iter(validator.check_many(links))
+    # robots.txt is only consulted when asked for, one download per site
+    scrapeable = iter(validator.scrapeable_many(links) if non_scrapable_tracker is not None else [True] * len(links))
 
     for idx, item in enumerate(data_sources, 1):
         link = item.get('link')
         if link:
-            is_404, code = check_link(link)
+            is_404, code = next(statuses)
+            allowed = next(scrapeable)
             if is_404 is True:
                 logger.error(f"[{code}] #{idx}: {link}")
                 invalid_entries.append(item)
@@ -152,12 +132,18 @@ def process_file(filename, logger, valid_link_tracker):
                 else:
                     valid_link_tracker.append(link)
                     valid_entries.append(item)
+                    if not allowed:
+                        logger.warning(f"[ROBOTS] #{idx}: {link} is disallowed by robots.txt")
+                        non_scrapable_links.append(item)
             else:
                 logger.error(f"[ERR] #{idx}: {link} could not be checked.")
                 invalid_entries.append(item)
         else:
             logger.warning(f"[WARN] #{idx}: No 'link' field found.")
 
+    if non_scrapable_tracker is not None:
+        non_scrapable_tracker.extend(non_scrapable_links)
+
     logger.info(f"✅ Valid entries in '{filename}': {len(valid_entries)}/{len(data_sources)}")
     return valid_entries, invalid_entries, notes
 
@@ -170,10 +156,20 @@ def main(args):
     all_valid_entries = []
     all_invalid_entries = []
     valid_link_tracker = []
+    non_scrapable_links = [] if args.robots else None
     notes = {}
 
+    sessions = LinkSessions(pool_size=args.pool_size or args.per_host, http2=args.http2, dns_ttl=args.dns_ttl)
+    store = None if args.no_cache else LinkStore(args.link_store)
+    validator = LinkValidator(max_workers=args.workers, per_host=args.per_host, host_delay=args.host_delay, timeout=args.timeout,
+                              sessions=sessions, store=store)
+    # The links of every file are checked in one batch, so a slow host in one file does not hold up the others
+    validator.check_many(link for file in input_files for link in file_links(file))
+    if args.robots:
+        validator.scrapeable_many(link for file in input_files for link in file_links(file))
+
     for file in input_files:
-        valid_entries, invalid_entries, file_notes = process_file(file, logger, valid_link_tracker)
+        valid_entries, invalid_entries, file_notes = process_file(file, logger, valid_link_tracker, validator, non_scrapable_links)
         all_valid_entries.extend(valid_entries)
         all_invalid_entries.extend(invalid_entries)
 
@@ -181,6 +177,8 @@ def main(args):
         if not notes and file_notes:
             notes = file_notes
 
+    validator.close()
+
     logger.info(f"\n🎉 Total valid entries: {len(all_valid_entries)}/{len(all_valid_entries+all_invalid_entries)}")
 
     output = {
@@ -198,6 +196,9 @@ def main(args):
     with open(f'{args.country}_invalid_links.json', 'w') as out_file:
         json.dump(dead_links, out_file, indent=2, ensure_ascii=False)
 
+    if non_scrapable_links is not None:
+        with open(f'{args.country}_non_scrapable_links.json', 'w') as out_file:
+            json.dump({"data_sources": non_scrapable_links}, out_file, indent=2, ensure_ascii=False)
 
     logger.info(f"\n✅ Saved combined valid links to '{args.country}_links.json'.")
 
@@ -205,5 +206,19 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", dest="country", type=str)
     parser.add_argument(dest="input", nargs="+")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="Links checked at the same time")
+    parser.add_argument("--per_host", type=int, default=DEFAULT_PER_HOST, help="Links of one host checked at the same time")
+    parser.add_argument("--host_delay", type=float, default=DEFAULT_HOST_DELAY_SECONDS, help="Seconds between two requests to the same host")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_SECONDS, help="Seconds to wait for a link to answer")
+    parser.add_argument("--pool_size", type=int, default=None, help="Keep-alive connections kept per host, defaults to --per_host")
+    parser.add_argument("--http2", action="store_true", help="Multiplex the requests to a host over HTTP/2 where the server supports it (needs httpx[http2])")
+    parser.add_argument("--link_store", type=str, default=REPO_LINK_STORE_PATH, help="SQLite file with the results of earlier checks")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Check every link again, without reading or writing the link store")
+    parser.add_argument("--robots", action="store_true", help="Also check robots.txt and list the valid links it disallows in <country>_non_scrapable_links.json")
+    parser.add_argument("--dns_ttl", type=float, default=DEFAULT_DNS_TTL_SECONDS, help="Seconds a DNS lookup is reused, 0 disables the DNS cache")
     args = parser.parse_args()
-    main(args)
\ No newline at end of file
+
+    try:
+        main(args)
+    except ValueError as e:
+        parser.error(str(e))
\ No newline at end of file
@@ -26,7 +26,7 @@ regions = {
     ],
     "Africa": [
         "Algeria", "Angola", "Benin", "Botswana", "Burkina Faso", "Burundi", "Cabo Verde", "Cameroon",
-        "Central African Republic", "Chad", "Comoros", "Côte d'Ivoire", "Democratic Republic of the Congo",
+        "Central African Republic", "Chad", "Comoros", "Congo (Congo-Brazzaville)", "Côte d'Ivoire", "Democratic Republic of the Congo",
         "Djibouti", "Egypt", "Equatorial Guinea", "Eritrea", "Eswatini (fmr. Swaziland)", "Ethiopia", "Gabon",
         "Gambia", "Ghana", "Guinea", "Guinea-Bissau", "Kenya", "Lesotho", "Liberia", "Libya", "Madagascar", "Malawi",
         "Mali", "Mauritania", "Mauritius", "Morocco", "Mozambique", "Namibia", "Niger", "Nigeria", "Rwanda",
@@ -242,6 +242,13 @@ all_countries=[
 "United Arab Emirates",
 "United States of America",
 "Venezuela",
+"United Kingdom",
+"Uzbekistan",
+"Vanuatu",
+"Vietnam",
+"Yemen",
+"Zambia",
+"Zimbabwe",
 ]
 
 country_capitals = {
@@ -430,5 +437,254 @@ country_capitals = {
     "Uganda": "Kampala",
     "Ukraine": "Kyiv",
     "United Arab Emirates": "Abu Dhabi",
-    "United States of America": "Washington, D.C."
+    "United States of America": "Washington, D.C.",
+    "Uruguay": "Montevideo",
+    "Venezuela": "Caracas",
+    "United Kingdom": "London",
+    "Uzbekistan": "Tashkent",
+    "Vanuatu": "Port Vila",
+    "Vietnam": "Hanoi",
+    "Yemen": "Sana'a",
+    "Zambia": "Lusaka",
+    "Zimbabwe": "Harare"
+}
+
+# ISO 3166-1 alpha-2 and alpha-3 codes
+country_iso_codes = {
+    "Afghanistan": ("AF", "AFG"),
+    "Albania": ("AL", "ALB"),
+    "Algeria": ("DZ", "DZA"),
+    "Andorra": ("AD", "AND"),
+    "Angola": ("AO", "AGO"),
+    "Antigua and Barbuda": ("AG", "ATG"),
+    "Argentina": ("AR", "ARG"),
+    "Armenia": ("AM", "ARM"),
+    "Australia": ("AU", "AUS"),
+    "Austria": ("AT", "AUT"),
+    "Azerbaijan": ("AZ", "AZE"),
+    "Bahamas": ("BS", "BHS"),
+    "Bahrain": ("BH", "BHR"),
+    "Bangladesh": ("BD", "BGD"),
+    "Barbados": ("BB", "BRB"),
+    "Belarus": ("BY", "BLR"),
+    "Belgium": ("BE", "BEL"),
+    "Belize": ("BZ", "BLZ"),
+    "Benin": ("BJ", "BEN"),
+    "Bhutan": ("BT", "BTN"),
+    "Bolivia": ("BO", "BOL"),
+    "Bosnia and Herzegovina": ("BA", "BIH"),
+    "Botswana": ("BW", "BWA"),
+    "Brazil": ("BR", "BRA"),
+    "Brunei": ("BN", "BRN"),
+    "Bulgaria": ("BG", "BGR"),
+    "Burkina Faso": ("BF", "BFA"),
+    "Burundi": ("BI", "BDI"),
+    "Cabo Verde": ("CV", "CPV"),
+    "Cambodia": ("KH", "KHM"),
+    "Cameroon": ("CM", "CMR"),
+    "Canada": ("CA", "CAN"),
+    "Central African Republic": ("CF", "CAF"),
+    "Chad": ("TD", "TCD"),
+    "Chile": ("CL", "CHL"),
+    "China": ("CN", "CHN"),
+    "Colombia": ("CO", "COL"),
+    "Comoros": ("KM", "COM"),
+    "Congo (Congo-Brazzaville)": ("CG", "COG"),
+    "Costa Rica": ("CR", "CRI"),
+    "Côte d'Ivoire": ("CI", "CIV"),
+    "Croatia": ("HR", "HRV"),
+    "Cuba": ("CU", "CUB"),
+    "Cyprus": ("CY", "CYP"),
+    "Czechia (Czech Republic)": ("CZ", "CZE"),
+    "Democratic Republic of the Congo": ("CD", "COD"),
+    "Denmark": ("DK", "DNK"),
+    "Djibouti": ("DJ", "DJI"),
+    "Dominica": ("DM", "DMA"),
+    "Dominican Republic": ("DO", "DOM"),
+    "Ecuador": ("EC", "ECU"),
+    "Egypt": ("EG", "EGY"),
+    "El Salvador": ("SV", "SLV"),
+    "Equatorial Guinea": ("GQ", "GNQ"),
+    "Eritrea": ("ER", "ERI"),
+    "Estonia": ("EE", "EST"),
+    "Eswatini (fmr. Swaziland)": ("SZ", "SWZ"),
+    "Ethiopia": ("ET", "ETH"),
+    "Fiji": ("FJ", "FJI"),
+    "Finland": ("FI", "FIN"),
+    "France": ("FR", "FRA"),
+    "Gabon": ("GA", "GAB"),
+    "Gambia": ("GM", "GMB"),
+    "Georgia": ("GE", "GEO"),
+    "Germany": ("DE", "DEU"),
+    "Ghana": ("GH", "GHA"),
+    "Greece": ("GR", "GRC"),
+    "Grenada": ("GD", "GRD"),
+    "Guatemala": ("GT", "GTM"),
+    "Guinea": ("GN", "GIN"),
+    "Guinea-Bissau": ("GW", "GNB"),
+    "Guyana": ("GY", "GUY"),
+    "Haiti": ("HT", "HTI"),
+    "Holy See": ("VA", "VAT"),
+    "Honduras": ("HN", "HND"),
+    "Hungary": ("HU", "HUN"),
+    "Iceland": ("IS", "ISL"),
+    "India": ("IN", "IND"),
+    "Indonesia": ("ID", "IDN"),
+    "Iran": ("IR", "IRN"),
+    "Iraq": ("IQ", "IRQ"),
+    "Ireland": ("IE", "IRL"),
+    "Israel": ("IL", "ISR"),
+    "Italy": ("IT", "ITA"),
+    "Jamaica": ("JM", "JAM"),
+    "Japan": ("JP", "JPN"),
+    "Jordan": ("JO", "JOR"),
+    "Kazakhstan": ("KZ", "KAZ"),
+    "Kenya": ("KE", "KEN"),
+    "Kiribati": ("KI", "KIR"),
+    "Kuwait": ("KW", "KWT"),
+    "Kyrgyzstan": ("KG", "KGZ"),
+    "Laos": ("LA", "LAO"),
+    "Latvia": ("LV", "LVA"),
+    "Lebanon": ("LB", "LBN"),
+    "Lesotho": ("LS", "LSO"),
+    "Liberia": ("LR", "LBR"),
+    "Libya": ("LY", "LBY"),
+    "Liechtenstein": ("LI", "LIE"),
+    "Lithuania": ("LT", "LTU"),
+    "Luxembourg": ("LU", "LUX"),
+    "Madagascar": ("MG", "MDG"),
+    "Malawi": ("MW", "MWI"),
+    "Malaysia": ("MY", "MYS"),
+    "Maldives": ("MV", "MDV"),
+    "Mali": ("ML", "MLI"),
+    "Malta": ("MT", "MLT"),
+    "Marshall Islands": ("MH", "MHL"),
+    "Mauritania": ("MR", "MRT"),
+    "Mauritius": ("MU", "MUS"),
+    "Mexico": ("MX", "MEX"),
+    "Micronesia": ("FM", "FSM"),
+    "Moldova": ("MD", "MDA"),
+    "Monaco": ("MC", "MCO"),
+    "Mongolia": ("MN", "MNG"),
+    "Montenegro": ("ME", "MNE"),
+    "Morocco": ("MA", "MAR"),
+    "Mozambique": ("MZ", "MOZ"),
+    "Myanmar (formerly Burma)": ("MM", "MMR"),
+    "Namibia": ("NA", "NAM"),
+    "Nauru": ("NR", "NRU"),
+    "Nepal": ("NP", "NPL"),
+    "Netherlands": ("NL", "NLD"),
+    "New Zealand": ("NZ", "NZL"),
+    "Nicaragua": ("NI", "NIC"),
+    "Niger": ("NE", "NER"),
+    "Nigeria": ("NG", "NGA"),
+    "North Korea": ("KP", "PRK"),
+    "North Macedonia": ("MK", "MKD"),
+    "Norway": ("NO", "NOR"),
+    "Oman": ("OM", "OMN"),
+    "Pakistan": ("PK", "PAK"),
+    "Palau": ("PW", "PLW"),
+    "Palestine State": ("PS", "PSE"),
+    "Panama": ("PA", "PAN"),
+    "Papua New Guinea": ("PG", "PNG"),
+    "Paraguay": ("PY", "PRY"),
+    "Peru": ("PE", "PER"),
+    "Philippines": ("PH", "PHL"),
+    "Poland": ("PL", "POL"),
+    "Portugal": ("PT", "PRT"),
+    "Qatar": ("QA", "QAT"),
+    "Romania": ("RO", "ROU"),
+    "Russia": ("RU", "RUS"),
+    "Rwanda": ("RW", "RWA"),
+    "Saint Kitts and Nevis": ("KN", "KNA"),
+    "Saint Lucia": ("LC", "LCA"),
+    "Saint Vincent and the Grenadines": ("VC", "VCT"),
+    "Samoa": ("WS", "WSM"),
+    "San Marino": ("SM", "SMR"),
+    "Sao Tome and Principe": ("ST", "STP"),
+    "Saudi Arabia": ("SA", "SAU"),
+    "Senegal": ("SN", "SEN"),
+    "Serbia": ("RS", "SRB"),
+    "Seychelles": ("SC", "SYC"),
+    "Sierra Leone": ("SL", "SLE"),
+    "Singapore": ("SG", "SGP"),
+    "Slovakia": ("SK", "SVK"),
+    "Slovenia": ("SI", "SVN"),
+    "Solomon Islands": ("SB", "SLB"),
+    "Somalia": ("SO", "SOM"),
+    "South Africa": ("ZA", "ZAF"),
+    "South Korea": ("KR", "KOR"),
+    "South Sudan": ("SS", "SSD"),
+    "Spain": ("ES", "ESP"),
+    "Sri Lanka": ("LK", "LKA"),
+    "Sudan": ("SD", "SDN"),
+    "Suriname": ("SR", "SUR"),
+    "Sweden": ("SE", "SWE"),
+    "Switzerland": ("CH", "CHE"),
+    "Syria": ("SY", "SYR"),
+    "Tajikistan": ("TJ", "TJK"),
+    "Tanzania": ("TZ", "TZA"),
+    "Thailand": ("TH", "THA"),
+    "Timor-Leste": ("TL", "TLS"),
+    "Togo": ("TG", "TGO"),
+    "Tonga": ("TO", "TON"),
+    "Trinidad and Tobago": ("TT", "TTO"),
+    "Tunisia": ("TN", "TUN"),
+    "Turkey": ("TR", "TUR"),
+    "Turkmenistan": ("TM", "TKM"),
+    "Tuvalu": ("TV", "TUV"),
+    "Uganda": ("UG", "UGA"),
+    "Uruguay": ("UY", "URY"),
+    "Ukraine": ("UA", "UKR"),
+    "United Arab Emirates": ("AE", "ARE"),
+    "United States of America": ("US", "USA"),
+    "Venezuela": ("VE", "VEN"),
+    "United Kingdom": ("GB", "GBR"),
+    "Uzbekistan": ("UZ", "UZB"),
+    "Vanuatu": ("VU", "VUT"),
+    "Vietnam": ("VN", "VNM"),
+    "Yemen": ("YE", "YEM"),
+    "Zambia": ("ZM", "ZMB"),
+    "Zimbabwe": ("ZW", "ZWE")
+}
+
+# Other spellings of the names above, e.g. the ones used by the regions, country_languages or by hand on the command line
+country_aliases = {
+    "Antigua and Barbuda": ["Antigua"],
+    "Bahamas": ["The Bahamas"],
+    "Bolivia": ["Plurinational State of Bolivia"],
+    "Bosnia and Herzegovina": ["Bosnia"],
+    "Brunei": ["Brunei Darussalam"],
+    "Cabo Verde": ["Cape Verde"],
+    "Congo (Congo-Brazzaville)": ["Congo", "Congo (Brazzaville)", "Congo-Brazzaville", "Republic of the Congo"],
+    "Côte d'Ivoire": ["Ivory Coast"],
+    "Czechia (Czech Republic)": ["Czechia", "Czech Republic"],
+    "Democratic Republic of the Congo": ["DR Congo", "DRC", "Congo-Kinshasa"],
+    "Eswatini (fmr. Swaziland)": ["Eswatini", "Swaziland"],
+    "Gambia": ["The Gambia"],
+    "Holy See": ["Vatican City", "Vatican"],
+    "Iran": ["Islamic Republic of Iran"],
+    "Laos": ["Lao People's Democratic Republic", "Lao PDR"],
+    "Micronesia": ["Federated States of Micronesia"],
+    "Moldova": ["Republic of Moldova"],
+    "Myanmar (formerly Burma)": ["Myanmar", "Burma"],
+    "Netherlands": ["The Netherlands", "Holland"],
+    "North Korea": ["Democratic People's Republic of Korea", "DPRK"],
+    "North Macedonia": ["Macedonia"],
+    "Palestine State": ["Palestine", "State of Palestine"],
+    "Russia": ["Russian Federation"],
+    "Saint Kitts and Nevis": ["St Kitts and Nevis"],
+    "Saint Lucia": ["St Lucia"],
+    "Saint Vincent and the Grenadines": ["St Vincent and the Grenadines"],
+    "South Korea": ["Republic of Korea", "Korea"],
+    "Syria": ["Syrian Arab Republic"],
+    "Tanzania": ["United Republic of Tanzania"],
+    "Timor-Leste": ["East Timor"],
+    "Trinidad and Tobago": ["Trinidad"],
+    "Turkey": ["Türkiye"],
+    "United Arab Emirates": ["UAE", "Emirates"],
+    "United Kingdom": ["UK", "Great Britain", "Britain"],
+    "United States of America": ["United States", "America"],
+    "Venezuela": ["Bolivarian Republic of Venezuela"],
+    "Vietnam": ["Viet Nam"]
 }
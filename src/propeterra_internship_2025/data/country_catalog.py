@@ -0,0 +1,234 @@
+'''
+One read only catalog of every country: name, aliases, ISO codes, capital, native language and
+the regions it belongs to.
+
+all_countries, regions, country_capitals and country_languages spell some countries differently
+("Czechia" vs "Czechia (Czech Republic)", "Vatican City" vs "Holy See"), so every lookup goes
+through a normalized key (casefolded, accents and punctuation dropped) that the canonical name,
+each alias and both ISO codes map to. The catalog is built from those source modules once and
+stored as compact JSON next to this file together with a hash of the sources, later runs load the
+JSON and only rebuild when a source file changed.
+
+    python -m propeterra_internship_2025.data.country_catalog    # rebuild country_catalog.json
+'''
+import os
+import json
+import logging
+import hashlib
+import unicodedata
+import importlib.util
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Iterator
+
+
+CATALOG_VERSION = 1
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "country_catalog.json")
+
+# The modules the catalog is built from, a change to any of them rebuilds it
+SOURCE_MODULES = ("propeterra_internship_2025.data.all_countries", "propeterra_internship_2025.data.reference_material")
+
+# How close a misspelled name has to be to be suggested, see difflib.get_close_matches
+SUGGESTION_CUTOFF = 0.6
+
+
+def normalize_name(name:str) -> str:
+    ''' Lookup key of a name: "Côte d'Ivoire", "cote d ivoire" and "COTE D'IVOIRE" all give "cote d ivoire" '''
+    decomposed = unicodedata.normalize("NFKD", name)
+    letters = "".join(char if char.isalnum() else " " for char in decomposed if not unicodedata.combining(char))
+    return " ".join(letters.casefold().split())
+
+
+class Country():
+    ''' One entry of the catalog, read only '''
+    __slots__ = ("name", "iso2", "iso3", "capital", "language", "aliases", "regions")
+
+    def __init__(self, name:str, iso2:str, iso3:str, capital:str | None, language:str | None,
+                 aliases:tuple[str, ...] = (), regions:tuple[str, ...] = ()):
+        for field, value in zip(self.__slots__, (name, iso2, iso3, capital, language, tuple(aliases), tuple(regions))):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Country is read only, cannot set {name}")
+
+    def __reduce__(self):
+        return (Country, tuple(getattr(self, field) for field in self.__slots__))
+
+    def __repr__(self) -> str:
+        return f"Country({self.name!r}, {self.iso2!r}, {self.iso3!r})"
+
+
+class CountryCatalog():
+    '''
+    Every country indexed by name, alias and ISO code, plus the regions. All lookups are dict
+    lookups, only the suggestions for an unknown name scan the keys.
+    '''
+    __slots__ = ("countries", "regions", "_keys")
+
+    def __init__(self, countries:list[Country], keys:dict[str, str], regions:dict[str, tuple[str, ...]]):
+        # keys maps every normalized name, alias and ISO code to the canonical name
+        object.__setattr__(self, "countries", MappingProxyType({country.name: country for country in countries}))
+        object.__setattr__(self, "regions", MappingProxyType(regions))
+        object.__setattr__(self, "_keys", MappingProxyType(keys))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"CountryCatalog is read only, cannot set {name}")
+
+    @classmethod
+    def from_data(cls, data:dict) -> "CountryCatalog":
+        ''' The catalog from its compact form, see build_catalog_data '''
+        region_members: dict[str, list[str]] = {}
+        for region, members in data["regions"].items():
+            for member in members:
+                region_members.setdefault(member, []).append(region)
+        countries = [Country(*row, regions=region_members.get(row[0], ())) for row in data["countries"]]
+        return cls(countries, data["keys"], {region: tuple(members) for region, members in data["regions"].items()})
+
+    def __len__(self) -> int:
+        return len(self.countries)
+
+    def __iter__(self) -> Iterator[Country]:
+        return iter(self.countries.values())
+
+    def __contains__(self, name:str) -> bool:
+        return self.get(name) is not None
+
+    def __getitem__(self, name:str) -> Country:
+        country = self.get(name)
+        if country is None:
+            raise KeyError(self.unknown_message(name))
+        return country
+
+    def get(self, name:str) -> Country | None:
+        ''' The country for a canonical name, alias or ISO code in any case, None if there is none '''
+        country = self.countries.get(name)
+        if country is not None:
+            return country
+        canonical = self._keys.get(normalize_name(name))
+        return self.countries[canonical] if canonical is not None else None
+
+    def resolve(self, name:str) -> str:
+        ''' The canonical name, which output folders and files are named after, raises ValueError with suggestions '''
+        country = self.get(name)
+        if country is None:
+            raise ValueError(self.unknown_message(name))
+        return country.name
+
+    def suggest(self, name:str, n:int = 3) -> list[str]:
+        ''' Canonical names of the countries closest to a misspelled name '''
+        from difflib import get_close_matches
+
+        matches = get_close_matches(normalize_name(name), list(self._keys), n=4*n, cutoff=SUGGESTION_CUTOFF)
+        return list(dict.fromkeys(self._keys[match] for match in matches))[:n]
+
+    def unknown_message(self, name:str) -> str:
+        suggestions = self.suggest(name)
+        hint = f", did you mean {' or '.join(suggestions)}?" if suggestions else ", see all_countries for the list"
+        return f"Could not find {name} in the list of countries{hint}"
+
+    def region(self, region:str) -> tuple[str, ...]:
+        ''' Canonical names of the countries of a region, raises ValueError for an unknown region '''
+        if region not in self.regions:
+            raise ValueError(f"Could not find {region} in list of regions, choose from {', '.join(self.regions)}")
+        return self.regions[region]
+
+    def regions_of(self, name:str) -> tuple[str, ...]:
+        return self[name].regions
+
+    def capital(self, name:str) -> str | None:
+        country = self.get(name)
+        return country.capital if country is not None else None
+
+    def language(self, name:str) -> str | None:
+        country = self.get(name)
+        return country.language if country is not None else None
+
+
+def source_hash() -> str:
+    ''' Hash of the source modules and the catalog version, without importing the sources '''
+    digest = hashlib.sha256(str(CATALOG_VERSION).encode())
+    for module in SOURCE_MODULES:
+        with open(importlib.util.find_spec(module).origin, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def build_catalog_data(hash_of_sources:str | None = None) -> dict:
+    '''
+    The compact, JSON ready form of the catalog built from the source modules: one row per country,
+    the canonical members of every region and the lookup key of every spelling. Spellings that
+    do not match a country, or match two, raise ValueError.
+    '''
+    from propeterra_internship_2025.data.all_countries import all_countries, regions, country_capitals, country_iso_codes, country_aliases
+    from propeterra_internship_2025.data.reference_material import country_languages
+
+    keys: dict[str, str] = {}
+
+    def add_key(spelling:str, name:str) -> None:
+        key = normalize_name(spelling)
+        if keys.setdefault(key, name) != name:
+            raise ValueError(f"{spelling} is used for both {keys[key]} and {name}")
+
+    for name in all_countries:
+        add_key(name, name)
+        for spelling in (*country_aliases.get(name, ()), *country_iso_codes[name]):
+            add_key(spelling, name)
+
+    def canonical(spelling:str, source:str) -> str:
+        name = keys.get(normalize_name(spelling))
+        if name is None:
+            raise ValueError(f"{spelling} in {source} does not match any country, add it to country_aliases")
+        return name
+
+    capitals = {canonical(name, "country_capitals"): capital for name, capital in country_capitals.items()}
+    languages = {canonical(name, "country_languages"): language for name, language in country_languages.items()}
+    canonical_regions = {region: list(dict.fromkeys(canonical(member, f"regions[{region!r}]") for member in members))
+                         for region, members in regions.items()}
+
+    rows = []
+    for name in all_countries:
+        if name not in capitals or name not in languages:
+            logging.warning(f"No capital or native language for {name} in the country catalog")
+        rows.append([name, *country_iso_codes[name], capitals.get(name), languages.get(name), list(country_aliases.get(name, ()))])
+
+    return {"version": CATALOG_VERSION,
+            "source_hash": hash_of_sources or source_hash(),
+            "countries": rows,
+            "regions": canonical_regions,
+            "keys": keys}
+
+
+def write_catalog(data:dict, path:str = CATALOG_PATH) -> None:
+    ''' Writes the compact form atomically, so a concurrent run never reads half a file '''
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf8") as file:
+        json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=None)
+def get_country_catalog() -> CountryCatalog:
+    ''' The catalog, from country_catalog.json when it matches the sources, otherwise rebuilt and saved '''
+    hash_of_sources = source_hash()
+    try:
+        with open(CATALOG_PATH, encoding="utf8") as file:
+            data = json.load(file)
+        if data.get("source_hash") == hash_of_sources:
+            return CountryCatalog.from_data(data)
+        logging.info("Country data changed, rebuilding the country catalog")
+    except (OSError, ValueError):
+        logging.info("No country catalog found, building it")
+
+    data = build_catalog_data(hash_of_sources)
+    try:
+        write_catalog(data)
+    except OSError as e:
+        logging.warning(f"Could not save the country catalog to {CATALOG_PATH}: {e}")
+    return CountryCatalog.from_data(data)
+
+
+if __name__ == "__main__":
+
+    write_catalog(build_catalog_data())
+    catalog = get_country_catalog()
+    print(f"Wrote {len(catalog)} countries in {len(catalog.regions)} regions to {CATALOG_PATH}")
@@ -599,6 +599,15 @@ country_languages = {
     "Ukraine": "Ukrainian",
     "United Arab Emirates": "Arabic",
     "United States of America": "English",
+    "Uruguay": "Spanish",
+    "Venezuela": "Spanish",
+    "United Kingdom": "English",
+    "Uzbekistan": "Uzbek",
+    "Vanuatu": "Bislama",
+    "Vietnam": "Vietnamese",
+    "Yemen": "Arabic",
+    "Zambia": "English",
+    "Zimbabwe": "English",
 }
 
 
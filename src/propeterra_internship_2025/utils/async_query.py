@@ -0,0 +1,124 @@
+''' Concurrent execution of many QueryModel requests with per-provider concurrency caps '''
+import time
+import asyncio
+import logging
+from typing import Callable, Iterable
+
+from propeterra_internship_2025.utils.model_query import QueryModel, provider_for_model
+
+
+logger = logging.getLogger(__name__)
+
+# How many requests each provider is allowed to have in flight at once
+DEFAULT_PROVIDER_LIMITS = {"openai": 8,
+                           "perplexity": 4,
+                           "gemini": 4}
+
+
+def parse_provider_limits(spec:str) -> dict[str, int]:
+    ''' Parses a "openai=8,perplexity=4" style command line option into a limits dictionary '''
+    limits = dict(DEFAULT_PROVIDER_LIMITS)
+    if not spec:
+        return limits
+
+    for entry in spec.split(","):
+        provider, _, value = entry.partition("=")
+        if not value:
+            raise ValueError(f"Provider limit '{entry}' must look like provider=number")
+        limits[provider.strip()] = int(value)
+
+    return limits
+
+
+def parse_model_list(spec:str, choices:Iterable[str]) -> list[str]:
+    ''' Parses a "gpt-4.1,sonar-pro,gemini-2.5-pro" style command line option, every model must be one of choices '''
+    choices = list(choices)
+    models = list(dict.fromkeys(model.strip() for model in spec.split(",") if model.strip()))
+    unknown = [model for model in models if model not in choices]
+    if not models or unknown:
+        raise ValueError(f"Unknown model(s) {', '.join(unknown) or repr(spec)}, choose from {', '.join(choices)}")
+    return models
+
+
+class AsyncQueryRunner():
+    '''
+    Runs a list of QueryModel objects with at most `concurrency` requests in flight overall
+    and at most provider_limits[provider] in flight per provider. Results are handed to
+    `on_result` in submission order, as soon as every earlier query has finished. With a `claim`
+    callback a query is only sent if claim(query) returns True once it has its slots, e.g. to take
+    it in the run manifest right before it is submitted; a query that was not claimed gives None.
+    '''
+
+    def __init__(self, concurrency:int = 8, provider_limits:dict[str, int] | None = None, real_estate_questions:bool = False):
+        self.concurrency = concurrency
+        self.provider_limits = provider_limits if provider_limits is not None else dict(DEFAULT_PROVIDER_LIMITS)
+        self.real_estate_questions = real_estate_questions
+
+    async def _run_one(self, idx:int, query:QueryModel, global_slots:asyncio.Semaphore, provider_slots:dict[str, asyncio.Semaphore],
+                       claim:Callable[[QueryModel], bool] | None = None) -> tuple[int, str | BaseException | None]:
+        ''' Waits for a free global and provider slot, then submits the query '''
+        provider = provider_for_model(query.model)
+        provider_slot = provider_slots.setdefault(provider, asyncio.Semaphore(self.provider_limits.get(provider, self.concurrency)))
+
+        queued_at = time.perf_counter()
+        async with provider_slot:
+            async with global_slots:
+                query.queue_wait_seconds = time.perf_counter() - queued_at
+                if claim is not None and not claim(query):
+                    return idx, None
+                try:
+                    message_text = await query.aquery_model_langchain(self.real_estate_questions, write=False)
+                except Exception as e:
+                    query.end_timing()
+                    query.record_metrics(query.response_meta, "error")
+                    return idx, e
+        return idx, message_text
+
+    async def run(self, queries:Iterable[QueryModel], on_result:Callable[[QueryModel, str], None],
+                  claim:Callable[[QueryModel], bool] | None = None) -> list[str | BaseException | None]:
+        ''' Submits every query and writes the results back in order as they complete '''
+        queries = list(queries)
+        global_slots = asyncio.Semaphore(self.concurrency)
+        provider_slots: dict[str, asyncio.Semaphore] = {}
+
+        tasks = [asyncio.create_task(self._run_one(idx, query, global_slots, provider_slots, claim)) for idx, query in enumerate(queries)]
+
+        results: list[str | BaseException | None] = [None] * len(queries)
+        finished = [False] * len(queries)
+        next_to_write = 0
+
+        for task in asyncio.as_completed(tasks):
+            idx, result = await task
+            results[idx] = result
+            finished[idx] = True
+
+            # Flush the contiguous run of finished queries so output order matches the input order
+            while next_to_write < len(queries) and finished[next_to_write]:
+                query = queries[next_to_write]
+                outcome = results[next_to_write]
+                if isinstance(outcome, BaseException):
+                    logger.error(f"[{query.prompt_number}] {query.model} failed: {outcome}")
+                elif outcome is not None:
+                    on_result(query, outcome)
+                next_to_write += 1
+
+        return results
+
+
+def run_queries_concurrently(queries:Iterable[QueryModel], on_result:Callable[[QueryModel, str], None], concurrency:int = 8,
+                             provider_limits:dict[str, int] | None = None, real_estate_questions:bool = False,
+                             claim:Callable[[QueryModel], bool] | None = None) -> list[str | BaseException | None]:
+    ''' Blocking entry point for scripts, runs the AsyncQueryRunner on a fresh event loop '''
+    runner = AsyncQueryRunner(concurrency=concurrency, provider_limits=provider_limits, real_estate_questions=real_estate_questions)
+    return asyncio.run(runner.run(queries, on_result, claim))
+
+
+def fan_out(queries:Iterable[QueryModel], on_result:Callable[[QueryModel, str], None], provider_limits:dict[str, int] | None = None,
+            real_estate_questions:bool = False) -> list[str | BaseException]:
+    '''
+    Submits one rendered prompt to several models at the same time, so the wall time is that of
+    the slowest model rather than the sum. Results are written in the order the models were given.
+    '''
+    queries = list(queries)
+    return run_queries_concurrently(queries, on_result, concurrency=max(1, len(queries)),
+                                    provider_limits=provider_limits, real_estate_questions=real_estate_questions)
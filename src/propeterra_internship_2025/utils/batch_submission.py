@@ -0,0 +1,168 @@
+'''
+Offline submission of many questions through the OpenAI Batch API.
+
+Every rendered question becomes one line of a batch JSONL file, the file is uploaded and a
+batch is created, and once the batch is finished its output file is split back into the
+per-question QueryModel objects so the results land in the usual output files.
+The client is passed in, so any object with the OpenAI SDK files/batches interface
+(e.g. an OpenAI client pointed at scripts/benchmarks/fake_openai_server.py) can be used.
+'''
+import os
+import json
+import time
+import logging
+from typing import Callable, Iterable
+
+from propeterra_internship_2025.utils.model_query import QueryModel, provider_for_model
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def make_custom_id(query:QueryModel) -> str:
+    ''' Unique id of a question inside a batch, it is all we get back to match results to questions '''
+    return f"{query.country}|{query.model}|{query.system_prompt_number}|{query.prompt_number}"
+
+
+def build_batch_request(query:QueryModel) -> dict:
+    ''' One line of the batch input file, in OpenAI Batch API format '''
+    if provider_for_model(query.model) != "openai":
+        raise TypeError(f"Batch submission is only supported for OpenAI models, not {query.model}")
+
+    return {"custom_id": make_custom_id(query),
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {"model": query.model,
+                     "temperature": 0,
+                     "prompt_cache_key": query.prompt_cache_key(),
+                     "messages": [{"role": "system", "content": query.system_prompt},
+                                  {"role": "user", "content": query.user_prompt}]}}
+
+
+def write_batch_file(queries:Iterable[QueryModel], path:str) -> dict[str, QueryModel]:
+    ''' Writes the batch input JSONL and returns the custom_id -> query mapping, in question order '''
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    queries_by_id = {}
+    with open(path, "w", encoding="utf8") as file:
+        for query in queries:
+            request = build_batch_request(query)
+            if request["custom_id"] in queries_by_id:
+                raise ValueError(f"Duplicate question in batch: {request['custom_id']}")
+            queries_by_id[request["custom_id"]] = query
+            file.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    logger.info(f"Wrote {len(queries_by_id)} requests to {path}")
+    return queries_by_id
+
+
+def submit_batch(client, path:str, completion_window:str = "24h", metadata:dict | None = None) -> str:
+    ''' Uploads the batch input file and creates the batch, returns the batch id '''
+    with open(path, "rb") as file:
+        input_file = client.files.create(file=file, purpose="batch")
+
+    batch = client.batches.create(input_file_id=input_file.id,
+                                  endpoint=BATCH_ENDPOINT,
+                                  completion_window=completion_window,
+                                  metadata=metadata)
+    logger.info(f"Submitted batch {batch.id} from {path}")
+    return batch.id
+
+
+def poll_batch(client, batch_id:str, poll_interval:float = 60, timeout:float | None = None, sleep:Callable[[float], None] = time.sleep):
+    ''' Polls the batch until it reaches a final status and returns the batch object '''
+    start = time.monotonic()
+
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = getattr(batch, "request_counts", None)
+        if counts is not None:
+            logger.info(f"Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+        else:
+            logger.info(f"Batch {batch_id}: {batch.status}")
+
+        if batch.status in FINISHED_STATUSES:
+            return batch
+
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout} seconds")
+
+        sleep(poll_interval)
+
+
+def download_file_text(client, file_id:str | None) -> str:
+    ''' Returns the text of a batch output or error file, or "" if the batch produced none '''
+    if not file_id:
+        return ""
+    return client.files.content(file_id).text
+
+
+def demultiplex_results(output_text:str, queries_by_id:dict[str, QueryModel], on_result:Callable[[QueryModel, str], None]) -> tuple[list[str], list[str]]:
+    '''
+    Splits a batch output file back into per-question results. on_result is called in the
+    order of queries_by_id, not the (arbitrary) order of the output file.
+    Returns the custom ids that were written and the ones that failed or are missing.
+    '''
+    responses = {}
+    failed = []
+
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        custom_id = result.get("custom_id")
+
+        if custom_id not in queries_by_id:
+            logger.warning(f"Batch returned unknown custom_id {custom_id}")
+            continue
+
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            logger.error(f"[{custom_id}] failed in batch: {result.get('error') or response.get('body')}")
+            failed.append(custom_id)
+            continue
+
+        responses[custom_id] = response["body"]["choices"][0]["message"]["content"]
+        usage = response["body"].get("usage")
+        if usage:
+            queries_by_id[custom_id].record_usage(usage["prompt_tokens"], usage["completion_tokens"],
+                                                  (usage.get("prompt_tokens_details") or {}).get("cached_tokens"))
+
+    written = []
+    for custom_id, query in queries_by_id.items():
+        if custom_id in responses:
+            on_result(query, responses[custom_id])
+            written.append(custom_id)
+        elif custom_id not in failed:
+            logger.error(f"[{custom_id}] missing from batch output")
+            failed.append(custom_id)
+
+    return written, failed
+
+
+def run_batch(client, queries:Iterable[QueryModel], batch_path:str, on_result:Callable[[QueryModel, str], None],
+              batch_id:str | None = None, poll_interval:float = 60, timeout:float | None = None) -> tuple[list[str], list[str]]:
+    '''
+    Full batch round trip: write the input file, submit it (unless batch_id of an earlier
+    submission is given), wait for it to finish and fan the results back out through on_result.
+    '''
+    queries_by_id = write_batch_file(queries, batch_path)
+
+    if batch_id is None:
+        batch_id = submit_batch(client, batch_path)
+        with open(batch_path + ".batch_id", "w", encoding="utf8") as file:
+            file.write(batch_id)
+
+    batch = poll_batch(client, batch_id, poll_interval=poll_interval, timeout=timeout)
+    if batch.status != "completed":
+        logger.error(f"Batch {batch_id} ended with status {batch.status}")
+
+    error_text = download_file_text(client, getattr(batch, "error_file_id", None))
+    output_text = download_file_text(client, getattr(batch, "output_file_id", None))
+
+    return demultiplex_results(output_text + "\n" + error_text, queries_by_id, on_result)
@@ -1,31 +1,34 @@
+''' Documentation templates written at the top of every model output file, and the names of those files '''
 
+DEFAULT_USER = "Juan Cardenas"
 
-class DocumentationTemplate():
-    
-data_collection_template = f'''
+
+def render_data_collection_template(record:dict) -> str:
+    ''' Template to paste model results obtained through the web interface into, for link collection prompts '''
+    return f'''
 User and Date:
 ------------------
-user: Juan Cardenas
-date: {date.today()}
+user: {record.get("user", DEFAULT_USER)}
+date: {record["date"]}
 
 Country:
 ------------
-country: {self.country}
+country: {record["country"]}
 
 Data sourced using:
 ----------------------
-method: 
-model: {self.model}
+method: {record.get("method", "")}
+model: {record["model"]}
 
 General Notes:
 -----------------------
 
 Prompt:
 -----------------------
-system_prompt_num: {self.system_prompt_number}
-prompt_num: {self.prompt_number}
+system_prompt_num: {record["system_prompt_number"]}
+prompt_num: {record["prompt_number"]}
 
-{self.system_prompt+'\n\n'+self.user_prompt}
+{record["system_prompt"]}\n\n{record["user_prompt"]}
 
 Human Sourced Links:
 ----------------------
@@ -37,32 +40,85 @@ num_viable_ai_links:
 
 '''
 
-real_estate_questions_template = f'''
+
+def render_real_estate_questions_template(record:dict) -> str:
+    ''' Header of the output file of one of the 100/1000 real estate questions '''
+    return f'''
 User and Date:
 ------------------
-user: Juan Cardenas
-date: {date.today()}
+user: {record.get("user", DEFAULT_USER)}
+date: {record["date"]}
 
 Country:
 ------------
-country: {self.country}
+country: {record["country"]}
 
 Data sourced using:
 ----------------------
-method: API
-model: {self.model}
+method: {record.get("method", "API")}
+model: {record["model"]}
 
 General Notes:
 -----------------------
 
 Prompt:
 -----------------------
-system_prompt_num: {self.system_prompt_number}
-prompt_num: {self.prompt_number}
+system_prompt_num: {record["system_prompt_number"]}
+prompt_num: {record["prompt_number"]}
 
-{self.system_prompt+'\n\n'+self.user_prompt}
+{record["system_prompt"]}\n\n{record["user_prompt"]}
 
 AI Response:
 ----------------------
 
-'''
\ No newline at end of file
+'''
+
+
+def render_real_estate_professional_search_template(record:dict) -> str:
+    ''' Header of the output file of a real estate professional search prompt '''
+    return f'''
+User and Date:
+------------------
+user: {record.get("user", DEFAULT_USER)}
+date: {record["date"]}
+
+Country:
+------------
+country: {record["country"]}
+
+Data sourced using:
+----------------------
+method: {record.get("method", "")}
+model: {record["model"]}
+
+General Notes:
+-----------------------
+
+Prompt:
+-----------------------
+system_prompt_num: {record["system_prompt_number"]}
+prompt_num: {record["prompt_number"]}
+
+{record["system_prompt"]}\n\n{record["user_prompt"]}
+
+AI Response:
+----------------------
+number_of_professionals: 
+
+'''
+
+
+TEMPLATE_RENDERERS = {"data_collection": render_data_collection_template,
+                      "real_estate_questions": render_real_estate_questions_template,
+                      "real_estate_professional_search": render_real_estate_professional_search_template}
+
+
+def output_filename(output_kind:str, model:str, country:str, run_date, prompt_number:int, outfile_comment:str = "") -> str:
+    ''' Name of the text file in model_output/<country> that holds this kind of output '''
+    if output_kind == "data_collection":
+        return f"{model}_{country}_{run_date}_prompt_{prompt_number}.txt"
+    elif output_kind == "real_estate_questions":
+        return f"{model}_{country}_{run_date}_real_estate_question_{prompt_number}{outfile_comment}.txt"
+    elif output_kind == "real_estate_professional_search":
+        return f"{model}_{country}_{run_date}_real_estate_professional_search_prompt_{prompt_number}{outfile_comment}.txt"
+    raise ValueError(f"Unknown output kind {output_kind}")
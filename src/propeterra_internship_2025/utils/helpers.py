@@ -1,4 +1,8 @@
+import sys
 import time
+import functools
+import importlib.util
+from types import ModuleType
 
 
 def timing_function(func):
@@ -7,14 +11,34 @@ def timing_function(func):
     needed for a function to run
     '''
 
+    @functools.wraps(func)
     def measure_time(*args, **kwargs):
 
-        start_time = time.time()
-        func(*args, **kwargs)
-        end_time = time.time()
-        total_time = end_time - start_time,
-        print(f"function took {total_time} seconds to run")
-        return total_time
+        start_time = time.perf_counter()
+        result = func(*args, **kwargs)
+        end_time = time.perf_counter()
+        total_time = end_time - start_time
+        print(f"{func.__name__} took {total_time:.3f} seconds to run")
+        return result
 
 
-    return measure_time
\ No newline at end of file
+    return measure_time
+
+
+def lazy_import(name:str) -> ModuleType:
+    '''
+    Returns the module without running it yet, its code runs on the first attribute access.
+    Keeps data modules and SDKs that a command may never touch out of its startup time.
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,182 @@
+'''
+Pooled HTTP sessions for link checking.
+
+A module level requests.head opens a new TCP (and TLS) connection for every link, even when
+twenty links share one statistics portal. LinkSessions keeps one session per host with a pool of
+`pool_size` keep-alive connections, so links on the same host reuse them. With http2=True the
+sessions are httpx clients that multiplex the requests to a host over one HTTP/2 connection
+where the server negotiates it (https only, other hosts fall back to keep-alive HTTP/1.1), this
+needs the optional h2 package: pip install "httpx[http2]".
+
+While `resolving()` is active, socket.getaddrinfo answers from a DNSCache, so a host is looked up
+once per `dns_ttl` seconds instead of once per new connection.
+'''
+import time
+import socket
+import logging
+import threading
+import importlib.util
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from typing import Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_DNS_TTL_SECONDS = 300.0
+
+
+class DNSCache():
+    ''' getaddrinfo results memoized for `ttl` seconds, failed lookups are not cached '''
+
+    # installed() patches socket.getaddrinfo for the whole process. Every active block, of this
+    # cache or another one, shares one patch that is only undone when the last block ends.
+    install_lock = threading.Lock()
+    active: list["DNSCache"] = []
+    replaced = None
+
+    def __init__(self, ttl:float = DEFAULT_DNS_TTL_SECONDS):
+        self.ttl = ttl
+        self.entries: dict[tuple, tuple[float, list]] = {}
+        self.lookups = 0
+        self.hits = 0
+        with DNSCache.install_lock:
+            self.resolve = DNSCache.replaced or socket.getaddrinfo
+        self.lock = threading.Lock()
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        with self.lock:
+            self.lookups += 1
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+        result = self.resolve(*key)
+        with self.lock:
+            self.entries[key] = (now + self.ttl, result)
+        return result
+
+    @staticmethod
+    def routed_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        ''' What socket.getaddrinfo is while any cache is installed: the latest installed cache answers '''
+        active = DNSCache.active
+        if not active:
+            return (DNSCache.replaced or socket.getaddrinfo)(host, port, family, type, proto, flags)
+        return active[-1].getaddrinfo(host, port, family, type, proto, flags)
+
+    @contextmanager
+    def installed(self) -> Iterator["DNSCache"]:
+        ''' Routes every socket.getaddrinfo call of the process through the cache until the block ends, blocks may nest and overlap '''
+        with DNSCache.install_lock:
+            if not DNSCache.active:
+                DNSCache.replaced = socket.getaddrinfo
+                socket.getaddrinfo = DNSCache.routed_getaddrinfo
+            self.resolve = DNSCache.replaced
+            DNSCache.active.append(self)
+        try:
+            yield self
+        finally:
+            with DNSCache.install_lock:
+                DNSCache.active.remove(self)
+                if not DNSCache.active:
+                    socket.getaddrinfo = DNSCache.replaced
+                    DNSCache.replaced = None
+
+
+class LinkSessions():
+    ''' One pooled session per host, requests.Session by default or httpx.Client for HTTP/2 '''
+
+    def __init__(self, pool_size:int = DEFAULT_POOL_SIZE, http2:bool = False, dns_ttl:float = DEFAULT_DNS_TTL_SECONDS):
+        if pool_size < 1:
+            raise ValueError(f"pool_size must be at least 1, got {pool_size}")
+        if http2 and importlib.util.find_spec("h2") is None:
+            raise ValueError('HTTP/2 needs the h2 package, install it with pip install "httpx[http2]"')
+
+        self.pool_size = pool_size
+        self.http2 = http2
+        self.dns = DNSCache(dns_ttl) if dns_ttl > 0 else None
+        self.sessions: dict[str, object] = {}
+        self.lock = threading.Lock()
+
+        if http2:
+            import httpx
+            self.request_errors = (httpx.HTTPError, httpx.InvalidURL)
+        else:
+            self.request_errors = (requests.RequestException,)
+
+    def new_session(self):
+        if self.http2:
+            import httpx
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            return httpx.Client(http2=True, limits=limits)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def session(self, link:str):
+        ''' The session of the link's scheme and host, created on first use '''
+        try:
+            parts = urlsplit(link)
+            key = f"{parts.scheme}://{parts.netloc}".lower()
+        except ValueError:
+            key = ""
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = self.new_session()
+            return session
+
+    def request(self, method:str, link:str, timeout:float, headers:dict | None = None, stream:bool = False):
+        '''
+        The response to one request without following redirects, raises one of `request_errors`.
+        A streamed response has only its headers read, see read_capped.
+        '''
+        session = self.session(link)
+        if self.http2:
+            request = session.build_request(method, link, headers=headers, timeout=timeout)
+            return session.send(request, stream=stream, follow_redirects=False)
+        return session.request(method, link, headers=headers, timeout=timeout, allow_redirects=False, stream=stream)
+
+    def read_capped(self, response, max_bytes:int) -> int:
+        ''' Reads at most about max_bytes of a streamed body and closes the response, returns the bytes read '''
+        chunks = response.iter_bytes(1024) if self.http2 else response.iter_content(1024)
+        n_bytes = 0
+        try:
+            for chunk in chunks:
+                n_bytes += len(chunk)
+                if n_bytes >= max_bytes:
+                    break
+        finally:
+            response.close()
+        return n_bytes
+
+    def get(self, link:str, timeout:float):
+        ''' The response to a GET request following redirects, for small documents like robots.txt '''
+        if self.http2:
+            return self.session(link).get(link, timeout=timeout, follow_redirects=True)
+        return self.session(link).get(link, timeout=timeout)
+
+    @contextmanager
+    def resolving(self) -> Iterator["LinkSessions"]:
+        ''' Caches DNS lookups for the duration of the block (a batch of link checks) '''
+        if self.dns is None:
+            yield self
+            return
+        with self.dns.installed():
+            yield self
+        logger.debug(f"DNS cache answered {self.dns.hits} of {self.dns.lookups} lookups")
+
+    def close(self) -> None:
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
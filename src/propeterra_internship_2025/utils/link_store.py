@@ -0,0 +1,151 @@
+'''
+On-disk store of link check results, shared across runs, countries and models.
+
+The same reference URLs come back in the outputs for every country and model, so the result of
+each check is kept in SQLite under the normalized URL: status code, final (redirect) URL, content
+type, content length, when it was checked, whether HEAD or the GET fallback answered and the
+redirect hops. How long a stored result is trusted depends on its status: a rate limited or
+unavailable host (429, 503) or a link that could not be checked at all is tried again soon, a
+page that answered 200 or 404 is not re-checked for a week.
+'''
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+from propeterra_internship_2025.utils.link_validation import LinkResult, HEAD_FALLBACK_STATUS_CODES
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LINK_STORE_PATH = "model_output/.link_status.sqlite"
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Seconds a stored result is trusted: exact status codes first, then the status class (2 for 2xx,
+# ...), -1 is a link that could not be checked
+DEFAULT_STATUS_TTLS = {-1:  HOUR,
+                       408: HOUR,
+                       429: HOUR,
+                       503: HOUR,
+                       504: HOUR,
+                       2:   7 * DAY,
+                       3:   7 * DAY,
+                       4:   7 * DAY,
+                       5:   6 * HOUR}
+FALLBACK_TTL_SECONDS = DAY
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(link:str) -> str:
+    '''
+    Key of a link in the store: scheme and host lower cased, default port, user info and fragment
+    dropped, an empty path written as "/". The path and query are kept as they are, servers may
+    treat them case sensitively.
+    '''
+    link = link.strip()
+    try:
+        parts = urlsplit(link)
+        port = parts.port
+    except ValueError:
+        return link
+    if not parts.scheme or not parts.hostname:
+        return link
+    scheme = parts.scheme.lower()
+    host = parts.hostname.lower()
+    if ":" in host:
+        host = f"[{host}]"
+    netloc = host if port is None or port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def status_ttl(status_code:int, ttls:dict[int, float] = DEFAULT_STATUS_TTLS) -> float:
+    ''' Seconds a result with this status code stays valid '''
+    if status_code in ttls:
+        return ttls[status_code]
+    return ttls.get(status_code // 100, FALLBACK_TTL_SECONDS)
+
+
+class LinkStore():
+    '''
+    SQLite table of the latest check of every normalized URL. Results past the TTL of their
+    status are treated as missing and overwritten by the next check.
+    '''
+
+    def __init__(self, path:str = DEFAULT_LINK_STORE_PATH, ttls:dict[int, float] = DEFAULT_STATUS_TTLS):
+        self.path = path
+        self.ttls = ttls
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS links (
+                                       url            TEXT PRIMARY KEY,
+                                       status_code    INTEGER NOT NULL,
+                                       final_url      TEXT,
+                                       content_type   TEXT,
+                                       content_length INTEGER,
+                                       checked_at     REAL NOT NULL,
+                                       method         TEXT,
+                                       redirects      TEXT)''')
+        # Stores written before the GET fallback lack its columns
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(links)")}
+        for column in ("method", "redirects"):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE links ADD COLUMN {column} TEXT")
+        self.connection.commit()
+
+    def is_fresh(self, status_code:int, checked_at:float, method:str | None, now:float) -> bool:
+        # A store written before the GET fallback holds HEAD rejections, which the fallback may turn into a live link
+        if method is None and status_code in HEAD_FALLBACK_STATUS_CODES:
+            return False
+        return now - checked_at < status_ttl(status_code, self.ttls)
+
+    def get_many(self, links:list[str]) -> dict[str, LinkResult]:
+        ''' The fresh stored result of every link that has one, keyed by the link as given '''
+        keys = {link: normalize_url(link) for link in links}
+        unique_keys = list(set(keys.values()))
+        rows = {}
+        with self.lock:
+            # SQLite limits the number of parameters of one statement
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                query = (f"SELECT url, status_code, final_url, content_type, content_length, checked_at, method, redirects "
+                         f"FROM links WHERE url IN ({', '.join('?' * len(chunk))})")
+                rows.update((row[0], row[1:]) for row in self.connection.execute(query, chunk))
+
+        now = time.time()
+        results = {}
+        for link, key in keys.items():
+            row = rows.get(key)
+            if row is not None and self.is_fresh(row[0], row[4], row[5], now):
+                results[link] = LinkResult(*row[:5], from_store=True, method=row[5], redirects=json.loads(row[6]) if row[6] else [])
+        return results
+
+    def get(self, link:str) -> LinkResult | None:
+        return self.get_many([link]).get(link)
+
+    def put_many(self, results:dict[str, LinkResult]) -> None:
+        ''' Stores the results of a batch of checks in one transaction, keyed by normalized URL '''
+        rows = [(normalize_url(link), result.status_code, result.final_url, result.content_type, result.content_length, result.checked_at,
+                 result.method, json.dumps(result.redirects) if result.redirects else None)
+                for link, result in results.items() if not result.from_store]
+        with self.lock:
+            self.connection.executemany('''INSERT OR REPLACE INTO links (url, status_code, final_url, content_type, content_length, checked_at, method, redirects)
+                                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+            self.connection.commit()
+
+    def put(self, link:str, result:LinkResult) -> None:
+        self.put_many({link: result})
+
+    def close(self) -> None:
+        self.connection.close()
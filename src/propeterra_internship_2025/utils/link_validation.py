@@ -0,0 +1,263 @@
+'''
+Concurrent checking of the links the models return.
+
+Links are checked on a bounded thread pool (the global concurrency cap). Every host also has its
+own cap on requests in flight and a politeness delay between the start of two requests to it,
+so twenty links on one statistics portal are not fired at it at once while the links on other
+hosts go ahead. Results are returned in the order of the input, every link is checked at most
+once per LinkValidator, so the log written from them stays the same from run to run. A link is
+checked with HEAD, or with a ranged GET reading a few KB when the server rejects HEAD, and its
+redirects are followed hop by hop. The
+requests go through LinkSessions, which keeps the connections to every host alive between links.
+With a LinkStore, links checked recently enough (by this or an earlier run) are answered from it
+without any network I/O. With a RobotsCache, scrapeable_many tells which links robots.txt allows.
+'''
+import time
+import logging
+import threading
+from urllib.parse import urlsplit, urljoin
+from typing import Iterable, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from propeterra_internship_2025.utils.link_sessions import LinkSessions
+from propeterra_internship_2025.utils.robots import RobotsCache
+
+if TYPE_CHECKING:
+    from propeterra_internship_2025.utils.link_store import LinkStore
+
+
+logger = logging.getLogger(__name__)
+
+# Status codes that mark a link as broken, after any redirects and the GET fallback
+FAIL_STATUS_CODES = frozenset({204, 400, 401, 404, 405, 408, 410, 429, 502, 503, 504})
+
+DEFAULT_TIMEOUT_SECONDS = 5.0
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_PER_HOST = 2
+DEFAULT_HOST_DELAY_SECONDS = 0.5
+
+# HEAD answers of servers that often reject HEAD but serve the page to a GET, these are checked again with a ranged GET
+HEAD_FALLBACK_STATUS_CODES = frozenset({400, 401, 403, 405, 501})
+# At most this much of the body of a fallback GET is requested and read
+RANGE_BYTES = 4096
+MAX_REDIRECTS = 10
+
+# The robots.txt rules for requests' own user agent apply to the link checks
+ROBOTS_USER_AGENT = requests.utils.default_user_agent()
+
+# (is broken, status code): True/False when the link answered, None and -1 when it could not be checked
+LinkStatus = tuple[bool | None, int]
+
+
+def link_host(link:str) -> str:
+    ''' Lower case host of a link, "" for a link without one '''
+    try:
+        return (urlsplit(link).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+class LinkResult():
+    '''
+    What checking a link found, status_code is -1 when the link could not be checked. `redirects`
+    holds every hop before the final URL as [url, status code], `method` is the request that
+    gave the status, HEAD or the GET fallback.
+    '''
+
+    def __init__(self, status_code:int, final_url:str | None = None, content_type:str | None = None,
+                 content_length:int | None = None, checked_at:float | None = None, from_store:bool = False,
+                 method:str | None = None, redirects:list[list] | None = None):
+        self.status_code = status_code
+        self.final_url = final_url
+        self.content_type = content_type
+        self.content_length = content_length
+        self.checked_at = checked_at if checked_at is not None else time.time()
+        self.from_store = from_store
+        self.method = method
+        self.redirects = redirects or []
+
+    @classmethod
+    def from_response(cls, url:str, response, method:str, redirects:list[list]) -> "LinkResult":
+        ''' From the last requests or httpx response of a redirect chain, `url` is the URL it answered '''
+        headers = response.headers
+        # The full size of a ranged GET is after the slash of Content-Range: bytes 0-4095/1048576
+        length = headers.get("Content-Range", "").rpartition("/")[2] if response.status_code == 206 else headers.get("Content-Length")
+        return cls(response.status_code, url, headers.get("Content-Type"), int(length) if length and length.isdigit() else None,
+                   method=method, redirects=redirects)
+
+    @property
+    def status(self) -> LinkStatus:
+        '''
+        returns: Bool
+            True if link is broken and matches any of the failure codes
+            False if link is valid
+            None if link could not be checked
+        '''
+        if self.status_code == -1:
+            return None, -1
+        return self.status_code in FAIL_STATUS_CODES, self.status_code
+
+
+def fetch_result(sessions:LinkSessions, method:str, link:str, timeout:float, headers:dict | None = None,
+                 max_bytes:int | None = None) -> LinkResult:
+    '''
+    Requests the link and follows its redirects one hop at a time, recording each. With max_bytes
+    the response is streamed and at most that much of its body is read. Raises one of
+    sessions.request_errors.
+    '''
+    url = link
+    redirects = []
+    while True:
+        response = sessions.request(method, url, timeout, headers=headers, stream=max_bytes is not None)
+        location = response.headers.get("Location")
+        if not (300 <= response.status_code < 400 and location):
+            break
+        response.close()
+        if len(redirects) == MAX_REDIRECTS:
+            logger.info(f"{link} redirects more than {MAX_REDIRECTS} times")
+            return LinkResult(-1, url, method=method, redirects=redirects)
+        redirects.append([url, response.status_code])
+        url = urljoin(url, location)
+
+    if max_bytes is not None:
+        sessions.read_capped(response, max_bytes)
+    return LinkResult.from_response(url, response, method, redirects)
+
+
+def check_link(link:str, timeout:float = DEFAULT_TIMEOUT_SECONDS, sessions:LinkSessions | None = None,
+               range_bytes:int = RANGE_BYTES) -> LinkResult:
+    '''
+    Check if a link returns 404 or any other fail type, see LinkResult.status. A HEAD request
+    first; when the server rejects HEAD (HEAD_FALLBACK_STATUS_CODES) a streamed GET for only the
+    first `range_bytes` bytes, so a PDF or CSV is never downloaded just to see that it is there.
+    Without `sessions` every call opens a new connection.
+    '''
+    own_sessions = sessions is None
+    if own_sessions:
+        sessions = LinkSessions(dns_ttl=0)
+    try:
+        result = fetch_result(sessions, "HEAD", link, timeout)
+        if result.status_code in HEAD_FALLBACK_STATUS_CODES:
+            headers = {"Range": f"bytes=0-{range_bytes - 1}", "Accept-Encoding": "identity"}
+            result = fetch_result(sessions, "GET", link, timeout, headers=headers, max_bytes=range_bytes)
+        return result
+    except sessions.request_errors:
+        return LinkResult(-1)
+    finally:
+        if own_sessions:
+            sessions.close()
+
+
+class HostLimiter():
+    ''' At most `per_host` requests in flight to one host, their starts at least `delay` seconds apart '''
+
+    def __init__(self, per_host:int, delay:float):
+        self.slots = threading.Semaphore(per_host)
+        self.delay = delay
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> "HostLimiter":
+        self.slots.acquire()
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.slots.release()
+
+
+class LinkValidator():
+    '''
+    Checks links concurrently: `max_workers` requests in flight overall, `per_host` per host and
+    `host_delay` seconds between two requests to the same host. Results are memoized, a link
+    repeated across files is only requested once, and with a `store` not at all while its stored
+    status is fresh. Call close() when done to close the connections.
+    '''
+
+    def __init__(self, max_workers:int = DEFAULT_MAX_WORKERS, per_host:int = DEFAULT_PER_HOST,
+                 host_delay:float = DEFAULT_HOST_DELAY_SECONDS, timeout:float = DEFAULT_TIMEOUT_SECONDS,
+                 sessions:LinkSessions | None = None, store:"LinkStore | None" = None, robots:RobotsCache | None = None):
+        if max_workers < 1 or per_host < 1:
+            raise ValueError(f"max_workers and per_host must be at least 1, got {max_workers} and {per_host}")
+        if host_delay < 0 or timeout <= 0:
+            raise ValueError(f"host_delay must not be negative and timeout must be positive, got {host_delay} and {timeout}")
+
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.host_delay = host_delay
+        self.timeout = timeout
+        # One keep-alive connection per request a host may have in flight
+        self.sessions = sessions or LinkSessions(pool_size=per_host)
+        self.store = store
+        self.robots = robots if robots is not None else RobotsCache(get=self.sessions.get, errors=self.sessions.request_errors, timeout=timeout)
+        self.results: dict[str, LinkResult] = {}
+        self.hosts: dict[str, HostLimiter] = {}
+        self.lock = threading.Lock()
+
+    def host_limiter(self, host:str) -> HostLimiter:
+        with self.lock:
+            limiter = self.hosts.get(host)
+            if limiter is None:
+                limiter = self.hosts[host] = HostLimiter(self.per_host, self.host_delay)
+            return limiter
+
+    def check_one(self, link:str) -> LinkResult:
+        with self.host_limiter(link_host(link)):
+            return check_link(link, timeout=self.timeout, sessions=self.sessions)
+
+    def check_results(self, links:Iterable[str]) -> list[LinkResult]:
+        ''' The result of every link, in the order of `links` '''
+        links = list(links)
+        pending = [link for link in dict.fromkeys(links) if link not in self.results]
+
+        if pending and self.store is not None:
+            stored = self.store.get_many(pending)
+            self.results.update(stored)
+            pending = [link for link in pending if link not in stored]
+            if stored:
+                logger.info(f"{len(stored)} links answered from the link store {self.store.path}")
+
+        if pending:
+            # Round robin over the hosts, so the workers are not all queued behind one host's cap
+            by_host: dict[str, list[str]] = {}
+            for link in pending:
+                by_host.setdefault(link_host(link), []).append(link)
+            queues = list(by_host.values())
+            ordered = [queue[i] for i in range(max(map(len, queues))) for queue in queues if i < len(queue)]
+
+            started = time.perf_counter()
+            with self.sessions.resolving(), ThreadPoolExecutor(max_workers=min(self.max_workers, len(ordered))) as pool:
+                for link, result in zip(ordered, pool.map(self.check_one, ordered)):
+                    self.results[link] = result
+            logger.debug(f"Checked {len(ordered)} links on {len(queues)} hosts in {time.perf_counter() - started:.2f}s")
+
+            if self.store is not None:
+                self.store.put_many({link: self.results[link] for link in ordered})
+
+        return [self.results[link] for link in links]
+
+    def check_many(self, links:Iterable[str]) -> list[LinkStatus]:
+        ''' The status of every link, in the order of `links` '''
+        return [result.status for result in self.check_results(links)]
+
+    def check(self, link:str) -> LinkStatus:
+        return self.check_many([link])[0]
+
+    def scrapeable_many(self, links:Iterable[str], user_agent:str = ROBOTS_USER_AGENT) -> list[bool]:
+        ''' Whether robots.txt allows `user_agent` to fetch every link, the robots.txt files are fetched concurrently '''
+        links = list(links)
+        with self.sessions.resolving():
+            self.robots.prefetch(links, max_workers=self.max_workers)
+        return [self.robots.can_fetch(user_agent, link) for link in links]
+
+    def close(self) -> None:
+        self.sessions.close()
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,226 @@
+'''
+Per request metrics for QueryModel.
+
+Every request (streamed, cached or collected by the async runner) records one metrics
+dictionary in the process wide registry: queue wait, time to first token, total latency,
+prompt / completion / cached tokens, the estimated cost, what the provider's prompt cache
+saved and whether the response or semantic cache answered it. At the end of a run the registry
+is exported as a Prometheus textfile (for the node_exporter textfile collector) and as a summary
+table with p50/p95/p99 per model, per prompt number and for prompt cache hits against cold
+prompts, plus the cache hit rates of the run.
+'''
+import os
+import math
+import threading
+from collections import defaultdict
+
+
+# USD per million (input, cached input, output) tokens, None where the price is unknown
+MODEL_PRICES = {"gpt-4.1":            (2.00, 0.50, 8.00),
+                "sonar":              (1.00, None, 1.00),
+                "sonar-pro":          (3.00, None, 15.00),
+                "sonar-deep-research":(2.00, None, 8.00),
+                "mistral":            (2.00, None, 6.00),
+                "gemini-2.5-flash":   (0.30, 0.075, 2.50),
+                "gemini-2.5-pro":     (1.25, 0.31, 10.00)}
+
+QUANTILES = (0.5, 0.95, 0.99)
+TIMINGS = ("queue_wait_seconds", "ttft_seconds", "latency_seconds")
+TOKEN_KINDS = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+METRIC_PREFIX = "propeterra"
+
+
+def estimate_cost(model:str, prompt_tokens:int, completion_tokens:int, cached_tokens:int = 0) -> float | None:
+    ''' Estimated USD cost of one request, cached prompt tokens are billed at the cached input price '''
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+
+    input_price, cached_price, output_price = prices
+    if cached_price is None:
+        cached_price = input_price
+    uncached_tokens = max(0, prompt_tokens - cached_tokens)
+    return (uncached_tokens * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def percentile(values:list[float], q:float) -> float | None:
+    ''' Linearly interpolated percentile, q between 0 and 1 '''
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    low, high = math.floor(position), math.ceil(position)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def format_table(header:list[str], rows:list[list[str]]) -> str:
+    ''' Left aligned plain text table with a dashed line under the header '''
+    widths = [max(len(line[i]) for line in [header] + rows) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(line, widths)) for line in [header] + rows]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+class MetricsRegistry():
+    ''' Thread safe in-process collection of the metrics records of every request '''
+
+    def __init__(self):
+        self.records: list[dict] = []
+        self.lock = threading.Lock()
+
+    def record(self, metrics:dict) -> None:
+        with self.lock:
+            self.records.append(metrics)
+
+    def snapshot(self) -> list[dict]:
+        with self.lock:
+            return list(self.records)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.records.clear()
+
+    def grouped(self, key:str) -> dict:
+        ''' Records grouped by one of their fields, e.g. model or prompt_number '''
+        groups = defaultdict(list)
+        for record in self.snapshot():
+            groups[record.get(key)].append(record)
+        return dict(sorted(groups.items(), key=lambda item: str(item[0])))
+
+    def summary_table(self, key:str = "model") -> str:
+        ''' Plain text table with request counts, latency percentiles, tokens and cost per value of `key` '''
+        header = [key, "requests", "errors", "cache_hits"]
+        for timing in ("ttft_seconds", "latency_seconds"):
+            header += [f"{timing.removesuffix('_seconds')}_p{int(q * 100)}" for q in QUANTILES]
+        header += ["prompt_tokens", "completion_tokens", "cached_tokens", "cached_share", "cost_usd", "cache_savings_usd"]
+
+        rows = []
+        for value, records in self.grouped(key).items():
+            ok = [record for record in records if record.get("status") == "ok"]
+            # Cache hits never reach the provider, they would drag the latency percentiles down
+            sent = [record for record in ok if not record.get("cache_hit")]
+            row = [str(value), str(len(records)), str(len(records) - len(ok)), str(len(ok) - len(sent))]
+            for timing in ("ttft_seconds", "latency_seconds"):
+                values = [record[timing] for record in sent if record.get(timing) is not None]
+                row += [f"{p:.2f}" if (p := percentile(values, q)) is not None else "-" for q in QUANTILES]
+            tokens = {kind: sum(record.get(kind) or 0 for record in sent) for kind in TOKEN_KINDS}
+            row += [str(tokens[kind]) for kind in TOKEN_KINDS]
+            row.append(f"{tokens['cached_tokens'] / tokens['prompt_tokens']:.0%}" if tokens["prompt_tokens"] else "-")
+            row.append(f"{sum(record.get('cost_usd') or 0 for record in sent):.4f}")
+            row.append(f"{sum(record.get('cache_savings_usd') or 0 for record in sent):.4f}")
+            rows.append(row)
+        return format_table(header, rows)
+
+    def cache_hit_table(self, key:str = "model") -> str:
+        '''
+        Share of successful requests answered by the exact response cache or the semantic cache,
+        and the near duplicates the semantic cache only flagged, per value of `key`
+        '''
+        header = [key, "requests", "exact_hits", "semantic_hits", "semantic_flagged", "hit_rate"]
+        rows = []
+        for value, records in self.grouped(key).items():
+            ok = [record for record in records if record.get("status") == "ok"]
+            semantic_hits = sum(1 for record in ok if record.get("semantic_hit"))
+            exact_hits = sum(1 for record in ok if record.get("cache_hit")) - semantic_hits
+            flagged = sum(1 for record in ok if record.get("semantic_similarity") is not None and not record.get("semantic_hit"))
+            rows.append([str(value), str(len(ok)), str(exact_hits), str(semantic_hits), str(flagged),
+                         f"{(exact_hits + semantic_hits) / len(ok):.0%}" if ok else "-"])
+        return format_table(header, rows)
+
+    def prometheus_text(self) -> str:
+        ''' The registry in the Prometheus text exposition format '''
+        lines = []
+        by_model = self.grouped("model")
+
+        lines += [f"# HELP {METRIC_PREFIX}_requests_total Model requests by outcome",
+                  f"# TYPE {METRIC_PREFIX}_requests_total counter"]
+        for model, records in by_model.items():
+            counts = defaultdict(int)
+            for record in records:
+                counts[(record.get("status"), bool(record.get("cache_hit")))] += 1
+            for (status, cache_hit), count in sorted(counts.items()):
+                lines.append(f'{METRIC_PREFIX}_requests_total{{model="{model}",status="{status}",cache_hit="{str(cache_hit).lower()}"}} {count}')
+
+        for timing in TIMINGS:
+            name = f"{METRIC_PREFIX}_{timing}"
+            lines += [f"# HELP {name} {timing.removesuffix('_seconds').replace('_', ' ')} of requests sent to the provider",
+                      f"# TYPE {name} summary"]
+            for model, records in by_model.items():
+                values = [record[timing] for record in records
+                          if record.get("status") == "ok" and not record.get("cache_hit") and record.get(timing) is not None]
+                if not values:
+                    continue
+                for q in QUANTILES:
+                    lines.append(f'{name}{{model="{model}",quantile="{q}"}} {percentile(values, q):.6f}')
+                lines.append(f'{name}_sum{{model="{model}"}} {sum(values):.6f}')
+                lines.append(f'{name}_count{{model="{model}"}} {len(values)}')
+
+        lines += [f"# HELP {METRIC_PREFIX}_tokens_total Tokens used by kind",
+                  f"# TYPE {METRIC_PREFIX}_tokens_total counter"]
+        for model, records in by_model.items():
+            for kind in TOKEN_KINDS:
+                total = sum(record.get(kind) or 0 for record in records if not record.get("cache_hit"))
+                lines.append(f'{METRIC_PREFIX}_tokens_total{{model="{model}",kind="{kind.removesuffix("_tokens")}"}} {total}')
+
+        lines += [f"# HELP {METRIC_PREFIX}_cost_usd_total Estimated cost in US dollars",
+                  f"# TYPE {METRIC_PREFIX}_cost_usd_total counter"]
+        for model, records in by_model.items():
+            total = sum(record.get("cost_usd") or 0 for record in records if not record.get("cache_hit"))
+            lines.append(f'{METRIC_PREFIX}_cost_usd_total{{model="{model}"}} {total:.6f}')
+
+        lines += [f"# HELP {METRIC_PREFIX}_cache_savings_usd_total Estimated cost saved by provider prompt caching in US dollars",
+                  f"# TYPE {METRIC_PREFIX}_cache_savings_usd_total counter"]
+        for model, records in by_model.items():
+            total = sum(record.get("cache_savings_usd") or 0 for record in records if not record.get("cache_hit"))
+            lines.append(f'{METRIC_PREFIX}_cache_savings_usd_total{{model="{model}"}} {total:.6f}')
+
+        lines += [f"# HELP {METRIC_PREFIX}_semantic_cache_total Requests with a near duplicate in the semantic cache, served or only flagged",
+                  f"# TYPE {METRIC_PREFIX}_semantic_cache_total counter"]
+        for model, records in by_model.items():
+            hits = sum(1 for record in records if record.get("semantic_hit"))
+            flagged = sum(1 for record in records if record.get("semantic_similarity") is not None and not record.get("semantic_hit"))
+            lines.append(f'{METRIC_PREFIX}_semantic_cache_total{{model="{model}",outcome="hit"}} {hits}')
+            lines.append(f'{METRIC_PREFIX}_semantic_cache_total{{model="{model}",outcome="flagged"}} {flagged}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_textfile(self, path:str) -> None:
+        ''' Writes the textfile atomically, so the textfile collector never reads half a file '''
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as file:
+            file.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    ''' Returns the process wide registry every QueryModel records into '''
+    return _registry
+
+
+def export_run_metrics(run_dir:str, textfile:str | None = None, registry:MetricsRegistry | None = None) -> None:
+    '''
+    Writes metrics.prom and metrics_summary.txt into the run directory (and the Prometheus
+    textfile to `textfile` if given) and prints the per model summary
+    '''
+    registry = registry or get_metrics_registry()
+    if not registry.snapshot():
+        return
+
+    registry.write_prometheus_textfile(os.path.join(run_dir, "metrics.prom"))
+    if textfile:
+        registry.write_prometheus_textfile(textfile)
+
+    summary = (f"Per model:\n{registry.summary_table('model')}\n\n"
+               f"Per prompt number:\n{registry.summary_table('prompt_number')}\n\n"
+               f"Provider prompt cache hit (prompt_cached=True) vs cold prompt:\n{registry.summary_table('prompt_cached')}\n\n"
+               f"Response and semantic cache hit rates:\n{registry.cache_hit_table('model')}\n")
+    with open(os.path.join(run_dir, "metrics_summary.txt"), "w", encoding="utf8") as file:
+        file.write(summary)
+    print(summary)
@@ -1,36 +1,69 @@
 import os
+import time
+import hashlib
+import logging
 from datetime import date
-from openai import OpenAI
-from langchain_openai import ChatOpenAI
-from langchain_perplexity import ChatPerplexity
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from google.generativeai.types.safety_types import HarmCategory, HarmBlockThreshold
-
-# Define safety settings to be very permissive for all categories
-safety_settings = {
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-}
-
-from propeterra_internship_2025.utils.user_prompts import user_prompt_dictionary, real_estate_professionals_prompt_dictionary
-from propeterra_internship_2025.utils.system_prompts import system_prompt_dictionary
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
+from propeterra_internship_2025.data.country_catalog import get_country_catalog
+from propeterra_internship_2025.utils.response_cache import ResponseCache
+from propeterra_internship_2025.utils.result_store import ResultStore
+from propeterra_internship_2025.utils.response_sinks import TextFileSink, citations_trailer
+from propeterra_internship_2025.utils.documentation_templates import TEMPLATE_RENDERERS, output_filename
+from propeterra_internship_2025.utils.provider_registry import get_openai_client, get_prompt_chain, PERPLEXITY_BASE_URL
+from propeterra_internship_2025.utils.rate_limiter import call_with_rate_limit, acall_with_rate_limit
+from propeterra_internship_2025.utils.token_counting import count_tokens
+from propeterra_internship_2025.utils.metrics import get_metrics_registry, estimate_cost, TIMINGS, TOKEN_KINDS
+
+if TYPE_CHECKING:
+    from propeterra_internship_2025.utils.semantic_cache import SemanticCache
+
+# Completion length assumed when reserving tokens/minute budget before a request is sent
+EXPECTED_COMPLETION_TOKENS = 1500
+
+
+def provider_for_model(model:str) -> str:
+    ''' Maps a supported model name to the provider that serves it '''
+    if "gpt" in model:
+        return "openai"
+    elif "sonar" in model:
+        return "perplexity"
+    elif "gemini" in model:
+        return "gemini"
+    return model
 
 
 class QueryModel():
     ''' Class to select which model to query '''
 
-    def __init__(self, model:str, country:str, system_prompt:str = "", user_prompt:str = "", prompt_number:int = -1, system_prompt_number:int = -1, outfile_comment:str=""):
+    def __init__(self, model:str, country:str, system_prompt:str = "", user_prompt:str = "", prompt_number:int = -1, system_prompt_number:int = -1, outfile_comment:str="",
+                 cache:ResponseCache | None = None, refresh:bool = False, result_store:ResultStore | None = None, prompt_tokens:int | None = None,
+                 semantic_cache:"SemanticCache | None" = None):
         self.model = model
-        self.country = country
+        # Canonical name, so "Czechia" and "Czech Republic" end up in the same output folder
+        self.country = get_country_catalog().resolve(country)
         self.system_prompt = system_prompt
         self.user_prompt = user_prompt
         self.prompt_number = prompt_number
         self.system_prompt_number = system_prompt_number
         self.outfile_comment = outfile_comment
+        # Prompt token count, e.g. RenderedPrompt.estimated_tokens, counted on first use if not given
+        self.prompt_tokens = prompt_tokens
+
+        # Optional response cache, refresh=True skips lookups but still stores the new answer
+        self.cache = cache
+        self.refresh = refresh
+        # Optional cache of answers to near duplicate prompts, serves or only flags them depending on its mode
+        self.semantic_cache = semantic_cache
 
+        # Optional structured store for the run, the .txt files are then rendered from it at the end of the run
+        self.result_store = result_store
+
+        # Latency, time to first token, token usage, cache status and citations of the last request, stored next to the response
+        self.response_meta = {}
+        self.request_start = time.perf_counter()
+        self.sent_at = None
+        # Time spent waiting for a runner slot before the request started, set by AsyncQueryRunner
+        self.queue_wait_seconds = 0.0
 
         self.supported_models = {"gpt-4.1":  os.environ.get("OPENAI_API_KEY_PROPETERRA"),
                                  "sonar":    os.environ.get("PERPLEXITY_API_KEY_PROPETERRA"),
@@ -55,7 +88,7 @@ class QueryModel():
         if not os.path.isdir(f"model_output/{country}"):
             os.mkdir(f"model_output/{country}")
   
-        with open(f"model_output/{country}/{model}_{country}_{date.today()}_prompt_{prompt_number}.txt", "a", encoding="utf8") as file:
+        with open(f"model_output/{country}/{output_filename('data_collection', model, country, date.today(), prompt_number)}", "a", encoding="utf8") as file:
             file.write(response)
         print(response)
 
@@ -64,7 +97,7 @@ class QueryModel():
         if not os.path.isdir(f"model_output/{country}"):
             os.mkdir(f"model_output/{country}")
 
-        with open(f"model_output/{country}/{model}_{country}_{date.today()}_real_estate_question_{prompt_number}{outfile_comment}.txt", "a", encoding="utf8") as file:
+        with open(f"model_output/{country}/{output_filename('real_estate_questions', model, country, date.today(), prompt_number, outfile_comment)}", "a", encoding="utf8") as file:
             file.write(response)
 
     def write_to_real_estate_professional_search_file(self, model:str, country:str , response, prompt_number:int, outfile_comment:str):
@@ -72,126 +105,61 @@ class QueryModel():
         if not os.path.isdir(f"model_output/{country}"):
             os.mkdir(f"model_output/{country}")
 
-        with open(f"model_output/{country}/{model}_{country}_{date.today()}_real_estate_professional_search_prompt_{prompt_number}{outfile_comment}.txt", "a", encoding="utf8") as file:
+        with open(f"model_output/{country}/{output_filename('real_estate_professional_search', model, country, date.today(), prompt_number, outfile_comment)}", "a", encoding="utf8") as file:
             file.write(response)
 
+    def write_output(self, output_kind:str, text:str) -> None:
+        ''' Appends text to the legacy .txt file of the given output kind '''
+        if output_kind == "data_collection":
+            self.write_to_file(self.model, self.country, text, self.prompt_number)
+        elif output_kind == "real_estate_questions":
+            self.write_to_real_estate_questions_file(self.model, self.country, text, self.prompt_number, self.outfile_comment)
+        else:
+            self.write_to_real_estate_professional_search_file(self.model, self.country, text, self.prompt_number, self.outfile_comment)
+
+    def record_fields(self, output_kind:str) -> dict:
+        ''' Structured columns shared by every record this query writes '''
+        return {"output_kind": output_kind,
+                "model": self.model,
+                "country": self.country,
+                "prompt_number": self.prompt_number,
+                "system_prompt_number": self.system_prompt_number,
+                "outfile_comment": self.outfile_comment}
+
+    def write_header(self, output_kind:str) -> None:
+        ''' Writes the documentation template for this query, to the result store if there is one '''
+        record = {"record_type": "header",
+                  **self.record_fields(output_kind),
+                  "date": self.result_store.run_date if self.result_store is not None else date.today(),
+                  "system_prompt": self.system_prompt,
+                  "user_prompt": self.user_prompt}
+
+        if self.result_store is not None:
+            self.result_store.append(record)
+        else:
+            self.write_output(output_kind, TEMPLATE_RENDERERS[output_kind](record))
 
     def initialize_file(self):
         ''' Creates a default template to fill with model submission details for documentation purposes '''
-        
-        
-        template = f'''
-User and Date:
-------------------
-user: Juan Cardenas
-date: {date.today()}
-
-Country:
-------------
-country: {self.country}
-
-Data sourced using:
-----------------------
-method: 
-model: {self.model}
-
-General Notes:
------------------------
-
-Prompt:
------------------------
-system_prompt_num: {self.system_prompt_number}
-prompt_num: {self.prompt_number}
-
-{self.system_prompt+'\n\n'+self.user_prompt}
-
-Human Sourced Links:
-----------------------
-num_links:
-
-AI Returned Links:
-----------------------
-num_viable_ai_links:
-
-'''
-        self.write_to_file(self.model, self.country, template, self.prompt_number)
+        self.write_header("data_collection")
 
     def initialize_real_estate_questions_file(self):
         ''' Creates a default template to fill with model submission details for documentation purposes '''
-        template = f'''
-User and Date:
-------------------
-user: Juan Cardenas
-date: {date.today()}
-
-Country:
-------------
-country: {self.country}
-
-Data sourced using:
-----------------------
-method: API
-model: {self.model}
-
-General Notes:
------------------------
-
-Prompt:
------------------------
-system_prompt_num: {self.system_prompt_number}
-prompt_num: {self.prompt_number}
-
-{self.system_prompt+'\n\n'+self.user_prompt}
-
-AI Response:
-----------------------
-
-'''
-        self.write_to_real_estate_professional_search_file(self.model, self.country, template, self.prompt_number, self.outfile_comment)
+        self.write_header("real_estate_questions")
 
     def initialize_real_estate_professional_search_file(self):
         ''' Creates a default template to fill with model submission details for documentation purposes '''
-        template = f'''
-User and Date:
-------------------
-user: Juan Cardenas
-date: {date.today()}
-
-Country:
-------------
-country: {self.country}
-
-Data sourced using:
-----------------------
-method: 
-model: {self.model}
-
-General Notes:
------------------------
-
-Prompt:
------------------------
-system_prompt_num: {self.system_prompt_number}
-prompt_num: {self.prompt_number}
-
-{self.system_prompt+'\n\n'+self.user_prompt}
-
-AI Response:
-----------------------
-number_of_professionals: 
-
-'''
-        self.write_to_real_estate_professional_search_file(self.model, self.country, template, self.prompt_number, self.outfile_comment)
+        self.write_header("real_estate_professional_search")
 
 
 
     def query_openai(self, real_estate_questions:bool=False) -> None:
-        ''' Will query the selected model and write the output to a text file named {model}_{country}.txt '''
+        ''' Will query the selected model and stream the output to a text file named {model}_{country}.txt '''
 
         if "gpt" not in self.model:
             raise TypeError("Model is not an OpenAI Model please select another supported model")
 
-        client = OpenAI(api_key=self.supported_models[self.model])
+        client = get_openai_client(self.supported_models[self.model])
 
         # What the model will receive
         messages = [
@@ -209,22 +177,11 @@ number_of_professionals:
             },
         ]
 
-        response = client.responses.create(
-            model=self.model,
-            # tools=[{"type": "web_search_preview"}],
-            input=messages,
-        )  
-        message_text = response.output_text
-        
-  
-        if real_estate_questions:
-            self.write_to_real_estate_questions_file(self.model, self.country, message_text, self.prompt_number, self.outfile_comment)
-        else:
-            self.write_to_file(self.model, self.country, message_text, self.prompt_number)
+        self.stream_response("responses", None, {}, lambda: self.openai_stream(client, messages), real_estate_questions)
 
 
     def query_perplexity(self, real_estate_questions:bool=False) -> None:
-        ''' Will query perplexity's sonar-pro model and produce an output text file named {model}_{country}.txt '''
+        ''' Will query perplexity's sonar-pro model and stream the output to a text file named {model}_{country}.txt '''
 
 
         # What the model will receive
@@ -245,128 +202,401 @@ number_of_professionals:
             },
         ]
 
-        client = OpenAI(api_key=self.supported_models[self.model], base_url="https://api.perplexity.ai")
-
-        # chat completion without streaming
-        response = client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-        )
-        message_text = response.choices[0].message.content + "\n\n" + str(response.choices)
-
-        if real_estate_questions:
-            self.write_to_real_estate_questions_file(self.model, self.country, message_text, self.prompt_number, self.outfile_comment)
-        else:
-            self.write_to_file(self.model, self.country, message_text, self.prompt_number)
-
+        client = get_openai_client(self.supported_models[self.model], base_url=PERPLEXITY_BASE_URL)
+
+        self.stream_response("chat.completions.stream", None, {"search_mode": "academic"}, lambda: self.perplexity_stream(client, messages), real_estate_questions)
+
+    def openai_stream(self, client, messages:list) -> Iterator[tuple[str, list | None]]:
+        ''' Streams a Responses API answer as (text, citations) chunks '''
+        for event in client.responses.create(model=self.model, input=messages, stream=True, prompt_cache_key=self.prompt_cache_key()):
+            if event.type == "response.output_text.delta":
+                yield event.delta, None
+            elif event.type == "response.completed" and event.response.usage is not None:
+                usage = event.response.usage
+                self.record_usage(usage.input_tokens, usage.output_tokens, getattr(usage.input_tokens_details, "cached_tokens", 0))
+
+    def perplexity_stream(self, client, messages:list) -> Iterator[tuple[str, list | None]]:
+        ''' Streams a Perplexity chat completion as (text, citations) chunks, the citations ride along on the chunks '''
+        for chunk in client.chat.completions.create(model=self.model, messages=messages, stream=True):
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            # Perplexity sends the running usage totals on the chunks
+            if chunk.usage is not None:
+                self.record_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens,
+                                  getattr(chunk.usage.prompt_tokens_details, "cached_tokens", 0))
+            yield text or "", getattr(chunk, "citations", None)
+
+    def langchain_stream(self) -> Iterator[tuple[str, list | None]]:
+        ''' Streams the shared langchain chain as (text, citations) chunks '''
+        usage = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+        for chunk in self.build_langchain_chain().stream(self.chain_inputs()):
+            self.add_langchain_usage(usage, chunk)
+            yield chunk.content, chunk.additional_kwargs.get("citations")
+
+    async def alangchain_stream(self) -> AsyncIterator[tuple[str, list | None]]:
+        ''' Async version of langchain_stream '''
+        usage = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+        async for chunk in self.build_langchain_chain().astream(self.chain_inputs()):
+            self.add_langchain_usage(usage, chunk)
+            yield chunk.content, chunk.additional_kwargs.get("citations")
+
+    def add_langchain_usage(self, usage:dict, chunk) -> None:
+        ''' Langchain message chunks carry usage increments, they are summed over the stream '''
+        usage_metadata = getattr(chunk, "usage_metadata", None)
+        if not usage_metadata:
+            return
+        usage["input_tokens"] += usage_metadata.get("input_tokens", 0)
+        usage["output_tokens"] += usage_metadata.get("output_tokens", 0)
+        usage["cached_tokens"] += (usage_metadata.get("input_token_details") or {}).get("cache_read", 0) or 0
+        self.record_usage(usage["input_tokens"], usage["output_tokens"], usage["cached_tokens"])
+
+    def record_usage(self, prompt_tokens:int, completion_tokens:int, cached_tokens:int | None) -> None:
+        ''' Token usage reported by the provider, replaces the tiktoken estimates for this request '''
+        self.response_meta.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens or 0)
+
+
+    def prompt_cache_key(self) -> str:
+        '''
+        Routing hint for OpenAI prompt caching. Requests sharing a system prompt (and with cache_layout
+        the reference links) share the key, so they land where that prefix is already cached
+        '''
+        return hashlib.sha256(f"{self.model}\0{self.system_prompt}".encode("utf8")).hexdigest()[:32]
+
+    def cache_key(self, api:str, temperature:float | None, provider_options:dict) -> str:
+        ''' Key of this request in the response cache, the api name keeps differently formatted outputs apart '''
+        return ResponseCache.make_key(self.model, self.system_prompt, self.user_prompt, temperature, {"api": api, **provider_options})
+
+    def prompt_token_count(self) -> int:
+        ''' Tokens of the system and user prompt, encoded at most once per query '''
+        if self.prompt_tokens is None:
+            self.prompt_tokens = count_tokens(self.system_prompt, self.model) + count_tokens(self.user_prompt, self.model)
+        return self.prompt_tokens
+
+    def estimated_tokens(self) -> int:
+        ''' Tokens this request is expected to use, prompt plus an assumed completion length '''
+        return self.prompt_token_count() + EXPECTED_COMPLETION_TOKENS
+
+    def rate_limited(self, fetch):
+        ''' Wraps fetch() so it waits for the shared rate limiter and retries 429s / 5xx responses '''
+        return lambda: call_with_rate_limit(self.model, self.supported_models[self.model], self.estimated_tokens(), self.timed(fetch))
+
+    def arate_limited(self, fetch):
+        ''' Async version of rate_limited '''
+        return lambda: acall_with_rate_limit(self.model, self.supported_models[self.model], self.estimated_tokens(), self.timed(fetch))
+
+    def timed(self, fetch):
+        ''' Wraps fetch() so the moment the first attempt leaves the rate limiter is recorded '''
+        def timed_fetch():
+            if self.sent_at is None:
+                self.sent_at = time.perf_counter()
+            return fetch()
+        return timed_fetch
+
+    def begin_request(self) -> None:
+        ''' Resets the per request metadata and starts the clock, queue wait runs until the request is sent '''
+        self.response_meta = {"cache_hit": False}
+        self.request_start = time.perf_counter()
+        self.sent_at = None
+
+    def end_timing(self) -> None:
+        ''' Records queue wait (runner slots plus rate limiter) and the latency from sending to the last byte '''
+        sent_at = self.sent_at if self.sent_at is not None else self.request_start
+        self.response_meta.update(queue_wait_seconds=self.queue_wait_seconds + sent_at - self.request_start,
+                                  latency_seconds=time.perf_counter() - sent_at)
+
+    def cached_response(self, api:str, temperature:float | None, provider_options:dict, fetch) -> str:
+        ''' Returns the cached response for this request if there is one, otherwise calls fetch() and caches its result '''
+        fetch = self.rate_limited(fetch)
+        self.begin_request()
+
+        message_text = self.cached_text(api, temperature, provider_options)
+        if message_text is not None:
+            self.end_timing()
+            return message_text
+
+        message_text = fetch()
+        self.end_timing()
+        self.store_response(api, temperature, provider_options, message_text)
+        return message_text
+
+    async def acached_response(self, api:str, temperature:float | None, provider_options:dict, fetch) -> str:
+        ''' Async version of cached_response, fetch is a coroutine function '''
+        fetch = self.arate_limited(fetch)
+        self.begin_request()
+
+        message_text = self.cached_text(api, temperature, provider_options)
+        if message_text is not None:
+            self.end_timing()
+            return message_text
+
+        message_text = await fetch()
+        self.end_timing()
+        self.store_response(api, temperature, provider_options, message_text)
+        return message_text
+
+    def semantic_scope(self) -> str:
+        return self.semantic_cache.make_scope(self.model, self.country, self.system_prompt)
+
+    def cached_text(self, api:str, temperature:float | None, provider_options:dict) -> str | None:
+        '''
+        The cached response for this request, None on a miss or when the caches are bypassed. The exact
+        response cache is tried first, then the semantic cache, whose closest match is recorded in the
+        response metadata even when the cache only flags it
+        '''
+        if self.refresh:
+            return None
+
+        if self.cache is not None:
+            message_text = self.cache.get(self.cache_key(api, temperature, provider_options))
+            if message_text is not None:
+                logging.info(f"Cache hit for {self.model} prompt {self.prompt_number} ({self.country})")
+                self.response_meta["cache_hit"] = True
+                return message_text
+
+        if self.semantic_cache is not None:
+            match = self.semantic_cache.lookup(self.semantic_scope(), self.user_prompt)
+            if match is not None:
+                self.response_meta.update(semantic_similarity=round(match.similarity, 4), semantic_match=match.user_prompt)
+                if self.semantic_cache.serves:
+                    logging.info(f"Semantic cache hit ({match.similarity:.3f}) for {self.model} prompt {self.prompt_number} ({self.country})")
+                    self.response_meta.update(cache_hit=True, semantic_hit=True)
+                    return match.response
+        return None
+
+    def store_response(self, api:str, temperature:float | None, provider_options:dict, message_text:str) -> None:
+        ''' Adds a freshly fetched response to the response cache and the semantic cache '''
+        if self.cache is not None:
+            self.cache.put(self.cache_key(api, temperature, provider_options), self.model, message_text)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(self.semantic_scope(), self.user_prompt, message_text)
+
+    @staticmethod
+    def open_stream(factory) -> tuple[tuple[str, list | None] | None, Iterator]:
+        '''
+        Starts the stream and waits for its first chunk, so a request that fails or is
+        throttled before any text arrived can still be retried by the rate limiter
+        '''
+        chunks = iter(factory())
+        return next(chunks, None), chunks
+
+    @staticmethod
+    async def aopen_stream(factory) -> tuple[tuple[str, list | None] | None, AsyncIterator]:
+        ''' Async version of open_stream '''
+        chunks = aiter(factory())
+        return await anext(chunks, None), chunks
+
+    def open_sink(self, output_kind:str):
+        ''' Where a streamed response goes: the result store if there is one, otherwise the legacy .txt file '''
+        if self.result_store is not None:
+            return self.result_store.open_stream(self.record_fields(output_kind))
+        filename = output_filename(output_kind, self.model, self.country, date.today(), self.prompt_number, self.outfile_comment)
+        return TextFileSink(f"model_output/{self.country}/{filename}")
+
+    def token_counts(self, message_text:str) -> dict:
+        ''' Prompt and completion token counts estimated with tiktoken, for providers that report no usage '''
+        return {"prompt_tokens": self.prompt_token_count(),
+                "completion_tokens": count_tokens(message_text, self.model),
+                "cached_tokens": 0}
+
+    def response_metrics(self, message_text:str) -> dict:
+        ''' Metadata stored with a finished response: timings, token usage and estimated cost '''
+        meta = {**self.token_counts(message_text), **self.response_meta}
+        meta["cost_usd"] = 0.0 if meta.get("cache_hit") else estimate_cost(self.model, meta["prompt_tokens"], meta["completion_tokens"], meta["cached_tokens"])
+        # What the provider's prompt cache saved compared with sending every prompt token cold
+        full_cost = estimate_cost(self.model, meta["prompt_tokens"], meta["completion_tokens"])
+        meta["cache_savings_usd"] = 0.0 if meta.get("cache_hit") or full_cost is None else full_cost - meta["cost_usd"]
+        return meta
+
+    def record_metrics(self, meta:dict, status:str = "ok") -> None:
+        ''' Adds this request to the process wide metrics registry '''
+        get_metrics_registry().record({"model": self.model,
+                                       "country": self.country,
+                                       "prompt_number": self.prompt_number,
+                                       "system_prompt_number": self.system_prompt_number,
+                                       "status": status,
+                                       "cache_hit": meta.get("cache_hit", False),
+                                       # Part of the prompt was served from the provider's prompt cache
+                                       "prompt_cached": bool(meta.get("cached_tokens")),
+                                       "semantic_hit": meta.get("semantic_hit", False),
+                                       "semantic_similarity": meta.get("semantic_similarity"),
+                                       **{name: meta.get(name) for name in TIMINGS + TOKEN_KINDS + ("cost_usd", "cache_savings_usd")}})
+
+    def start_stream(self, first, real_estate_questions:bool):
+        ''' Records the time to first token and opens the output sink once the first chunk has arrived '''
+        self.response_meta["ttft_seconds"] = time.perf_counter() - self.sent_at
+        sink = self.open_sink("real_estate_questions" if real_estate_questions else "data_collection")
+        if not real_estate_questions:
+            print(f"{self.model}'s response: \n")
+        return sink, [], [], first is None
+
+    def write_chunk(self, sink, chunk:tuple[str, list | None], parts:list, citations:list, echo:bool) -> None:
+        ''' Writes one streamed chunk to the sink (and console), keeping the latest citations the provider sent '''
+        text, chunk_citations = chunk
+        if chunk_citations:
+            citations[:] = chunk_citations
+        if text:
+            sink.write(text)
+            parts.append(text)
+            if echo:
+                print(text, end="", flush=True)
+
+    def finish_stream(self, sink, api:str, temperature:float | None, provider_options:dict, parts:list, citations:list, echo:bool) -> str:
+        ''' Appends the citations trailer, closes the sink with the request metadata and caches the full text '''
+        self.end_timing()
+        if citations:
+            self.response_meta["citations"] = citations
+            sink.write_citations(citations)
+            if echo:
+                print(citations_trailer(citations), end="")
+        if echo:
+            print()
+
+        message_text = "".join(parts) + citations_trailer(citations)
+        meta = self.response_metrics("".join(parts))
+        sink.close(meta, message_text, citations)
+        self.record_metrics(meta)
+        self.store_response(api, temperature, provider_options, message_text)
+        return message_text
+
+    def stream_response(self, api:str, temperature:float | None, provider_options:dict, factory, real_estate_questions:bool=False) -> str:
+        '''
+        Unified streaming path for every provider: factory() returns an iterator of
+        (text, citations) chunks, which are written to the output sink as they arrive.
+        A cached answer is written in one go instead.
+        '''
+        self.begin_request()
+
+        message_text = self.cached_text(api, temperature, provider_options)
+        if message_text is not None:
+            self.end_timing()
+            self.write_response(message_text, real_estate_questions)
+            return message_text
+
+        try:
+            first, chunks = self.rate_limited(lambda: self.open_stream(factory))()
+        except Exception:
+            self.end_timing()
+            self.record_metrics(self.response_meta, "error")
+            raise
+        sink, parts, citations, done = self.start_stream(first, real_estate_questions)
+        echo = not real_estate_questions
+        try:
+            if not done:
+                self.write_chunk(sink, first, parts, citations, echo)
+                for chunk in chunks:
+                    self.write_chunk(sink, chunk, parts, citations, echo)
+        except BaseException:
+            # Whatever arrived is kept, the closing record marks the response as incomplete
+            self.end_timing()
+            sink.close({**self.response_meta, "incomplete": True}, "".join(parts), citations)
+            self.record_metrics(self.response_meta, "error")
+            raise
+        return self.finish_stream(sink, api, temperature, provider_options, parts, citations, echo)
+
+    async def astream_response(self, api:str, temperature:float | None, provider_options:dict, factory, real_estate_questions:bool=False) -> str:
+        ''' Async version of stream_response, factory() returns an async iterator of (text, citations) chunks '''
+        self.begin_request()
+
+        message_text = self.cached_text(api, temperature, provider_options)
+        if message_text is not None:
+            self.end_timing()
+            self.write_response(message_text, real_estate_questions)
+            return message_text
+
+        try:
+            first, chunks = await self.arate_limited(lambda: self.aopen_stream(factory))()
+        except Exception:
+            self.end_timing()
+            self.record_metrics(self.response_meta, "error")
+            raise
+        sink, parts, citations, done = self.start_stream(first, real_estate_questions)
+        echo = not real_estate_questions
+        try:
+            if not done:
+                self.write_chunk(sink, first, parts, citations, echo)
+                async for chunk in chunks:
+                    self.write_chunk(sink, chunk, parts, citations, echo)
+        except BaseException:
+            self.end_timing()
+            sink.close({**self.response_meta, "incomplete": True}, "".join(parts), citations)
+            self.record_metrics(self.response_meta, "error")
+            raise
+        return self.finish_stream(sink, api, temperature, provider_options, parts, citations, echo)
+
+    async def acollect_response(self, api:str, temperature:float | None, provider_options:dict, factory) -> str:
+        '''
+        Consumes an async stream into one string without writing it anywhere, for callers
+        that order the writes themselves (AsyncQueryRunner)
+        '''
+        async def fetch() -> str:
+            parts, citations = [], []
+            async for text, chunk_citations in factory():
+                if "ttft_seconds" not in self.response_meta:
+                    self.response_meta["ttft_seconds"] = time.perf_counter() - self.sent_at
+                if chunk_citations:
+                    citations = chunk_citations
+                parts.append(text)
+            if citations:
+                self.response_meta["citations"] = citations
+            return "".join(parts) + citations_trailer(citations)
+
+        return await self.acached_response(api, temperature, provider_options, fetch)
+
+    def write_response(self, message_text:str, real_estate_questions:bool=False) -> None:
+        ''' Routes a finished response to the result store, or to the matching output file without one '''
+        output_kind = "real_estate_questions" if real_estate_questions else "data_collection"
+
+        meta = self.response_metrics(message_text)
+        self.record_metrics(meta)
+
+        if self.result_store is None:
+            self.write_output(output_kind, message_text)
+            return
+
+        self.result_store.append({"record_type": "response",
+                                  **self.record_fields(output_kind),
+                                  **meta,
+                                  "response": message_text})
+        if not real_estate_questions:
+            print(message_text)
+
+    def build_langchain_chain(self):
+        ''' Returns the shared prompt | chat chain for the provider of the selected model '''
+        return get_prompt_chain(provider_for_model(self.model), self.model, self.supported_models[self.model])
+
+    def chain_inputs(self) -> dict:
+        ''' Variables fed to the shared prompt chain '''
+        return {"system": self.system_prompt, "input": self.user_prompt}
 
     def query_perplexity_langchain(self, real_estate_questions:bool=False) -> None:
         ''' Querys perplexity via API and langchain functionality, allows for extraction of citations., and more comprehensive functionality '''
-
-        chat = ChatPerplexity(temperature=0, pplx_api_key=self.supported_models[self.model], model=self.model)
-        system = self.system_prompt
-        human = "{input}"
-        prompt = ChatPromptTemplate.from_messages([("system", system), ("human", human)])
-        
-        chain = prompt | chat
-        response = chain.invoke({"input": self.user_prompt})
-        print("Perplexity's response: \n")
-        print(response.content)
-
-        message_text = response.content + "\n\n"
-
-        print("Citations: \n")
-        # citations = response.model_extra.get("citations")
-        citations = response.additional_kwargs['citations']
-        if citations:
-            print("\nCitations:")
-            message_text += "Citations:\n"
-            for citation in citations:
-                print(citation)
-                message_text += f"{citation}\n"
-
-
-        if real_estate_questions:
-            self.write_to_real_estate_questions_file(self.model, self.country, message_text, self.prompt_number, self.outfile_comment)
-        else:
-            self.write_to_file(self.model, self.country, message_text, self.prompt_number)
+        self.stream_response("langchain.stream", 0, {}, self.langchain_stream, real_estate_questions)
 
 
     def query_openai_langchain(self, real_estate_questions:bool=False) -> None:
         ''' Querys OpenAI via API and langchain functionality '''
-
-        chat = ChatOpenAI(temperature=0, openai_api_key=self.supported_models[self.model], model=self.model)
-        system = self.system_prompt
-        human = "{input}"
-        prompt = ChatPromptTemplate.from_messages([("system", system), ("human", human)])
-        
-        chain = prompt | chat
-        response = chain.invoke({"input": self.user_prompt})
-        print(f"{self.model}'s response: \n")
-        print(response.content)
-
-        message_text = response.content + "\n\n"
-
-        print("Citations: \n")
-        # citations = response.model_extra.get("citations")
-        citations = response.additional_kwargs.get('citations',[])
-        if citations:
-            print("\nCitations:")
-            message_text += "Citations:\n"
-            for citation in citations:
-                print(citation)
-                message_text += f"{citation}\n"
-
-
-        if real_estate_questions:
-            self.write_to_real_estate_questions_file(self.model, self.country, message_text, self.prompt_number, self.outfile_comment)
-        else:
-            self.write_to_file(self.model, self.country, message_text, self.prompt_number)
+        self.stream_response("langchain.stream", 0, {}, self.langchain_stream, real_estate_questions)
 
     def query_gemini_langchain(self, real_estate_questions:bool=False) -> None:
         ''' Querys Google models via API and langchain functionality '''
+        self.stream_response("langchain.stream", 0, {}, self.langchain_stream, real_estate_questions)
 
-        chat = ChatGoogleGenerativeAI(temperature=0, google_api_key=self.supported_models[self.model], model=self.model,
-                                      max_tokens=None, timeout=120, safety_settings=safety_settings)
-
-        system = self.system_prompt
-        human = "{input}"
-        prompt = ChatPromptTemplate.from_messages([("system", system), ("human", human)])
-        
-        chain = prompt | chat
-        # response = chain.invoke({"input": self.user_prompt})
-        response = chain.stream({"input": self.user_prompt})
-
-        message_text = "\n"
-        print(f"{self.model}'s response: \n")
-        print("Assistant: ", end="")
-        for chunk in response:
-            print(chunk.content, end="")
-            message_text += chunk.content
-        
-        print() # for a new line at the end
-
-        # print(response.content)
-
-        # message_text = response.content + "\n\n"
-
-        # print("Citations: \n")
-        # # citations = response.model_extra.get("citations")
-        # citations = response.additional_kwargs.get('citations',[])
-        # if citations:
-        #     print("\nCitations:")
-        #     message_text += "Citations:\n"
-        #     for citation in citations:
-        #         print(citation)
-        #         message_text += f"{citation}\n"
-
-
-        if real_estate_questions:
-            self.write_to_real_estate_questions_file(self.model, self.country, message_text, self.prompt_number, self.outfile_comment)
-        else:
-            self.write_to_file(self.model, self.country, message_text, self.prompt_number)
+    async def aquery_perplexity_langchain(self, real_estate_questions:bool=False, write:bool=True) -> str:
+        ''' Async counterpart of query_perplexity_langchain, consumes chain.astream instead of blocking '''
+        if write:
+            return await self.astream_response("langchain.stream", 0, {}, self.alangchain_stream, real_estate_questions)
+        return await self.acollect_response("langchain.stream", 0, {}, self.alangchain_stream)
 
+    async def aquery_openai_langchain(self, real_estate_questions:bool=False, write:bool=True) -> str:
+        ''' Async counterpart of query_openai_langchain, consumes chain.astream instead of blocking '''
+        if write:
+            return await self.astream_response("langchain.stream", 0, {}, self.alangchain_stream, real_estate_questions)
+        return await self.acollect_response("langchain.stream", 0, {}, self.alangchain_stream)
 
+    async def aquery_gemini_langchain(self, real_estate_questions:bool=False, write:bool=True) -> str:
+        ''' Async counterpart of query_gemini_langchain, consumes chain.astream '''
+        if write:
+            return await self.astream_response("langchain.stream", 0, {}, self.alangchain_stream, real_estate_questions)
+        return await self.acollect_response("langchain.stream", 0, {}, self.alangchain_stream)
 
 
     def query_model(self, real_estate_questions:bool=False) -> None:
@@ -377,7 +607,7 @@ number_of_professionals:
         elif "sonar" in self.model:
             self.query_perplexity(real_estate_questions)
         else:
-            print("No valid model selected, try again")
+            raise TypeError(f"No query path for model {self.model}, try again")
 
 
     def query_model_langchain(self, real_estate_questions:bool=False) -> None:
@@ -390,10 +620,17 @@ number_of_professionals:
         elif "gemini" in self.model:
             self.query_gemini_langchain(real_estate_questions)
         else:
-            print("No valid model selected, try again")
-
-
-
-
-
-
+            raise TypeError(f"No query path for model {self.model}, try again")
+
+    async def aquery_model_langchain(self, real_estate_questions:bool=False, write:bool=True) -> str:
+        ''' Async version of query_model_langchain, returns the response text so callers can order the writes '''
+
+        provider = provider_for_model(self.model)
+        if provider == "openai":
+            return await self.aquery_openai_langchain(real_estate_questions, write)
+        elif provider == "perplexity":
+            return await self.aquery_perplexity_langchain(real_estate_questions, write)
+        elif provider == "gemini":
+            return await self.aquery_gemini_langchain(real_estate_questions, write)
+        else:
+            raise TypeError(f"No async path for model {self.model}, try again")
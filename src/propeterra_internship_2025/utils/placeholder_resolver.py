@@ -0,0 +1,179 @@
+'''
+Single pass resolver for the 100/1000 real estate questions.
+
+A question looks like "Property Prices & Market Trends, What is the average price in [city]?".
+One Aho-Corasick automaton over every question type, every placeholder and the bare brackets
+finds all of them in a single scan of the text. That scan classifies the question, splits off the
+question text and records where each placeholder sits, so it only happens once per distinct
+question. Rendering it for a country is then a join of the literal segments and the country values.
+Brackets that are not a known placeholder are reported as unresolved instead of being rescanned for.
+'''
+from collections import deque
+from functools import lru_cache
+from typing import Iterable, Iterator
+
+
+QUESTION_TYPES = [
+    "Commercial vs. Residential Real Estate,",
+    "Country-Specific Real Estate Queries,",
+    "Future Market Predictions & Trends,",
+    "Investment Strategy & ROI,",
+    "Macroeconomic & Regulatory Impacts,",
+    "Property Management & Rental Markets,",
+    "Property Prices & Market Trends,",
+    "Real Estate Financing & Mortgages,",
+    "Technology & AI in Real Estate,",
+    "Zoning, Development, and Infrastructure,"
+]
+
+# Placeholder in the question text -> the country value it is filled with
+PLACEHOLDERS = {"[country]": "country",
+                "[region]": "region",
+                "[city/country]": "country",
+                "[city]": "capital",
+                "[location]": "capital",
+                "__country_of_interest__": "country"}
+
+DEFAULT_REGION = "Latin America"
+
+# Longest text an unknown [placeholder] is reported with
+MAX_UNRESOLVED_LENGTH = 40
+
+
+class AhoCorasick():
+    ''' Automaton that finds every occurrence of a set of patterns in one pass over the text '''
+
+    def __init__(self, patterns:Iterable[str]):
+        self.patterns = list(dict.fromkeys(patterns))
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail = [0]
+        self.output: list[list[int]] = [[]]
+
+        for pattern_idx, pattern in enumerate(self.patterns):
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].append(pattern_idx)
+
+        # Breadth first, so the failure link of a node's parent is known before the node itself
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if node else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def iter_matches(self, text:str) -> Iterator[tuple[int, int, str]]:
+        ''' Yields (start, end, pattern) for every occurrence, overlapping ones included '''
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for pattern_idx in self.output[node]:
+                pattern = self.patterns[pattern_idx]
+                yield position + 1 - len(pattern), position + 1, pattern
+
+    def leftmost_longest(self, text:str) -> list[tuple[int, int, str]]:
+        ''' Non overlapping matches, preferring the earliest and then the longest one '''
+        chosen = []
+        end_of_last = 0
+        for start, end, pattern in sorted(self.iter_matches(text), key=lambda match: (match[0], -match[1])):
+            if start >= end_of_last:
+                chosen.append((start, end, pattern))
+                end_of_last = end
+        return chosen
+
+
+@lru_cache(maxsize=None)
+def question_matcher() -> AhoCorasick:
+    ''' The automaton over every question type, placeholder and bracket, built on the first question instead of at import '''
+    return AhoCorasick(QUESTION_TYPES + list(PLACEHOLDERS) + ["[", "]"])
+
+
+class CompiledQuestion():
+    '''
+    A question split into its type, literal segments and country slots.
+    segments has one more entry than slots. unresolved lists the bracketed text that is
+    not a known placeholder, it is the same for every country.
+    '''
+
+    def __init__(self, question_type:str | None, segments:list[str], slots:list[str], unresolved:tuple[str, ...]):
+        self.question_type = question_type
+        self.segments = segments
+        self.slots = slots
+        self.unresolved = unresolved
+        self.values_needed = frozenset(PLACEHOLDERS[slot] for slot in slots)
+
+        # The segments and slots as one format string, so rendering runs in C
+        escaped = [segment.replace("{", "{{").replace("}", "}}") for segment in segments]
+        self.format_string = escaped[0] + "".join("{" + PLACEHOLDERS[slot] + "}" + segment for slot, segment in zip(slots, escaped[1:]))
+
+    def render(self, values:dict[str, str | None]) -> tuple[str, tuple[str, ...]]:
+        '''
+        Fills the slots with the country values and returns the text plus every placeholder
+        left unresolved, including those whose value is unknown for this country (e.g. no capital)
+        '''
+        if None not in values.values() or all(values.get(name) is not None for name in self.values_needed):
+            return self.format_string.format_map(values), self.unresolved
+
+        parts = [self.segments[0]]
+        unresolved = list(self.unresolved)
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            value = values.get(PLACEHOLDERS[slot])
+            if value is None:
+                unresolved.append(slot)
+                value = slot
+            parts.append(value)
+            parts.append(segment)
+        return "".join(parts), tuple(unresolved)
+
+
+@lru_cache(maxsize=4096)
+def compile_question(text:str) -> CompiledQuestion:
+    ''' Scans a question once: classifies it, cuts off the type prefix and locates every placeholder '''
+    matches = question_matcher().leftmost_longest(text)
+
+    # The question type listed last wins, and the question is the text after its first occurrence
+    # (up to a second occurrence), like the str.split based parsing this replaces
+    occurrences = {}
+    for start, end, pattern in matches:
+        if pattern in QUESTION_TYPES:
+            occurrences.setdefault(pattern, []).append((start, end))
+    question_type = max(occurrences, key=QUESTION_TYPES.index, default=None)
+
+    begin, finish = 0, len(text)
+    if question_type is not None:
+        begin = occurrences[question_type][0][1]
+        if len(occurrences[question_type]) > 1:
+            finish = occurrences[question_type][1][0]
+
+    segments, slots, unresolved = [], [], []
+    position = begin
+    # End of the last unknown [placeholder] reported, its closing bracket is not reported again
+    reported_until = begin
+    for start, end, pattern in matches:
+        if start < begin or end > finish or pattern not in PLACEHOLDERS and pattern not in ("[", "]"):
+            continue
+        if pattern in PLACEHOLDERS:
+            segments.append(text[position:start])
+            slots.append(pattern)
+            position = end
+        elif pattern == "[":
+            closing = text.find("]", start, min(finish, start + MAX_UNRESOLVED_LENGTH))
+            unresolved.append(text[start:closing + 1] if closing != -1 else "[")
+            reported_until = closing + 1 if closing != -1 else end
+        elif start >= reported_until:
+            unresolved.append("]")
+    segments.append(text[position:finish])
+
+    return CompiledQuestion(question_type, segments, slots, tuple(unresolved))
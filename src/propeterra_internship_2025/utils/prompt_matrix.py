@@ -0,0 +1,153 @@
+'''
+Bulk generation of the country x prompt x system prompt matrix for later submission or review.
+
+Countries that appear in several regions (Mexico, Cuba, most of the Middle East, ...) are
+rendered once. The countries are split into chunks rendered by a pool of worker processes with
+render_many, and every prompt is written as one line of a gzip compressed JSONL file with the
+sha256 of its rendered text. A later run compares those hashes with the previous file, so only
+new or changed prompts need to be submitted or reviewed again.
+'''
+import os
+import gzip
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+from propeterra_internship_2025.data.country_catalog import get_country_catalog
+from propeterra_internship_2025.utils.prompt_templates import render_many
+
+
+# Countries per task handed to a worker process
+CHUNK_SIZE = 8
+
+# Status of a prompt compared with the previous matrix file
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+# (country, prompt number, system prompt number)
+MatrixKey = tuple[str, int, int]
+
+
+def matrix_countries(region_names:Iterable[str]) -> dict[str, list[str]]:
+    ''' Every country of the given regions once, in region order, mapped to all the selected regions it belongs to '''
+    countries: dict[str, list[str]] = {}
+    for region in region_names:
+        for country in get_country_catalog().region(region):
+            countries.setdefault(country, []).append(region)
+    return countries
+
+
+def parse_number_list(spec:str, choices:Iterable[int]) -> list[int]:
+    ''' Parses a "1-7,12" style command line option, "all" (or nothing) selects every choice '''
+    choices = list(choices)
+    if not spec or spec == "all":
+        return choices
+
+    numbers = []
+    for entry in spec.split(","):
+        first, _, last = entry.strip().partition("-")
+        numbers += range(int(first), int(last or first) + 1)
+    numbers = list(dict.fromkeys(numbers))
+
+    unknown = [number for number in numbers if number not in choices]
+    if unknown:
+        raise ValueError(f"Unknown prompt numbers {unknown}, choose from {choices}")
+    return numbers
+
+
+def prompt_hash(system_prompt:str, user_prompt:str) -> str:
+    ''' Content hash of a rendered prompt, the separator keeps ("ab", "c") and ("a", "bc") apart '''
+    return hashlib.sha256(f"{system_prompt}\0{user_prompt}".encode("utf8")).hexdigest()
+
+
+def render_chunk(countries:list[str], prompt_nums:list[int], system_prompt_nums:list[int], n_sources:int,
+                 model:str | None, link_token_budget:int | None, professional:bool, cache_layout:bool) -> list[dict]:
+    ''' Renders, hashes and counts the tokens of the matrix of one chunk of countries, runs in a worker process '''
+    rendered = render_many(countries, prompt_nums, system_prompt_nums, n_sources, professional=professional,
+                           model=model, link_token_budget=link_token_budget, cache_layout=cache_layout)
+    return [{"country": country,
+             "prompt_num": prompt_num,
+             "system_prompt_num": system_prompt_num,
+             "hash": prompt_hash(*prompt),
+             "estimated_tokens": prompt.estimated_tokens,
+             "system_prompt": prompt.system_prompt,
+             "user_prompt": prompt.user_prompt}
+            for (country, prompt_num, system_prompt_num), prompt in rendered.items()]
+
+
+def generate_prompt_matrix(countries:dict[str, list[str]], prompt_nums:list[int], system_prompt_nums:list[int], n_sources:int = 15,
+                           model:str | None = None, link_token_budget:int | None = None, professional:bool = False,
+                           cache_layout:bool = False, workers:int | None = None, chunk_size:int = CHUNK_SIZE) -> list[dict]:
+    '''
+    Renders the full matrix across worker processes. The records come back in country, prompt,
+    system prompt order whatever the number of workers, so the output file is reproducible.
+    workers=1 renders in this process.
+    '''
+    names = list(countries)
+    chunks = [names[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+    arguments = (prompt_nums, system_prompt_nums, n_sources, model, link_token_budget, professional, cache_layout)
+
+    if workers == 1 or len(chunks) <= 1:
+        results = [render_chunk(chunk, *arguments) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(render_chunk, chunks, *[[argument] * len(chunks) for argument in arguments]))
+
+    records = []
+    for chunk_records in results:
+        for record in chunk_records:
+            record["regions"] = countries[record["country"]]
+            record["model"] = model
+            record["n_sources"] = n_sources
+            records.append(record)
+    return records
+
+
+def matrix_key(record:dict) -> MatrixKey:
+    return (record["country"], record["prompt_num"], record["system_prompt_num"])
+
+
+def iter_prompt_matrix(path:str) -> Iterator[dict]:
+    ''' The records of a matrix file, one per line '''
+    with gzip.open(path, "rt", encoding="utf8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_prompt_hashes(path:str) -> dict[MatrixKey, str]:
+    ''' The content hash of every prompt in a previous matrix file, empty if there is none '''
+    if not os.path.exists(path):
+        return {}
+    return {matrix_key(record): record["hash"] for record in iter_prompt_matrix(path)}
+
+
+def mark_changes(records:list[dict], previous_hashes:dict[MatrixKey, str]) -> dict[str, int]:
+    ''' Sets the status of every record against the previous hashes and returns how many have each status '''
+    counts = {NEW: 0, CHANGED: 0, UNCHANGED: 0}
+    for record in records:
+        previous = previous_hashes.get(matrix_key(record))
+        if previous is None:
+            record["status"] = NEW
+        elif previous != record["hash"]:
+            record["status"] = CHANGED
+        else:
+            record["status"] = UNCHANGED
+        counts[record["status"]] += 1
+    return counts
+
+
+def write_prompt_matrix(path:str, records:Iterable[dict]) -> None:
+    ''' Writes the records as gzip compressed JSONL, atomically so an interrupted run keeps the previous file '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # mtime=0 keeps the file byte for byte identical when no prompt changed
+    with open(tmp_path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as compressed:
+        for record in records:
+            compressed.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf8"))
+    os.replace(tmp_path, path)
@@ -1,27 +1,249 @@
-from propeterra_internship_2025.data.all_countries      import country_capitals
-from propeterra_internship_2025.utils.system_prompts    import system_prompt_dictionary
-from propeterra_internship_2025.data.reference_material import clean_reference_material, unclean_reference_material, country_languages
-from propeterra_internship_2025.utils.user_prompts      import user_prompt_dictionary, real_estate_professionals_prompt_dictionary
+import re
+from functools import lru_cache, cached_property
+from typing import Iterable
+
+from propeterra_internship_2025.data.country_catalog    import get_country_catalog
+from propeterra_internship_2025.utils.helpers           import lazy_import
+from propeterra_internship_2025.utils.metrics           import MODEL_PRICES
+from propeterra_internship_2025.utils.placeholder_resolver import compile_question, DEFAULT_REGION
+from propeterra_internship_2025.utils.token_counting    import count_tokens, DEFAULT_TOKEN_MODEL
+
+# The country data, reference links and prompt texts are only loaded once a prompt is rendered
+reference_data = lazy_import("propeterra_internship_2025.data.reference_material")
+system_prompts = lazy_import("propeterra_internship_2025.utils.system_prompts")
+user_prompts = lazy_import("propeterra_internship_2025.utils.user_prompts")
+
+# Placeholders filled in by the prompt builder, written as __name__ in the templates
+PLACEHOLDER_PATTERN = re.compile(r"__(num_sources|country_of_interest|native_language|links|prompt_num)__")
+ALL_SLOTS = frozenset(("num_sources", "country_of_interest", "native_language", "links", "prompt_num"))
+
+# Which placeholders each kind of prompt fills, anything else is left in the text as is
+PROFESSIONAL_USER_SLOTS = frozenset(("num_sources", "country_of_interest", "prompt_num"))
+QUESTION_SYSTEM_SLOTS = frozenset(("country_of_interest",))
+
+N_REFERENCE_LINKS = 30
+
+# Reference links are the bulk of a research prompt's input tokens. LINK_SPEND_USD is what they may add to
+# the input cost of one request, each model's budget is the tokens that buys at its input price in
+# MODEL_PRICES: the cheap models get the whole curated list (about 500 tokens), the expensive ones only
+# the links at the top of it. Models without a price keep the first N_REFERENCE_LINKS links.
+LINK_SPEND_USD = 0.0008
+LINK_TOKEN_BUDGETS = {model: round(LINK_SPEND_USD * 1_000_000 / prices[0]) for model, prices in MODEL_PRICES.items()}
+
+# Provider prompt caching matches on the longest identical prefix of the request. With cache_layout the
+# reference links move from the middle of the user prompt to the end of the system prompt, so the
+# system prompt and links form one prefix that is byte for byte the same for every request that
+# shares them, and only the question after it varies.
+REFERENCE_LINKS_HEADER = "\n\nReference links:\n"
+LINKS_IN_SYSTEM_PROMPT = "(the reference links are listed in the system prompt)"
+
+
+class RenderedPrompt(tuple):
+    '''
+    A (system_prompt, user_prompt) pair that still unpacks like the plain tuples the prompt
+    builders used to return, with what the builder learned while rendering attached:
+    the question type, any placeholders it could not resolve and the model it was rendered for
+    '''
+
+    # Class level defaults, so a prompt without any of them gets no instance dictionary (render_many builds thousands)
+    question_type: str | None = None
+    unresolved: tuple[str, ...] = ()
+    model: str | None = None
+
+    def __new__(cls, system_prompt:str, user_prompt:str, question_type:str | None = None, unresolved:tuple[str, ...] = (),
+                model:str | None = None):
+        rendered = tuple.__new__(cls, (system_prompt, user_prompt))
+        if question_type is not None:
+            rendered.question_type = question_type
+        if unresolved:
+            rendered.unresolved = unresolved
+        if model is not None:
+            rendered.model = model
+        return rendered
+
+    def __getnewargs__(self):
+        # Keeps the attributes when the prompt is pickled, e.g. to a worker process
+        return (self[0], self[1], self.question_type, self.unresolved, self.model)
+
+    @cached_property
+    def estimated_tokens(self) -> int:
+        ''' Prompt tokens of the system and user prompt for the model, encoded once '''
+        model = self.model or DEFAULT_TOKEN_MODEL
+        return count_tokens(self[0], model) + count_tokens(self[1], model)
+
+    @property
+    def system_prompt(self) -> str:
+        return self[0]
+
+    @property
+    def user_prompt(self) -> str:
+        return self[1]
+
+
+class CompiledTemplate():
+    '''
+    A prompt template split once into its literal segments and the slots between them, so
+    rendering is a single join instead of one str.replace pass over the text per placeholder.
+    segments always has one more entry than slots.
+    '''
+
+    def __init__(self, text:str, slots:frozenset = ALL_SLOTS):
+        self.segments: list[str] = []
+        self.slots: list[str] = []
+
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            if match.group(1) not in slots:
+                continue
+            self.segments.append(text[position:match.start()])
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.segments.append(text[position:])
+
+    def render(self, values:dict[str, str]) -> str:
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            parts.append(values[slot])
+            parts.append(segment)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=None)
+def compile_template(text:str, slots:frozenset = ALL_SLOTS) -> CompiledTemplate:
+    ''' Compiles a template once, the prompt dictionaries hand out the same string objects so lookups are cheap '''
+    return CompiledTemplate(text, slots)
+
+
+@lru_cache(maxsize=None)
+def reference_links_text(n_links:int = N_REFERENCE_LINKS) -> str:
+    ''' The reference links pasted into the __links__ slot, joined once per process '''
+    return " \n".join(reference_data.clean_reference_material[:n_links])
+
+
+@lru_cache(maxsize=None)
+def pack_links(model:str, budget:int) -> str:
+    '''
+    The longest run of reference links, in their curated order, that fits in `budget` tokens
+    with the model's encoding. Binary search over the number of links, so only a handful of
+    candidate blocks are encoded, and the result is cached per (model, budget).
+    '''
+    low, high = 0, len(reference_data.clean_reference_material)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" \n".join(reference_data.clean_reference_material[:middle]), model) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return " \n".join(reference_data.clean_reference_material[:low])
+
+
+def links_for(model:str | None = None, link_token_budget:int | None = None) -> str:
+    '''
+    The __links__ text for a model: packed into link_token_budget tokens if given, else into the
+    model's LINK_TOKEN_BUDGETS entry, else the first N_REFERENCE_LINKS links
+    '''
+    budget = link_token_budget if link_token_budget is not None else LINK_TOKEN_BUDGETS.get(model)
+    if budget is None:
+        return reference_links_text()
+    return pack_links(model or DEFAULT_TOKEN_MODEL, budget)
+
 
-def create_prompt(n_sources:int, country_of_interest:str, prompt_num:int, system_prompt_num:int) -> tuple[str, str]:
-    ''' Generates the prompt according to specified template "prompt_num" '''
-    prompt = Prompt(num_sources=n_sources, country_of_interest=country_of_interest, prompt_num=prompt_num, system_prompt_num=system_prompt_num)
-    n_established_prompts = len(user_prompt_dictionary)
+def link_token_budget(models:Iterable[str]) -> int | None:
+    ''' The tightest link budget of several models sharing one prompt, None if none of them has a budget '''
+    return min((LINK_TOKEN_BUDGETS[model] for model in models if model in LINK_TOKEN_BUDGETS), default=None)
+
+
+def render_pair(system_template:CompiledTemplate, user_template:CompiledTemplate, values:dict[str, str],
+                cache_layout:bool = False) -> tuple[str, str]:
+    ''' Renders a system and user template, with cache_layout the user prompt's links are appended to the system prompt instead '''
+    if not cache_layout or "links" not in user_template.slots:
+        return system_template.render(values), user_template.render(values)
+    return (system_template.render(values) + REFERENCE_LINKS_HEADER + values["links"],
+            user_template.render({**values, "links": LINKS_IN_SYSTEM_PROMPT}))
+
+
+def slot_values(country_of_interest:str, num_sources:int | str = 15, prompt_num:int = 1, links:str | None = None) -> dict[str, str]:
+    ''' Values of every placeholder for one country and prompt '''
+    return {"num_sources": str(num_sources),
+            "country_of_interest": country_of_interest,
+            "native_language": get_country_catalog().language(country_of_interest) or "",
+            "links": reference_links_text() if links is None else links,
+            "prompt_num": str(prompt_num)}
+
+
+def render_many(countries:Iterable[str], prompt_nums:Iterable[int], system_prompt_nums:Iterable[int], n_sources:int = 15,
+                professional:bool = False, model:str | None = None, link_token_budget:int | None = None,
+                cache_layout:bool = False) -> dict[tuple[str, int, int], RenderedPrompt]:
+    '''
+    Renders every (country, prompt, system prompt) combination, the same output as create_prompt
+    (or create_real_estate_professional_prompt with professional=True) for each of them.
+    Templates are compiled, the links packed and the country values looked up once for the whole matrix.
+    '''
+    user_dictionary = user_prompts.real_estate_professionals_prompt_dictionary if professional else user_prompts.user_prompt_dictionary
+    user_slots = PROFESSIONAL_USER_SLOTS if professional else ALL_SLOTS
+    prompt_nums, system_prompt_nums = list(prompt_nums), list(system_prompt_nums)
+
+    for prompt_num in prompt_nums:
+        if prompt_num not in user_dictionary:
+            raise ValueError(f"Prompt {prompt_num} is not defined")
+    for system_prompt_num in system_prompt_nums:
+        if system_prompt_num not in system_prompts.system_prompt_dictionary:
+            raise ValueError(f"System prompt {system_prompt_num} is not defined")
+
+    user_templates = {prompt_num: compile_template(user_dictionary[prompt_num], user_slots) for prompt_num in prompt_nums}
+    system_templates = {system_prompt_num: compile_template(system_prompts.system_prompt_dictionary[system_prompt_num]) for system_prompt_num in system_prompt_nums}
+
+    links = links_for(model, link_token_budget)
+    new_tuple = tuple.__new__
+    rendered = {}
+    for country in countries:
+        values = slot_values(country, n_sources, links=links)
+        for prompt_num in prompt_nums:
+            values["prompt_num"] = str(prompt_num)
+            # The user prompt does not depend on the system prompt, it is rendered once for all of them
+            user_template = user_templates[prompt_num]
+            if cache_layout and "links" in user_template.slots:
+                user_prompt = user_template.render({**values, "links": LINKS_IN_SYSTEM_PROMPT})
+                links_suffix = REFERENCE_LINKS_HEADER + links
+            else:
+                user_prompt = user_template.render(values)
+                links_suffix = ""
+            for system_prompt_num in system_prompt_nums:
+                # tuple.__new__ directly skips the Python level RenderedPrompt.__new__ call for every render
+                prompt = new_tuple(RenderedPrompt, (system_templates[system_prompt_num].render(values) + links_suffix, user_prompt))
+                if model is not None:
+                    prompt.model = model
+                rendered[(country, prompt_num, system_prompt_num)] = prompt
+    return rendered
+
+
+def create_prompt(n_sources:int, country_of_interest:str, prompt_num:int, system_prompt_num:int, model:str | None = None,
+                  link_token_budget:int | None = None, cache_layout:bool = False) -> RenderedPrompt:
+    '''
+    Generates the prompt according to specified template "prompt_num". With a model (or an explicit
+    link_token_budget) the reference links are packed into that model's token budget, with
+    cache_layout they are moved behind the system prompt so providers can cache the shared prefix.
+    '''
+    prompt = Prompt(num_sources=n_sources, country_of_interest=country_of_interest, prompt_num=prompt_num, system_prompt_num=system_prompt_num,
+                    model=model, link_token_budget=link_token_budget, cache_layout=cache_layout)
+    n_established_prompts = len(user_prompts.user_prompt_dictionary)
 
     if prompt_num > n_established_prompts:
         raise ValueError(f'Prompts above {n_established_prompts} are not supported yet')
 
     return prompt.construct_prompt()
 
-def create_real_estate_question_prompt(country_of_interest:str, system_prompt_num:int, user_prompt:str) -> tuple[str, str]:
-    ''' Generates the prompt for real estate questions for a given country '''
-    prompt = Prompt(country_of_interest=country_of_interest, system_prompt_num=system_prompt_num, user_prompt=user_prompt)
+def create_real_estate_question_prompt(country_of_interest:str, system_prompt_num:int, user_prompt:str, model:str | None = None,
+                                       link_token_budget:int | None = None) -> RenderedPrompt:
+    ''' Generates the prompt for real estate questions for a given country, see create_prompt for model and link_token_budget '''
+    prompt = Prompt(country_of_interest=country_of_interest, system_prompt_num=system_prompt_num, user_prompt=user_prompt, model=model,
+                    link_token_budget=link_token_budget)
     return prompt.construct_real_estate_question_prompt()
 
 
-def create_real_estate_professional_prompt(country_of_interest:str, system_prompt_num:int, prompt_num:int) -> tuple[str, str]:
+def create_real_estate_professional_prompt(country_of_interest:str, system_prompt_num:int, prompt_num:int, model:str | None = None) -> RenderedPrompt:
     ''' Generates the prompt for real estate questions for a given country '''
-    prompt = Prompt(country_of_interest=country_of_interest, system_prompt_num=system_prompt_num, prompt_num=prompt_num)
+    prompt = Prompt(country_of_interest=country_of_interest, system_prompt_num=system_prompt_num, prompt_num=prompt_num, model=model)
     return prompt.construct_real_estate_professional_prompt()
 
 class Prompt:
@@ -29,19 +251,35 @@ class Prompt:
     Class that will allow one to develop a number of prompts as well
     as construct the prompt according to the region of interest and specify how many links to 
     '''
-    def __init__(self, num_sources:int=15, country_of_interest:str="Mexico", prompt_num:int=1, system_prompt_num:int=1, user_prompt:str=""):
+    def __init__(self, num_sources:int=15, country_of_interest:str="Mexico", prompt_num:int=1, system_prompt_num:int=1, user_prompt:str="",
+                 model:str | None = None, link_token_budget:int | None = None, cache_layout:bool = False):
         
         self.num_sources: str  = str(num_sources)
         self.prompt_num: int = prompt_num
         self.system_prompt_num: int = system_prompt_num
         self.country_of_interest: str = country_of_interest
-        self.native_language: dict = country_languages
-        self.links: list = clean_reference_material
+        self.native_language: str = get_country_catalog().language(country_of_interest) or ""
+        self.links: list = reference_data.clean_reference_material
         self.user_prompt: str = user_prompt
-
-
-
-    def construct_prompt(self) -> tuple[str, str]:
+        # Model the prompt is built for, its token budget decides how many reference links fit
+        self.model: str | None = model
+        self.link_token_budget: int | None = link_token_budget
+        # Static part first (system prompt, then reference links), the part that varies last
+        self.cache_layout: bool = cache_layout
+
+    def slot_values(self) -> dict[str, str]:
+        ''' Values of the template placeholders for this prompt '''
+        if self.links is reference_data.clean_reference_material:
+            links = links_for(self.model, self.link_token_budget)
+        else:
+            links = " \n".join(self.links[:N_REFERENCE_LINKS])
+        return {"num_sources": self.num_sources,
+                "country_of_interest": self.country_of_interest,
+                "native_language": self.native_language,
+                "links": links,
+                "prompt_num": str(self.prompt_num)}
+
+    def construct_prompt(self) -> RenderedPrompt:
         '''
         Will add in the user defined selections to the prompt such as 
         number of sources to return
@@ -50,8 +288,8 @@ class Prompt:
         the specified reference material for the model (links regarding real estate industry created by Lee Cashell)
 
         '''
-        user_prompt = user_prompt_dictionary.get(self.prompt_num, "")
-        system_prompt = system_prompt_dictionary.get(self.system_prompt_num, "")
+        user_prompt = user_prompts.user_prompt_dictionary.get(self.prompt_num, "")
+        system_prompt = system_prompts.system_prompt_dictionary.get(self.system_prompt_num, "")
 
         if user_prompt == "":
             raise Exception
@@ -60,23 +298,12 @@ class Prompt:
             raise Exception
                 # print("Selected prompt number not defined: {e}, please choose a valid prompt number")
 
-        system_prompt = system_prompt.replace('__num_sources__', self.num_sources)
-        system_prompt = system_prompt.replace('__country_of_interest__', self.country_of_interest)
-        system_prompt = system_prompt.replace('__native_language__', self.native_language.get(self.country_of_interest, ""))
-        system_prompt = system_prompt.replace('__links__', " \n".join(self.links[:30]))
-        system_prompt = system_prompt.replace('__prompt_num__', str(self.prompt_num))
+        # Every placeholder is filled in one pass over the precompiled templates
+        values = self.slot_values()
+        system_prompt, user_prompt = render_pair(compile_template(system_prompt), compile_template(user_prompt), values, self.cache_layout)
+        return RenderedPrompt(system_prompt, user_prompt, model=self.model)
 
-    
-        user_prompt = user_prompt.replace('__num_sources__', self.num_sources)
-        user_prompt = user_prompt.replace('__country_of_interest__', self.country_of_interest)
-        user_prompt = user_prompt.replace('__native_language__', self.native_language.get(self.country_of_interest, ""))
-        user_prompt = user_prompt.replace('__links__', " \n".join(self.links[:30]))
-        user_prompt = user_prompt.replace('__prompt_num__', str(self.prompt_num))
-
-
-        return system_prompt, user_prompt
-
-    def construct_real_estate_professional_prompt(self) -> tuple[str, str]:
+    def construct_real_estate_professional_prompt(self) -> RenderedPrompt:
         '''
         Will add in the user defined selections to the prompt such as 
         number of sources to return
@@ -85,8 +312,8 @@ class Prompt:
         the specified reference material for the model (links regarding real estate industry created by Lee Cashell)
 
         '''
-        user_prompt = real_estate_professionals_prompt_dictionary.get(self.prompt_num, "")
-        system_prompt = system_prompt_dictionary.get(self.system_prompt_num, "")
+        user_prompt = user_prompts.real_estate_professionals_prompt_dictionary.get(self.prompt_num, "")
+        system_prompt = system_prompts.system_prompt_dictionary.get(self.system_prompt_num, "")
 
         if user_prompt == "":
             raise Exception
@@ -95,75 +322,27 @@ class Prompt:
             raise Exception
                 # print("Selected prompt number not defined: {e}, please choose a valid prompt number")
 
-        system_prompt = system_prompt.replace('__num_sources__', self.num_sources)
-        system_prompt = system_prompt.replace('__country_of_interest__', self.country_of_interest)
-        system_prompt = system_prompt.replace('__native_language__', self.native_language.get(self.country_of_interest, ""))
-        system_prompt = system_prompt.replace('__links__', " \n".join(self.links[:30]))
-        system_prompt = system_prompt.replace('__prompt_num__', str(self.prompt_num))
-
-    
-        user_prompt = user_prompt.replace('__num_sources__', self.num_sources)
-        user_prompt = user_prompt.replace('__country_of_interest__', self.country_of_interest)
-        user_prompt = user_prompt.replace('__prompt_num__', str(self.prompt_num))
-
-
-        return system_prompt, user_prompt
-
-    def construct_real_estate_question_prompt(self) -> tuple[str, str]:
-        ''' Processes user defined prompt, replacing country with country_of_interest '''
+        # The professional prompts only fill the number of sources, country and prompt number
+        values = self.slot_values()
+        return RenderedPrompt(compile_template(system_prompt).render(values), compile_template(user_prompt, PROFESSIONAL_USER_SLOTS).render(values),
+                              model=self.model)
 
-        system_prompt = system_prompt_dictionary.get(self.system_prompt_num, "")
-
-        question_types = [
-            "Commercial vs. Residential Real Estate,",
-            "Country-Specific Real Estate Queries,",
-            "Future Market Predictions & Trends,",
-            "Investment Strategy & ROI,",
-            "Macroeconomic & Regulatory Impacts,",
-            "Property Management & Rental Markets,",
-            "Property Prices & Market Trends,",
-            "Real Estate Financing & Mortgages,",
-            "Technology & AI in Real Estate,",
-            "Zoning, Development, and Infrastructure,"
-        ]
-
-
-        split_text = self.user_prompt
-
-        for q_type in question_types:
-            if q_type in self.user_prompt:
-                split_text = self.user_prompt.split(q_type)[1]
-                
+    def construct_real_estate_question_prompt(self) -> "RenderedPrompt":
+        '''
+        Processes user defined prompt, replacing country with country_of_interest. The question is
+        classified and every placeholder substituted in one pass, see placeholder_resolver.py
+        '''
 
-
-        split_text = split_text.replace("[country]", self.country_of_interest)
-        split_text = split_text.replace("[region]", "Latin America")
-        split_text = split_text.replace("[city/country]",self.country_of_interest)
-        split_text = split_text.replace("[city]", country_capitals[self.country_of_interest])
-        split_text = split_text.replace("[location]", country_capitals[self.country_of_interest])
-        
-        if "[" in split_text or "]" in split_text:
-            print(split_text)
+        system_prompt = system_prompts.system_prompt_dictionary.get(self.system_prompt_num, "")
 
         if self.user_prompt == "":
             raise Exception
-        
-                # print("Selected prompt number not defined: {e}, please choose a valid prompt number")
-
-        # system_prompt = system_prompt.replace('__num_sources__', self.num_sources)
-        system_prompt = system_prompt.replace('__country_of_interest__', self.country_of_interest)
-        # system_prompt = system_prompt.replace('__native_language__', self.native_language.get(self.country_of_interest, ""))
-        # system_prompt = system_prompt.replace('__links__', " \n".join(self.links[:30]))
-        # system_prompt = system_prompt.replace('__prompt_num__', str(self.prompt_num))
-
-    
-        # user_prompt = user_prompt.replace('__num_sources__', self.num_sources)
-        split_text = split_text.replace('__country_of_interest__', self.country_of_interest)
-        # user_prompt = user_prompt.replace('__native_language__', self.native_language.get(self.country_of_interest, ""))
-        # user_prompt = user_prompt.replace('__links__', " \n".join(self.links[:30]))
-        # user_prompt = user_prompt.replace('__prompt_num__', str(self.prompt_num))
-
 
+        question = compile_question(self.user_prompt)
+        user_prompt, unresolved = question.render({"country": self.country_of_interest,
+                                                   "region": DEFAULT_REGION,
+                                                   "capital": get_country_catalog().capital(self.country_of_interest)})
 
+        system_prompt = compile_template(system_prompt, QUESTION_SYSTEM_SLOTS).render({"country_of_interest": self.country_of_interest})
 
-        return system_prompt, split_text
+        return RenderedPrompt(system_prompt, user_prompt, question_type=question.question_type, unresolved=unresolved, model=self.model)
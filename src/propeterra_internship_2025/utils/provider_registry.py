@@ -0,0 +1,114 @@
+'''
+Process wide registry of provider clients and LangChain prompt chains.
+
+Building an OpenAI client or a LangChain chat model sets up a fresh HTTP connection pool,
+so every request used to pay for a new TCP + TLS handshake. Clients are built once per
+(provider, api key, base url) here and reused by every QueryModel in the process, which
+keeps the keep-alive connections warm between questions.
+
+The SDKs are imported on the first request to their provider, not when this module is
+imported, so commands that never call a model (or only one provider) start quickly.
+'''
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+
+PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
+
+# Connection pool settings shared by every pooled client
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+KEEPALIVE_EXPIRY_SECONDS = 120
+
+_lock = threading.Lock()
+_openai_clients: dict[tuple, "OpenAI"] = {}
+_chat_models: dict[tuple, object] = {}
+_prompt_chains: dict[tuple, object] = {}
+
+
+def gemini_safety_settings() -> dict:
+    ''' Very permissive safety settings for every harm category '''
+    from google.generativeai.types.safety_types import HarmCategory, HarmBlockThreshold
+
+    return {HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE}
+
+
+def get_openai_client(api_key:str, base_url:str | None = None) -> "OpenAI":
+    ''' Returns the shared OpenAI SDK client for this key and endpoint, creating it on first use '''
+    cache_key = (api_key, base_url)
+    with _lock:
+        client = _openai_clients.get(cache_key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+
+            http_client = httpx.Client(limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                                           max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                                                           keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS))
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            _openai_clients[cache_key] = client
+    return client
+
+
+def _build_chat_model(provider:str, model:str, api_key:str):
+    ''' Constructs the LangChain chat model for a provider, only called once per registry key '''
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(temperature=0, openai_api_key=api_key, model=model, stream_usage=True)
+    elif provider == "perplexity":
+        from langchain_perplexity import ChatPerplexity
+        return ChatPerplexity(temperature=0, pplx_api_key=api_key, model=model)
+    elif provider == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(temperature=0, google_api_key=api_key, model=model,
+                                      max_tokens=None, timeout=120, safety_settings=gemini_safety_settings())
+    raise TypeError(f"Model {model} has no langchain integration, please select another supported model")
+
+
+def get_chat_model(provider:str, model:str, api_key:str):
+    ''' Returns the shared LangChain chat model for (provider, model, key) '''
+    cache_key = (provider, model, api_key)
+    with _lock:
+        chat = _chat_models.get(cache_key)
+        if chat is None:
+            chat = _build_chat_model(provider, model, api_key)
+            _chat_models[cache_key] = chat
+    return chat
+
+
+def get_prompt_chain(provider:str, model:str, api_key:str):
+    '''
+    Returns the shared prompt | chat chain for (provider, model, key).
+    The system prompt is a template variable rather than part of the template text, so one
+    compiled chain serves every country and question. Invoke it with {"system": ..., "input": ...}.
+    '''
+    cache_key = (provider, model, api_key)
+    with _lock:
+        chain = _prompt_chains.get(cache_key)
+    if chain is not None:
+        return chain
+
+    from langchain_core.prompts import ChatPromptTemplate
+
+    chat = get_chat_model(provider, model, api_key)
+    prompt = ChatPromptTemplate.from_messages([("system", "{system}"), ("human", "{input}")])
+
+    with _lock:
+        chain = _prompt_chains.setdefault(cache_key, prompt | chat)
+    return chain
+
+
+def clear_registry() -> None:
+    ''' Drops every pooled client, mostly useful for benchmarks and after rotating API keys '''
+    with _lock:
+        for client in _openai_clients.values():
+            client.close()
+        _openai_clients.clear()
+        _chat_models.clear()
+        _prompt_chains.clear()
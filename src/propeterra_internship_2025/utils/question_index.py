@@ -0,0 +1,161 @@
+'''
+Random access index for the 100/1000 question CSV files.
+
+The file is scanned once and a sidecar JSON (<file>.index.json) records, for every row, its
+byte offset and length in the CSV, its question type and the placeholders it contains. Later
+runs seek straight to the selected questions (one number, a range like 200-350, or every
+question of one type) instead of parsing the whole file. The sidecar is rebuilt when the
+CSV's size or modification time no longer match.
+'''
+import io
+import os
+import csv
+import json
+import logging
+from typing import Iterable, Iterator
+
+from propeterra_internship_2025.utils.placeholder_resolver import compile_question
+
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json"
+
+
+def index_path(csv_path:str) -> str:
+    return csv_path + INDEX_SUFFIX
+
+
+def parse_row(raw:bytes) -> str:
+    ''' The question (first column) of one raw CSV row, empty for a blank row '''
+    row = next(csv.reader(io.StringIO(raw.decode("utf8"), newline="")), [])
+    return row[0] if row else ""
+
+
+def iter_raw_rows(file) -> Iterator[tuple[int, bytes]]:
+    '''
+    Yields (byte offset, raw bytes) of every CSV row of a binary file. A quoted field can span
+    several lines, a row ends at the first line end with an even number of quotes so far.
+    '''
+    offset = 0
+    parts = []
+    quotes = 0
+    for line in file:
+        parts.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            raw = b"".join(parts)
+            yield offset, raw
+            offset += len(raw)
+            parts, quotes = [], 0
+    if parts:
+        yield offset, b"".join(parts)
+
+
+def build_question_index(csv_path:str) -> dict:
+    ''' Scans the CSV once: offset, length, question type and placeholders of every row '''
+    stat = os.stat(csv_path)
+    rows = []
+    with open(csv_path, "rb") as file:
+        for offset, raw in iter_raw_rows(file):
+            question = compile_question(parse_row(raw))
+            question_type = question.question_type.rstrip(",") if question.question_type else None
+            placeholders = sorted(set(question.slots) | set(question.unresolved))
+            rows.append([offset, len(raw), question_type, placeholders])
+    return {"version": INDEX_VERSION, "source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns, "rows": rows}
+
+
+class QuestionIndex():
+    ''' The rows of a question file, numbered from 1 like the question numbers on the command line '''
+
+    def __init__(self, csv_path:str, rows:list[list]):
+        self.csv_path = csv_path
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def question_types(self) -> list[str]:
+        return sorted({row[2] for row in self.rows if row[2]})
+
+    def question_type(self, number:int) -> str | None:
+        return self.rows[number - 1][2]
+
+    def placeholders(self, number:int) -> list[str]:
+        return self.rows[number - 1][3]
+
+    def select(self, numbers:Iterable[int] | None = None, question_type:str | None = None) -> list[int]:
+        '''
+        Question numbers in ascending order, all of them or the given ones, optionally only those of
+        one question type (case insensitive, the trailing comma of the CSV is optional)
+        '''
+        selected = range(1, len(self.rows) + 1) if numbers is None else sorted(set(numbers))
+        unknown = [number for number in selected if not 1 <= number <= len(self.rows)]
+        if unknown:
+            raise ValueError(f"Question numbers {unknown} are not in {self.csv_path}, it has {len(self.rows)} questions")
+        if question_type is None:
+            return list(selected)
+
+        wanted = question_type.rstrip(",").strip().casefold()
+        types = {name.casefold(): name for name in self.question_types()}
+        if wanted not in types:
+            raise ValueError(f"Unknown question type {question_type}, choose from {'; '.join(self.question_types())}")
+        return [number for number in selected if self.rows[number - 1][2] == types[wanted]]
+
+    def read(self, numbers:Iterable[int]) -> Iterator[tuple[int, str]]:
+        ''' Yields (question number, question text), seeking to each row instead of parsing the rows before it '''
+        with open(self.csv_path, "rb") as file:
+            for number in numbers:
+                offset, length = self.rows[number - 1][:2]
+                file.seek(offset)
+                yield number, parse_row(file.read(length))
+
+
+def parse_question_numbers(spec:str) -> list[int] | None:
+    ''' Parses a "12", "200-350" or "1-10,40" style selection, None for "all" (or -1, the old default) '''
+    if spec.strip() in ("", "all", "-1"):
+        return None
+    numbers = []
+    for entry in spec.split(","):
+        first, _, last = entry.strip().partition("-")
+        try:
+            numbers += range(int(first), int(last or first) + 1)
+        except ValueError:
+            raise ValueError(f"Could not parse question numbers {spec!r}, use e.g. 12, 200-350 or 1-10,40") from None
+    return numbers
+
+
+def load_question_index(csv_path:str) -> QuestionIndex:
+    ''' The index of a question file, from its sidecar if that still matches the file, otherwise rebuilt and saved '''
+    stat = os.stat(csv_path)
+    path = index_path(csv_path)
+    try:
+        with open(path, encoding="utf8") as file:
+            data = json.load(file)
+        if (data.get("version"), data.get("source_size"), data.get("source_mtime_ns")) == (INDEX_VERSION, stat.st_size, stat.st_mtime_ns):
+            return QuestionIndex(csv_path, data["rows"])
+        logging.info(f"{csv_path} changed, rebuilding its question index")
+    except (OSError, ValueError):
+        logging.info(f"Indexing the questions of {csv_path}")
+
+    data = build_question_index(csv_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf8") as file:
+            json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not save the question index to {path}: {e}")
+    return QuestionIndex(csv_path, data["rows"])
+
+
+def question_file_type(csv_path:str, n_questions:int) -> str:
+    '''
+    Suffix of the output files, "_of_100_questions" or "_of_1000_questions" from the file name like
+    before, and from the number of questions for files named otherwise
+    '''
+    name = os.path.basename(csv_path)
+    if "1000_questions" in name:
+        return "_of_1000_questions"
+    if "100_questions" in name:
+        return "_of_100_questions"
+    return f"_of_{n_questions}_questions"
@@ -0,0 +1,234 @@
+'''
+Client side rate limiting and retries shared by every QueryModel request.
+
+Each (model, api key) pair gets a limiter with a requests/minute and a tokens/minute token
+bucket. A 429 or 5xx response is retried with jittered exponential backoff (or after the
+Retry-After the provider asked for), and a 429 also lowers the limiter's rate so the whole
+process slows down instead of every worker hammering the provider. The rate creeps back up
+after successful requests.
+'''
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Awaitable, Callable, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# (requests per minute, tokens per minute), None means the provider does not enforce that budget
+DEFAULT_MODEL_LIMITS = {"gpt-4.1":            (500, 30000),
+                        "sonar":              (50, None),
+                        "sonar-pro":          (50, None),
+                        "sonar-deep-research":(5, None),
+                        "ms_copilot":         (30, None),
+                        "mistral":            (60, 500000),
+                        "gemini-2.5-flash":   (10, 250000),
+                        "gemini-2.5-pro":     (5, 250000),
+                        "manus":              (10, None)}
+FALLBACK_LIMITS = (30, None)
+
+MAX_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_CAP_SECONDS = 120.0
+
+# Adaptive rate: multiplied by THROTTLE_FACTOR on every 429, grows by RECOVERY_FACTOR on every success
+MIN_RATE_FACTOR = 0.1
+THROTTLE_FACTOR = 0.5
+RECOVERY_FACTOR = 1.05
+
+
+class TokenBucket():
+    ''' Classic token bucket refilled continuously at `per_minute` units per minute '''
+
+    def __init__(self, per_minute:float):
+        self.capacity = float(per_minute)
+        self.per_second = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now:float, rate_factor:float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.per_second * rate_factor)
+        self.updated = now
+
+    def wait_time(self, amount:float, rate_factor:float) -> float:
+        ''' Seconds until `amount` units are available, requests larger than the bucket wait for a full bucket '''
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / (self.per_second * rate_factor)
+
+
+class RateLimiter():
+    ''' Requests/minute and tokens/minute budget for one model and API key '''
+
+    def __init__(self, name:str, requests_per_minute:float | None, tokens_per_minute:float | None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.rate_factor = 1.0
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self, n_tokens:int) -> float:
+        '''
+        Takes one request and n_tokens from the buckets if they are available and returns 0,
+        otherwise takes nothing and returns how long to wait before trying again.
+        '''
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+
+            buckets = [(bucket, amount) for bucket, amount in ((self.requests, 1), (self.tokens, n_tokens)) if bucket is not None]
+            for bucket, _ in buckets:
+                bucket.refill(now, self.rate_factor)
+
+            wait = max((bucket.wait_time(amount, self.rate_factor) for bucket, amount in buckets), default=0.0)
+            if wait > 0:
+                return wait
+
+            for bucket, amount in buckets:
+                bucket.available -= min(amount, bucket.capacity)
+            return 0.0
+
+    def acquire(self, n_tokens:int) -> None:
+        ''' Blocks until the request fits in the budget '''
+        while (wait := self.reserve(n_tokens)) > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, n_tokens:int) -> None:
+        ''' Async version of acquire, yields to the event loop while waiting '''
+        while (wait := self.reserve(n_tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def on_throttled(self, retry_after:float | None) -> None:
+        ''' Called on a 429, halves the rate and pauses every caller until Retry-After has passed '''
+        with self.lock:
+            self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor * THROTTLE_FACTOR)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        logger.warning(f"{self.name} throttled, lowering rate to {100*self.rate_factor:.0f}% of the configured budget")
+
+    def on_success(self) -> None:
+        with self.lock:
+            self.rate_factor = min(1.0, self.rate_factor * RECOVERY_FACTOR)
+
+
+_limiters: dict[tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model:str, api_key:str | None) -> RateLimiter:
+    ''' Returns the process wide limiter for this model and key '''
+    key_hash = hashlib.sha256((api_key or "").encode("utf8")).hexdigest()[:12]
+    with _limiters_lock:
+        limiter = _limiters.get((model, key_hash))
+        if limiter is None:
+            requests_per_minute, tokens_per_minute = DEFAULT_MODEL_LIMITS.get(model, FALLBACK_LIMITS)
+            limiter = RateLimiter(f"{model} (key {key_hash})", requests_per_minute, tokens_per_minute)
+            _limiters[(model, key_hash)] = limiter
+    return limiter
+
+
+def status_code_of(error:BaseException) -> int | None:
+    ''' Digs the HTTP status out of the exception types raised by the OpenAI, Perplexity and Google SDKs '''
+    for candidate in (error, getattr(error, "response", None)):
+        if candidate is None:
+            continue
+        for attribute in ("status_code", "code", "status"):
+            value = getattr(candidate, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def retry_after_of(error:BaseException) -> float | None:
+    ''' Seconds from the Retry-After header of a throttled response, if the provider sent one '''
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        # HTTP date form of Retry-After
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error:BaseException) -> bool:
+    ''' 429s, server errors and dropped connections are worth retrying, anything else is a real failure '''
+    status = status_code_of(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "ConnectTimeout", "ServiceUnavailable", "DeadlineExceeded")
+
+
+def backoff_delay(attempt:int, retry_after:float | None = None) -> float:
+    ''' Full jitter exponential backoff, never shorter than what Retry-After asked for '''
+    delay = random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _handle_failure(limiter:RateLimiter, error:Exception, attempt:int, max_retries:int) -> float:
+    ''' Shared retry bookkeeping, returns the delay before the next attempt or re-raises '''
+    if attempt >= max_retries or not is_retryable(error):
+        raise error
+
+    retry_after = retry_after_of(error)
+    if status_code_of(error) == 429:
+        limiter.on_throttled(retry_after)
+
+    delay = backoff_delay(attempt, retry_after)
+    logger.warning(f"{limiter.name} request failed ({status_code_of(error) or type(error).__name__}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+    return delay
+
+
+def call_with_rate_limit(model:str, api_key:str | None, n_tokens:int, fetch:Callable[[], T], max_retries:int = MAX_RETRIES) -> T:
+    ''' Waits for budget, calls fetch() and retries throttled or failed requests '''
+    limiter = get_rate_limiter(model, api_key)
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire(n_tokens)
+        try:
+            result = fetch()
+        except Exception as e:
+            time.sleep(_handle_failure(limiter, e, attempt, max_retries))
+            continue
+        limiter.on_success()
+        return result
+
+
+async def acall_with_rate_limit(model:str, api_key:str | None, n_tokens:int, fetch:Callable[[], Awaitable[T]], max_retries:int = MAX_RETRIES) -> T:
+    ''' Async version of call_with_rate_limit, fetch is a coroutine function '''
+    limiter = get_rate_limiter(model, api_key)
+
+    for attempt in range(max_retries + 1):
+        await limiter.aacquire(n_tokens)
+        try:
+            result = await fetch()
+        except Exception as e:
+            await asyncio.sleep(_handle_failure(limiter, e, attempt, max_retries))
+            continue
+        limiter.on_success()
+        return result
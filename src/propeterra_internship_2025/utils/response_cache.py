@@ -0,0 +1,101 @@
+''' Disk backed, content addressed cache of model responses so identical requests are only paid for once '''
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "model_output/.response_cache.sqlite"
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ResponseCache():
+    '''
+    SQLite key/value store of response texts. Keys are the sha256 of everything that
+    determines the answer (model, rendered prompts, temperature and provider options).
+    Entries older than `ttl_seconds` are treated as misses, and the least recently used
+    entries are evicted once the stored responses exceed `max_bytes`.
+    '''
+
+    def __init__(self, path:str = DEFAULT_CACHE_PATH, ttl_seconds:float = DEFAULT_TTL_SECONDS, max_bytes:int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS responses (
+                                       key         TEXT PRIMARY KEY,
+                                       model       TEXT NOT NULL,
+                                       response    TEXT NOT NULL,
+                                       size        INTEGER NOT NULL,
+                                       created_at  REAL NOT NULL,
+                                       last_access REAL NOT NULL)''')
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(model:str, system_prompt:str, user_prompt:str, temperature:float | None, provider_options:dict | None = None) -> str:
+        ''' Hashes the fully rendered request into a stable cache key '''
+        payload = json.dumps({"model": model,
+                              "system_prompt": system_prompt,
+                              "user_prompt": user_prompt,
+                              "temperature": temperature,
+                              "provider_options": provider_options or {}},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf8")).hexdigest()
+
+    def get(self, key:str) -> str | None:
+        ''' Returns the cached response, or None if it is missing or past its TTL '''
+        row = self.connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        response, created_at = row
+        now = time.time()
+        if now - created_at > self.ttl_seconds:
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.connection.commit()
+            return None
+
+        self.connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self.connection.commit()
+        return response
+
+    def put(self, key:str, model:str, response:str) -> None:
+        ''' Stores a response and evicts least recently used entries if the cache is over size '''
+        now = time.time()
+        self.connection.execute("INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                                (key, model, response, len(response.encode("utf8")), now, now))
+        self.connection.commit()
+        self.evict()
+
+    def evict(self) -> int:
+        ''' Drops expired entries, then the least recently used ones until the cache fits in max_bytes '''
+        removed = self.connection.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                removed += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+        self.connection.commit()
+        if removed:
+            logger.info(f"Evicted {removed} cached responses from {self.path}")
+        return removed
+
+    def close(self) -> None:
+        self.connection.close()
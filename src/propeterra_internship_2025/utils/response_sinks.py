@@ -0,0 +1,61 @@
+'''
+Destinations a streamed model response is written to while it arrives.
+
+Every sink has the same three calls: write(text) for each chunk, write_citations(citations)
+once the stream has ended, and close(meta, response, citations) with the latency / token details
+of the request and the full text and citations of the response.
+'''
+import os
+import uuid
+
+
+def citations_trailer(citations:list | None) -> str:
+    ''' Text block appended after a response for the citations the provider returned '''
+    if not citations:
+        return ""
+    return "\n\nCitations:\n" + "".join(f"{citation}\n" for citation in citations)
+
+
+class TextFileSink():
+    ''' Appends the chunks straight to a .txt output file, flushing after every chunk '''
+
+    def __init__(self, path:str):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.file = open(path, "a", encoding="utf8")
+
+    def write(self, text:str) -> None:
+        self.file.write(text)
+        self.file.flush()
+
+    def write_citations(self, citations:list) -> None:
+        self.write(citations_trailer(citations))
+
+    def close(self, meta:dict, response:str = "", citations:list | None = None) -> None:
+        self.file.close()
+
+
+class StoreStreamSink():
+    '''
+    Streams a response into a ResultStore: a stream_start record, one chunk record per
+    chunk, a citations trailer record and a final response record carrying the metadata,
+    the full response text and the citations, so it can be read on its own like any other
+    response record.
+    '''
+
+    def __init__(self, store, fields:dict):
+        self.store = store
+        self.fields = fields
+        self.stream_id = uuid.uuid4().hex
+        store.append({"record_type": "stream_start", **fields, "stream_id": self.stream_id})
+
+    def write(self, text:str) -> None:
+        self.store.append_chunk(self.stream_id, text)
+
+    def write_citations(self, citations:list) -> None:
+        self.store.append({"record_type": "citations", **self.fields, "stream_id": self.stream_id, "citations": citations})
+
+    def close(self, meta:dict, response:str = "", citations:list | None = None) -> None:
+        self.store.append({"record_type": "response", **self.fields, **meta, "response": response, "citations": citations or [],
+                           "stream_id": self.stream_id, "streamed": True})
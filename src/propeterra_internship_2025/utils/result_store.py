@@ -0,0 +1,292 @@
+'''
+Append-only store for the results of one run.
+
+Every record (documentation header or model response) is appended as one JSON line to the
+current segment file of the run directory, through a single buffered handle that is fsynced
+periodically. A SQLite index next to the segments holds the structured columns and the byte
+offset of every record, so single records can be read back without scanning the segments.
+The dated .txt files in model_output/<country> are rendered from the store with
+render_text_views, which fixes the date at the start of the run so a run crossing midnight
+stays in one set of files.
+
+model_output/runs/<run_id>/
+    run.json              run metadata (run id, run date, command line)
+    run.lock              held by the process writing to the run
+    segment_00000.jsonl   records, one JSON object per line
+    index.sqlite          structured columns + segment/offset/length of every record
+
+Streamed responses are written as a stream_start record, unindexed chunk records as the
+text arrives, a citations trailer record and finally the indexed response record.
+'''
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import logging
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+from datetime import date, datetime
+from typing import Iterator
+
+from propeterra_internship_2025.utils.documentation_templates import TEMPLATE_RENDERERS, output_filename
+from propeterra_internship_2025.utils.response_sinks import StoreStreamSink, citations_trailer
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RUNS_DIR = "model_output/runs"
+WRITE_BUFFER_BYTES = 1024 * 1024
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+FSYNC_INTERVAL_SECONDS = 5.0
+# Streamed chunks reach the segment file once this much has been buffered or this long has passed
+CHUNK_FLUSH_BYTES = 16 * 1024
+CHUNK_FLUSH_INTERVAL_SECONDS = 0.5
+
+INDEX_COLUMNS = ("record_type", "output_kind", "model", "country", "prompt_number", "system_prompt_number",
+                 "outfile_comment", "latency_seconds", "prompt_tokens", "completion_tokens", "cache_hit")
+
+
+def lock_run_dir(run_dir:str):
+    '''
+    Takes the exclusive lock of a run directory and returns the open lock file, closing it releases
+    the lock (so does the process exiting). Raises ValueError if another process holds it.
+    '''
+    handle = open(os.path.join(run_dir, "run.lock"), "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        raise ValueError(f"Run {os.path.basename(run_dir)} is in use by another process, wait for it to finish or use another run id")
+    return handle
+
+
+class ResultStore():
+    '''
+    JSONL segments plus a SQLite index for every record produced by one run. Only one process
+    writes to a run at a time: opening a run that another process has open raises ValueError
+    instead of truncating the segment it is appending to.
+    '''
+
+    def __init__(self, runs_dir:str = DEFAULT_RUNS_DIR, run_id:str | None = None,
+                 fsync_interval:float = FSYNC_INTERVAL_SECONDS, segment_max_bytes:int = SEGMENT_MAX_BYTES):
+        self.run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}_{uuid.uuid4().hex[:6]}"
+        self.run_dir = os.path.join(runs_dir, self.run_id)
+        self.fsync_interval = fsync_interval
+        self.segment_max_bytes = segment_max_bytes
+
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.lock_file = lock_run_dir(self.run_dir)
+
+        metadata_path = os.path.join(self.run_dir, "run.json")
+        if os.path.exists(metadata_path):
+            with open(metadata_path, encoding="utf8") as file:
+                self.metadata = json.load(file)
+        else:
+            self.metadata = {"run_id": self.run_id, "run_date": str(date.today()),
+                             "started_at": datetime.now().isoformat(timespec="seconds"), "argv": sys.argv}
+            with open(metadata_path, "w", encoding="utf8") as file:
+                json.dump(self.metadata, file, indent=2)
+        self.run_date = self.metadata["run_date"]
+
+        self.index = sqlite3.connect(os.path.join(self.run_dir, "index.sqlite"), check_same_thread=False)
+        self.index.execute('''CREATE TABLE IF NOT EXISTS records (
+                                   id                   INTEGER PRIMARY KEY,
+                                   record_type          TEXT NOT NULL,
+                                   output_kind          TEXT,
+                                   model                TEXT,
+                                   country              TEXT,
+                                   prompt_number        INTEGER,
+                                   system_prompt_number INTEGER,
+                                   outfile_comment      TEXT,
+                                   latency_seconds      REAL,
+                                   prompt_tokens        INTEGER,
+                                   completion_tokens    INTEGER,
+                                   cache_hit            INTEGER,
+                                   segment              INTEGER NOT NULL,
+                                   offset               INTEGER NOT NULL,
+                                   length               INTEGER NOT NULL,
+                                   created_at           REAL NOT NULL)''')
+        self.index.commit()
+
+        # Continue after the last segment if the run is being resumed
+        self.segment = self.index.execute("SELECT COALESCE(MAX(segment), 0) FROM records").fetchone()[0]
+
+        # Lines written after the last index commit (e.g. before a crash) are dropped so segments and index agree,
+        # the run lock guarantees no other process is still appending to them
+        last = self.index.execute("SELECT segment, offset + length FROM records ORDER BY id DESC LIMIT 1").fetchone()
+        self.drop_uncommitted(*(last or (0, 0)))
+
+        self.handle = None
+        self.open_segment(self.segment)
+        # Where the records of this session start, so only they are rendered at the end of a resumed run
+        self.opened_at = (self.segment, self.handle.tell())
+        self.last_fsync = time.monotonic()
+        self.closed = False
+
+    def segment_path(self, segment:int) -> str:
+        return os.path.join(self.run_dir, f"segment_{segment:05d}.jsonl")
+
+    def drop_uncommitted(self, segment:int, end:int) -> None:
+        '''
+        Removes the segments a crashed writer rolled over to after `segment` and truncates `segment`
+        to `end`, the end of the last indexed record
+        '''
+        for name in os.listdir(self.run_dir):
+            number = name[len("segment_"):-len(".jsonl")]
+            if name.startswith("segment_") and name.endswith(".jsonl") and number.isdigit() and int(number) > segment:
+                logger.warning(f"Removing {name} of run {self.run_id}, it holds no indexed records")
+                os.remove(os.path.join(self.run_dir, name))
+
+        path = self.segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            os.truncate(path, end)
+
+    def open_segment(self, segment:int) -> None:
+        ''' Switches the single write handle to the given segment file '''
+        if self.handle is not None:
+            self.sync()
+            self.handle.close()
+        self.segment = segment
+        self.handle = open(self.segment_path(segment), "ab", buffering=WRITE_BUFFER_BYTES)
+        self.last_flush = (self.handle.tell(), time.monotonic())
+
+    def append(self, record:dict) -> int:
+        ''' Appends one record and returns its id in the index '''
+        record.setdefault("run_id", self.run_id)
+        record.setdefault("created_at", time.time())
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf8")
+
+        # Segments only roll over between responses, so a stream's chunks stay in one segment
+        if record["record_type"] != "stream_start" and self.handle.tell() and self.handle.tell() + len(line) > self.segment_max_bytes:
+            self.open_segment(self.segment + 1)
+
+        offset = self.handle.tell()
+        self.handle.write(line)
+
+        columns = [record.get(column) for column in INDEX_COLUMNS]
+        cursor = self.index.execute(f"INSERT INTO records ({', '.join(INDEX_COLUMNS)}, segment, offset, length, created_at) "
+                                    f"VALUES ({', '.join('?' * (len(INDEX_COLUMNS) + 4))})",
+                                    (*columns, self.segment, offset, len(line), record["created_at"]))
+
+        if time.monotonic() - self.last_fsync > self.fsync_interval:
+            self.sync()
+        return cursor.lastrowid
+
+    def append_chunk(self, stream_id:str, text:str) -> None:
+        ''' Appends one chunk of a streamed response, chunks are not indexed to keep streaming cheap '''
+        line = (json.dumps({"record_type": "chunk", "stream_id": stream_id, "text": text}, ensure_ascii=False) + "\n").encode("utf8")
+        self.handle.write(line)
+        # Chunks go to disk soon after they arrive rather than waiting for the write buffer to fill,
+        # without a write system call for every token
+        flushed_offset, flushed_at = self.last_flush
+        if self.handle.tell() - flushed_offset >= CHUNK_FLUSH_BYTES or time.monotonic() - flushed_at >= CHUNK_FLUSH_INTERVAL_SECONDS:
+            self.flush()
+
+        if time.monotonic() - self.last_fsync > self.fsync_interval:
+            self.sync()
+
+    def open_stream(self, fields:dict) -> StoreStreamSink:
+        ''' Starts a streamed response with the given structured columns '''
+        return StoreStreamSink(self, fields)
+
+    def flush(self) -> None:
+        ''' Hands the write buffer to the operating system '''
+        self.handle.flush()
+        self.last_flush = (self.handle.tell(), time.monotonic())
+
+    def sync(self) -> None:
+        ''' Flushes the write buffer to disk and commits the index '''
+        self.flush()
+        os.fsync(self.handle.fileno())
+        self.index.commit()
+        self.last_fsync = time.monotonic()
+
+    def read(self, record_id:int) -> dict:
+        ''' Reads a single record back through the index '''
+        self.handle.flush()
+        segment, offset, length = self.index.execute("SELECT segment, offset, length FROM records WHERE id = ?", (record_id,)).fetchone()
+        with open(self.segment_path(segment), "rb") as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+
+    def iter_records(self, since_open:bool = False) -> Iterator[dict]:
+        ''' Yields every record of the run in the order it was appended, or only those of this session '''
+        if not self.closed:
+            self.handle.flush()
+
+        first_segment, first_offset = self.opened_at if since_open else (0, 0)
+        for segment in range(first_segment, self.segment + 1):
+            if not os.path.exists(self.segment_path(segment)):
+                continue
+            with open(self.segment_path(segment), "rb") as file:
+                if segment == first_segment:
+                    file.seek(first_offset)
+                for line in file:
+                    yield json.loads(line)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.sync()
+        self.handle.close()
+        self.index.close()
+        self.lock_file.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def render_text_views(store:ResultStore, output_dir:str = "model_output", overwrite:bool = False, only_new:bool = True) -> list[str]:
+    '''
+    Renders the run into the classic documentation .txt files, one file per
+    (model, country, prompt number, output kind), in append order. By default only the
+    records appended since the store was opened are rendered and appended to the files,
+    like the old writers did; only_new=False with overwrite=True regenerates the whole run.
+    '''
+    written = []
+    handles = {}
+    stream_paths = {}
+    try:
+        for record in store.iter_records(since_open=only_new):
+            if record["record_type"] == "chunk":
+                if record["stream_id"] in stream_paths:
+                    handles[stream_paths[record["stream_id"]]].write(record["text"])
+                continue
+
+            filename = output_filename(record["output_kind"], record["model"], record["country"], store.run_date,
+                                       record["prompt_number"], record.get("outfile_comment", ""))
+            path = os.path.join(output_dir, record["country"], filename)
+
+            if path not in handles:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handles[path] = open(path, "w" if overwrite else "a", encoding="utf8")
+                written.append(path)
+
+            if record["record_type"] == "header":
+                handles[path].write(TEMPLATE_RENDERERS[record["output_kind"]](record))
+            elif record["record_type"] == "stream_start":
+                stream_paths[record["stream_id"]] = path
+            elif record["record_type"] == "citations":
+                handles[path].write(citations_trailer(record["citations"]))
+            elif not record.get("streamed"):
+                handles[path].write(record["response"])
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    logger.info(f"Rendered {len(written)} text files from run {store.run_id}")
+    return written
@@ -0,0 +1,122 @@
+'''
+robots.txt rules per site, fetched once and cached.
+
+The first can_fetch for a site (scheme and host) downloads its robots.txt with a timeout and
+parses it with urllib.robotparser; later calls for the same site only consult the parsed rules
+until they expire after `ttl` seconds. Concurrent callers asking about the same site wait for one
+download instead of starting their own. A robots.txt answering 401/403 disallows the whole site
+and any other 4xx allows it, like RobotFileParser.read. A 5xx or an unreachable robots.txt
+disallows the site (RFC 9309) but is retried after `error_ttl` seconds.
+'''
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+from typing import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROBOTS_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_ROBOTS_ERROR_TTL_SECONDS = 5 * 60
+DEFAULT_ROBOTS_TIMEOUT_SECONDS = 5.0
+
+# Only this much of a robots.txt is parsed, the limit RFC 9309 asks crawlers to support
+MAX_ROBOTS_BYTES = 500 * 1024
+
+
+def site_of(url:str) -> str:
+    ''' "https://www.wri.org" for any URL on that site, "" for a URL without a host '''
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return ""
+    if not parts.scheme or not parts.netloc:
+        return ""
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class RobotsCache():
+    '''
+    Parsed robots.txt of every site seen so far. `get` is called as get(url, timeout=...) and must
+    return a response with status_code and content, requests.get or a session's get by default;
+    `errors` are the exceptions it raises when the site cannot be reached.
+    '''
+
+    def __init__(self, get:Callable | None = None, errors:tuple = (requests.RequestException,),
+                 ttl:float = DEFAULT_ROBOTS_TTL_SECONDS, error_ttl:float = DEFAULT_ROBOTS_ERROR_TTL_SECONDS,
+                 timeout:float = DEFAULT_ROBOTS_TIMEOUT_SECONDS):
+        self.get = get or requests.get
+        self.errors = errors
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.timeout = timeout
+        # site -> (expires at, parsed rules)
+        self.sites: dict[str, tuple[float, RobotFileParser]] = {}
+        self.site_locks: dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, site:str) -> tuple[float, RobotFileParser]:
+        ''' Downloads and parses the robots.txt of a site, returns how long to keep it and the rules '''
+        rules = RobotFileParser(f"{site}/robots.txt")
+        try:
+            response = self.get(rules.url, timeout=self.timeout)
+        except self.errors as e:
+            logger.info(f"Could not fetch {rules.url}, treating the site as disallowed for now: {e}")
+            rules.disallow_all = True
+            return self.error_ttl, rules
+
+        if response.status_code in (401, 403):
+            rules.disallow_all = True
+        elif 400 <= response.status_code < 500:
+            rules.allow_all = True
+        elif response.status_code >= 500:
+            rules.disallow_all = True
+            return self.error_ttl, rules
+        else:
+            rules.parse(response.content[:MAX_ROBOTS_BYTES].decode("utf8", errors="replace").splitlines())
+        return self.ttl, rules
+
+    def rules(self, url:str) -> RobotFileParser | None:
+        ''' The rules of the URL's site, fetched if they are not cached or expired, None for a URL without a site '''
+        site = site_of(url)
+        if not site:
+            return None
+
+        now = time.monotonic()
+        entry = self.sites.get(site)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        with self.lock:
+            site_lock = self.site_locks.setdefault(site, threading.Lock())
+        with site_lock:
+            # Another thread may have fetched it while this one waited
+            entry = self.sites.get(site)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            ttl, rules = self.fetch(site)
+            self.sites[site] = (time.monotonic() + ttl, rules)
+            return rules
+
+    def can_fetch(self, user_agent:str, url:str) -> bool:
+        ''' Whether robots.txt lets `user_agent` fetch `url`, a URL without a site is never allowed '''
+        rules = self.rules(url)
+        return rules is not None and rules.can_fetch(user_agent, url)
+
+    def crawl_delay(self, user_agent:str, url:str) -> float | None:
+        ''' The Crawl-delay the site asks of `user_agent`, None if it asks for none '''
+        rules = self.rules(url)
+        delay = rules.crawl_delay(user_agent) if rules is not None else None
+        return float(delay) if delay is not None else None
+
+    def prefetch(self, urls:Iterable[str], max_workers:int = 8) -> None:
+        ''' Fetches the robots.txt of every site of `urls` concurrently, so later can_fetch calls are cache hits '''
+        sites = [site for site in dict.fromkeys(map(site_of, urls)) if site]
+        if sites:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(sites))) as pool:
+                list(pool.map(self.rules, sites))
@@ -0,0 +1,194 @@
+'''
+Checkpoint manifest for long question sweeps.
+
+Every (sweep, country, model, question number, system prompt) item of a sweep is a row in a
+small SQLite database with a state: pending, in_flight, done or failed. A worker claims an
+item before querying it and marks it done or failed afterwards, so a restarted sweep skips
+the finished questions and only retries the failed or interrupted ones.
+
+The claim is a single conditional UPDATE, so several worker processes can share one
+manifest without querying the same question twice. While a worker is alive a heartbeat
+thread refreshes the claims it holds every heartbeat_interval seconds, and only the worker
+holding a claim can change the state of its item. Items left in flight by a worker that
+died are handed out again once that worker's process is gone (same host) or its heartbeat
+stopped more than stale_after seconds ago (any host).
+'''
+import os
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from typing import Iterable
+
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+STALE_AFTER_SECONDS = 30 * 60
+HEARTBEAT_INTERVAL_SECONDS = 60
+
+# (sweep, country, model, question number, system prompt number)
+ManifestKey = tuple[str, str, str, int, int]
+
+
+def manifest_key(query, sweep:str) -> ManifestKey:
+    ''' Manifest key of a QueryModel in the given sweep (e.g. the question file type) '''
+    return (sweep, query.country, query.model, query.prompt_number, query.system_prompt_number)
+
+
+def process_alive(pid:int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RunManifest():
+    ''' SQLite backed state of every item of a sweep, shared by every worker that opens the same file '''
+
+    def __init__(self, path:str, stale_after:float = STALE_AFTER_SECONDS, heartbeat_interval:float = HEARTBEAT_INTERVAL_SECONDS):
+        if heartbeat_interval >= stale_after:
+            raise ValueError(f"heartbeat_interval ({heartbeat_interval}s) must be shorter than stale_after ({stale_after}s)")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.stale_after = stale_after
+        self.hostname = socket.gethostname()
+        self.worker = f"{self.hostname}:{os.getpid()}"
+
+        # Autocommit, every state change is its own short transaction
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute('''CREATE TABLE IF NOT EXISTS items (
+                               sweep                TEXT NOT NULL,
+                               country              TEXT NOT NULL,
+                               model                TEXT NOT NULL,
+                               question_number      INTEGER NOT NULL,
+                               system_prompt_number INTEGER NOT NULL,
+                               state                TEXT NOT NULL,
+                               attempts             INTEGER NOT NULL DEFAULT 0,
+                               worker               TEXT,
+                               error                TEXT,
+                               updated_at           REAL NOT NULL,
+                               PRIMARY KEY (sweep, country, model, question_number, system_prompt_number))''')
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state)")
+        self.release_dead_workers()
+
+        self.heartbeat_interval = heartbeat_interval
+        self.stopped = threading.Event()
+        self.heartbeat_thread = threading.Thread(target=self.heartbeat, name="manifest-heartbeat", daemon=True)
+        self.heartbeat_thread.start()
+
+    def heartbeat(self) -> None:
+        ''' Keeps the claims of this live worker fresh, so they never look stale to other workers '''
+        # Own connection, the main one is used by the worker thread
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            while not self.stopped.wait(self.heartbeat_interval):
+                try:
+                    db.execute("UPDATE items SET updated_at = ? WHERE state = ? AND worker = ?", (time.time(), IN_FLIGHT, self.worker))
+                except sqlite3.Error as e:
+                    logger.warning(f"Manifest heartbeat failed: {e}")
+        finally:
+            db.close()
+
+    def register(self, keys:Iterable[ManifestKey]) -> None:
+        ''' Adds the items of a sweep as pending, items that are already known keep their state '''
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.executemany("INSERT OR IGNORE INTO items (sweep, country, model, question_number, system_prompt_number, state, updated_at) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)", [(*key, PENDING, now) for key in keys])
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def reset(self, keys:Iterable[ManifestKey]) -> None:
+        ''' Forgets the state of the given items, so a finished sweep can be run again from scratch '''
+        self.db.executemany("DELETE FROM items WHERE sweep = ? AND country = ? AND model = ? AND question_number = ? AND system_prompt_number = ?",
+                            list(keys))
+
+    def release_dead_workers(self) -> int:
+        ''' Puts items claimed by processes of this host that no longer exist back to pending '''
+        released = 0
+        for (worker,) in self.db.execute("SELECT DISTINCT worker FROM items WHERE state = ?", (IN_FLIGHT,)).fetchall():
+            hostname, _, pid = (worker or "").rpartition(":")
+            if hostname == self.hostname and pid.isdigit() and not process_alive(int(pid)):
+                released += self.db.execute("UPDATE items SET state = ?, worker = NULL WHERE state = ? AND worker = ?",
+                                            (PENDING, IN_FLIGHT, worker)).rowcount
+        if released:
+            logger.info(f"Released {released} items left in flight by workers that are no longer running")
+        return released
+
+    def claim(self, key:ManifestKey) -> bool:
+        ''' Atomically marks the item in flight for this worker, False if it is done or another worker has it '''
+        now = time.time()
+        cursor = self.db.execute('''UPDATE items SET state = ?, worker = ?, attempts = attempts + 1, updated_at = ?
+                                    WHERE sweep = ? AND country = ? AND model = ? AND question_number = ? AND system_prompt_number = ?
+                                      AND (state IN (?, ?) OR (state = ? AND updated_at < ?))''',
+                                 (IN_FLIGHT, self.worker, now, *key, PENDING, FAILED, IN_FLIGHT, now - self.stale_after))
+        return cursor.rowcount == 1
+
+    def set_state(self, key:ManifestKey, state:str, error:str | None = None) -> bool:
+        ''' Changes the state of an item this worker has in flight, False (and nothing changed) if another worker took it over '''
+        updated = self.db.execute('''UPDATE items SET state = ?, error = ?, updated_at = ?
+                                     WHERE sweep = ? AND country = ? AND model = ? AND question_number = ? AND system_prompt_number = ?
+                                       AND state = ? AND worker = ?''',
+                                  (state, error, time.time(), *key, IN_FLIGHT, self.worker)).rowcount == 1
+        if not updated:
+            logger.warning(f"{key} is no longer claimed by this worker, not marking it {state}")
+        return updated
+
+    def mark_done(self, key:ManifestKey) -> bool:
+        return self.set_state(key, DONE)
+
+    def mark_failed(self, key:ManifestKey, error:str) -> bool:
+        return self.set_state(key, FAILED, error)
+
+    def fail_in_flight(self, error:str) -> int:
+        ''' Marks everything this worker still has in flight as failed, e.g. questions a batch did not return '''
+        return self.db.execute("UPDATE items SET state = ?, error = ?, updated_at = ? WHERE state = ? AND worker = ?",
+                               (FAILED, error, time.time(), IN_FLIGHT, self.worker)).rowcount
+
+    def release_in_flight(self) -> int:
+        ''' Hands this worker's unfinished items back to pending, used when the run is interrupted '''
+        return self.db.execute("UPDATE items SET state = ?, worker = NULL WHERE state = ? AND worker = ?",
+                               (PENDING, IN_FLIGHT, self.worker)).rowcount
+
+    def state_counts(self, sweep:str | None = None) -> dict[str, int]:
+        ''' Number of items in every state, optionally for one sweep '''
+        if sweep is None:
+            rows = self.db.execute("SELECT state, COUNT(*) FROM items GROUP BY state")
+        else:
+            rows = self.db.execute("SELECT state, COUNT(*) FROM items WHERE sweep = ? GROUP BY state", (sweep,))
+        return {state: 0 for state in (PENDING, IN_FLIGHT, DONE, FAILED)} | dict(rows.fetchall())
+
+    def failures(self, sweep:str | None = None) -> list[tuple]:
+        ''' (country, model, question number, system prompt number, error) of every failed item '''
+        query = "SELECT country, model, question_number, system_prompt_number, error FROM items WHERE state = ?"
+        if sweep is None:
+            return self.db.execute(query + " ORDER BY question_number", (FAILED,)).fetchall()
+        return self.db.execute(query + " AND sweep = ? ORDER BY question_number", (FAILED, sweep)).fetchall()
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.heartbeat_thread.join()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
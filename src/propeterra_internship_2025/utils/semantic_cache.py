@@ -0,0 +1,224 @@
+'''
+Embedding based cache for near duplicate questions.
+
+Many rows of the 100/1000 question sheets only differ in wording once [country] is filled in,
+so the exact ResponseCache misses them. The rendered user prompt is embedded and compared with
+the prompts already answered for the same model, country and system prompt. When the closest
+one is at least `threshold` similar (cosine), its answer is either served instead of querying
+the model (mode "serve") or only recorded with the new response for review (mode "flag").
+
+Answers and their unit length embeddings live in SQLite, every (model, country, system prompt)
+scope is loaded into an in-memory matrix on first use, so a lookup is one matrix-vector product.
+'''
+import os
+import re
+import zlib
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from propeterra_internship_2025.utils.response_cache import DEFAULT_TTL_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEMANTIC_CACHE_PATH = "model_output/.semantic_cache.sqlite"
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+HASHING_DIMENSIONS = 1024
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Embeddings of recently seen prompts kept in memory, a lookup and the store after it embed the same prompt
+EMBEDDING_MEMO_SIZE = 4096
+
+# What happens to a question whose closest previous question is above the threshold
+SERVE = "serve"
+FLAG = "flag"
+MODES = (SERVE, FLAG)
+
+
+def unit_vector(vector:np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class HashingEmbedder():
+    '''
+    Local embedding without a model or network: word unigrams, word bigrams and character
+    trigrams hashed into a fixed size signed count vector. Catches reworded questions that
+    share most of their words, not paraphrases with different vocabulary.
+    '''
+
+    def __init__(self, dimensions:int = HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    @staticmethod
+    def features(text:str) -> list[str]:
+        words = re.findall(r"\w+", text.casefold())
+        features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, text:str) -> np.ndarray:
+        # crc32 rather than hash(), which is salted per process and would change the vectors between runs
+        hashes = np.fromiter((zlib.crc32(feature.encode("utf8")) for feature in self.features(text)), dtype=np.uint32)
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        np.add.at(vector, hashes % self.dimensions, np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32))
+        return unit_vector(vector)
+
+
+class OpenAIEmbedder():
+    ''' Embeddings from the OpenAI embeddings endpoint, better on paraphrases but one request per new prompt '''
+
+    def __init__(self, model:str = OPENAI_EMBEDDING_MODEL, api_key:str | None = None, base_url:str | None = None):
+        self.model = model
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY_PROPETERRA")
+        self.base_url = base_url
+        self.name = f"openai-{model}"
+
+    def embed(self, text:str) -> np.ndarray:
+        from propeterra_internship_2025.utils.provider_registry import get_openai_client
+
+        response = get_openai_client(self.api_key, self.base_url).embeddings.create(model=self.model, input=text)
+        return unit_vector(np.asarray(response.data[0].embedding, dtype=np.float32))
+
+
+EMBEDDERS = {"hashing": HashingEmbedder, "openai": OpenAIEmbedder}
+
+
+class VectorIndex():
+    ''' Growable matrix of unit vectors and their row ids, appending is amortized O(1) '''
+
+    def __init__(self):
+        self.matrix = None
+        self.ids: list[int] = []
+
+    def add(self, row_id:int, vector:np.ndarray) -> None:
+        if self.matrix is None:
+            self.matrix = np.empty((16, len(vector)), dtype=np.float32)
+        elif len(self.ids) == len(self.matrix):
+            self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+        self.matrix[len(self.ids)] = vector
+        self.ids.append(row_id)
+
+    def nearest(self, vector:np.ndarray) -> tuple[int, float] | None:
+        ''' Row id and cosine similarity of the closest vector, None if the index is empty '''
+        if not self.ids:
+            return None
+        similarities = self.matrix[:len(self.ids)] @ vector
+        best = int(np.argmax(similarities))
+        return self.ids[best], float(similarities[best])
+
+
+class SemanticMatch():
+    ''' The closest previously answered prompt of a lookup '''
+
+    def __init__(self, similarity:float, user_prompt:str, response:str, created_at:float):
+        self.similarity = similarity
+        self.user_prompt = user_prompt
+        self.response = response
+        self.created_at = created_at
+
+
+class SemanticCache():
+    '''
+    SQLite store of answered prompts and their embeddings, searched per (model, country,
+    system prompt) scope. Entries older than `ttl_seconds` are dropped when the cache is opened.
+    '''
+
+    def __init__(self, path:str = DEFAULT_SEMANTIC_CACHE_PATH, embedder=None, threshold:float = DEFAULT_SIMILARITY_THRESHOLD,
+                 mode:str = FLAG, ttl_seconds:float = DEFAULT_TTL_SECONDS):
+        if mode not in MODES:
+            raise ValueError(f"Unknown semantic cache mode {mode}, choose from {', '.join(MODES)}")
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Similarity threshold must be in (0, 1], got {threshold}")
+
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS answers (
+                                       id          INTEGER PRIMARY KEY,
+                                       embedder    TEXT NOT NULL,
+                                       scope       TEXT NOT NULL,
+                                       user_prompt TEXT NOT NULL,
+                                       response    TEXT NOT NULL,
+                                       embedding   BLOB NOT NULL,
+                                       created_at  REAL NOT NULL,
+                                       UNIQUE (embedder, scope, user_prompt))''')
+        removed = self.connection.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - ttl_seconds,)).rowcount
+        self.connection.commit()
+        if removed:
+            logger.info(f"Dropped {removed} expired answers from {path}")
+
+        self.indexes: dict[str, VectorIndex] = {}
+        self.embeddings: dict[str, np.ndarray] = {}
+
+    @property
+    def serves(self) -> bool:
+        return self.mode == SERVE
+
+    @staticmethod
+    def make_scope(model:str, country:str, system_prompt:str) -> str:
+        ''' Only answers given by the same model, for the same country, under the same system prompt are compared '''
+        return hashlib.sha256(f"{model}\0{country}\0{system_prompt}".encode("utf8")).hexdigest()
+
+    def embed(self, text:str) -> np.ndarray:
+        vector = self.embeddings.get(text)
+        if vector is None:
+            if len(self.embeddings) >= EMBEDDING_MEMO_SIZE:
+                self.embeddings.clear()
+            vector = self.embeddings[text] = self.embedder.embed(text)
+        return vector
+
+    def scope_index(self, scope:str) -> VectorIndex:
+        ''' The in-memory index of one scope, read from SQLite on first use. Call with the lock held '''
+        index = self.indexes.get(scope)
+        if index is None:
+            index = self.indexes[scope] = VectorIndex()
+            for row_id, embedding in self.connection.execute("SELECT id, embedding FROM answers WHERE embedder = ? AND scope = ? ORDER BY id",
+                                                             (self.embedder.name, scope)):
+                index.add(row_id, np.frombuffer(embedding, dtype=np.float32))
+        return index
+
+    def lookup(self, scope:str, user_prompt:str) -> SemanticMatch | None:
+        ''' The closest answered prompt of the scope if it is at least `threshold` similar, otherwise None '''
+        vector = self.embed(user_prompt)
+        with self.lock:
+            nearest = self.scope_index(scope).nearest(vector)
+            if nearest is None or nearest[1] < self.threshold:
+                return None
+            row = self.connection.execute("SELECT user_prompt, response, created_at FROM answers WHERE id = ?", (nearest[0],)).fetchone()
+        return SemanticMatch(nearest[1], *row)
+
+    def add(self, scope:str, user_prompt:str, response:str) -> None:
+        ''' Stores an answer, a prompt that was answered before keeps its row and gets the new response '''
+        vector = self.embed(user_prompt)
+        with self.lock:
+            self.connection.execute('''INSERT INTO answers (embedder, scope, user_prompt, response, embedding, created_at) VALUES (?, ?, ?, ?, ?, ?)
+                                       ON CONFLICT (embedder, scope, user_prompt) DO UPDATE SET response = excluded.response, created_at = excluded.created_at''',
+                                    (self.embedder.name, scope, user_prompt, response, vector.astype(np.float32).tobytes(), time.time()))
+            self.connection.commit()
+            row_id = self.connection.execute("SELECT id FROM answers WHERE embedder = ? AND scope = ? AND user_prompt = ?",
+                                             (self.embedder.name, scope, user_prompt)).fetchone()[0]
+            index = self.indexes.get(scope)
+            if index is not None and row_id not in index.ids:
+                index.add(row_id, vector)
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,45 @@
+''' Token counting with cached tiktoken encodings '''
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import tiktoken
+
+
+logger = logging.getLogger(__name__)
+
+# tiktoken only knows OpenAI models, other providers are approximated with the GPT-4.1 encoding
+FALLBACK_ENCODING = "o200k_base"
+
+# Rough characters per token, used when the encoding files cannot be downloaded (e.g. offline)
+CHARS_PER_TOKEN = 4
+
+# Model whose encoding is used when no model is given
+DEFAULT_TOKEN_MODEL = "gpt-4.1"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model:str) -> "tiktoken.Encoding | None":
+    ''' Returns the tiktoken encoding for a model, loaded once per process. None if it cannot be loaded '''
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        logger.warning(f"Could not load a tiktoken encoding for {model}, approximating token counts: {e}")
+        return None
+
+
+def count_tokens(text:str, model:str = DEFAULT_TOKEN_MODEL) -> int:
+    ''' Number of tokens the text encodes to for the given model '''
+    if not text:
+        return 0
+
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,211 @@
+'''
+Streaming import of the orientation question workbook (.xlsx) into the question CSV that
+submit_real_estate_questions.py reads.
+
+An .xlsx file is a zip of XML parts. The sheet is read with ElementTree.iterparse, one row at a
+time, and every row is cleared once it is handled, so only the shared strings table and the
+current row are ever held in memory. Rows are normalized to the "<question type>, <question>"
+form placeholder_resolver expects: the type comes from a column or section header matching one of
+QUESTION_TYPES, the question is the longest text cell of the row. The SHA-256 of the workbook is
+stored next to the CSV, so importing an unchanged workbook again is skipped.
+'''
+import os
+import csv
+import json
+import zipfile
+import hashlib
+import logging
+import posixpath
+from typing import Iterator
+from xml.etree.ElementTree import iterparse
+
+from propeterra_internship_2025.utils.placeholder_resolver import QUESTION_TYPES
+from propeterra_internship_2025.utils.question_index import load_question_index
+
+
+INGEST_VERSION = 1
+STATE_SUFFIX = ".source.json"
+
+# Rows with less text that match no question type are headers or notes, not questions
+MIN_QUESTION_WORDS = 3
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Question type without its trailing comma, casefolded -> the type as listed in QUESTION_TYPES
+TYPE_NAMES = {question_type.rstrip(",").casefold(): question_type for question_type in QUESTION_TYPES}
+
+
+def file_sha256(path:str, chunk_size:int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def element_text(element) -> str:
+    ''' Text of a shared or inline string, rich text runs included but not the phonetic hints '''
+    if element is None:
+        return ""
+    nodes = element.findall(f"{MAIN_NS}t") + element.findall(f"{MAIN_NS}r/{MAIN_NS}t")
+    return "".join(node.text or "" for node in nodes)
+
+
+def read_shared_strings(workbook:zipfile.ZipFile) -> list[str]:
+    ''' The shared strings table, most text cells only hold an index into it '''
+    if "xl/sharedStrings.xml" not in workbook.namelist():
+        return []
+    strings = []
+    with workbook.open("xl/sharedStrings.xml") as part:
+        for _, element in iterparse(part):
+            if element.tag == f"{MAIN_NS}si":
+                strings.append(element_text(element))
+                element.clear()
+    return strings
+
+
+def sheet_paths(workbook:zipfile.ZipFile) -> dict[str, str]:
+    ''' Sheet name -> path of its XML part in the zip, in workbook order '''
+    with workbook.open("xl/_rels/workbook.xml.rels") as part:
+        targets = {}
+        for _, element in iterparse(part):
+            if element.tag == f"{PACKAGE_REL_NS}Relationship":
+                target = element.get("Target")
+                targets[element.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+
+    sheets = {}
+    with workbook.open("xl/workbook.xml") as part:
+        for _, element in iterparse(part):
+            if element.tag == f"{MAIN_NS}sheet":
+                sheets[element.get("name")] = targets[element.get(f"{REL_NS}id")]
+    return sheets
+
+
+def column_index(reference:str) -> int:
+    ''' Zero based column of a cell reference, "C12" -> 2 '''
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord("A") + 1
+    return index - 1
+
+
+def iter_sheet_rows(workbook:zipfile.ZipFile, sheet_path:str, shared_strings:list[str]) -> Iterator[list[str]]:
+    ''' Yields the cell values of every row as strings, empty cells included as "" '''
+    with workbook.open(sheet_path) as part:
+        row: dict[int, str] = {}
+        for _, element in iterparse(part):
+            if element.tag == f"{MAIN_NS}c":
+                cell_type = element.get("t")
+                if cell_type == "inlineStr":
+                    value = element_text(element.find(f"{MAIN_NS}is"))
+                else:
+                    value_element = element.find(f"{MAIN_NS}v")
+                    value = value_element.text or "" if value_element is not None else ""
+                    if cell_type == "s" and value:
+                        value = shared_strings[int(value)]
+                reference = element.get("r")
+                row[column_index(reference) if reference else len(row)] = value
+                element.clear()
+            elif element.tag == f"{MAIN_NS}row":
+                yield [row.get(column, "") for column in range(max(row) + 1)] if row else []
+                row = {}
+                element.clear()
+
+
+def match_question_type(text:str) -> str | None:
+    return TYPE_NAMES.get(text.strip().rstrip(",").strip().casefold())
+
+
+def normalize_rows(rows:Iterator[list[str]], counts:dict[str, int]) -> Iterator[str]:
+    '''
+    Turns sheet rows into "<question type>, <question>" lines. A row holding only a question
+    type starts a section whose type applies to the questions below it, a type in another
+    column of the row applies to that row only. Questions already prefixed with their type are kept.
+    '''
+    section_type = None
+    for cells in rows:
+        texts = [" ".join(cell.split()) for cell in cells if cell.strip()]
+        types = [match_question_type(text) for text in texts]
+        row_type = next((question_type for question_type in types if question_type), None)
+        others = [text for text, question_type in zip(texts, types) if question_type is None]
+
+        if row_type and not others:
+            section_type = row_type
+            counts["sections"] += 1
+            continue
+
+        question = max(others, key=len, default="")
+        if not question or (row_type is None and len(question.split()) < MIN_QUESTION_WORDS):
+            counts["skipped"] += 1
+            continue
+
+        if any(question.startswith(prefix) for prefix in QUESTION_TYPES):
+            counts["typed"] += 1
+            yield question
+            continue
+
+        question_type = row_type or section_type
+        counts["typed" if question_type else "untyped"] += 1
+        yield f"{question_type} {question}" if question_type else question
+
+
+def state_path(csv_path:str) -> str:
+    return csv_path + STATE_SUFFIX
+
+
+def ingest_workbook(workbook_path:str, csv_path:str, sheet:str | None = None, force:bool = False) -> dict:
+    '''
+    Streams one sheet of the workbook (the first by default) into csv_path and builds its question
+    index. Skipped when the workbook's hash matches the one recorded by the last import into the
+    same CSV. Returns the counts of the import, with "skipped_unchanged" set when nothing was done.
+    '''
+    workbook_hash = file_sha256(workbook_path)
+    state = {"version": INGEST_VERSION, "workbook_sha256": workbook_hash, "sheet": sheet}
+    try:
+        with open(state_path(csv_path), encoding="utf8") as file:
+            previous = json.load(file)
+        if not force and os.path.exists(csv_path) and all(previous.get(key) == value for key, value in state.items()):
+            logging.info(f"{workbook_path} is unchanged since the last import into {csv_path}, skipping it")
+            return {**previous["counts"], "skipped_unchanged": True}
+    except (OSError, ValueError):
+        pass
+
+    counts = {"rows": 0, "typed": 0, "untyped": 0, "sections": 0, "skipped": 0}
+    with zipfile.ZipFile(workbook_path) as workbook:
+        sheets = sheet_paths(workbook)
+        if sheet is not None and sheet not in sheets:
+            raise ValueError(f"Could not find the sheet {sheet} in {workbook_path}, choose from {', '.join(sheets)}")
+        sheet_name = sheet if sheet is not None else next(iter(sheets))
+        sheet_path = sheets[sheet_name]
+        shared_strings = read_shared_strings(workbook)
+
+        def counted_rows() -> Iterator[list[str]]:
+            for row in iter_sheet_rows(workbook, sheet_path, shared_strings):
+                counts["rows"] += 1
+                yield row
+
+        directory = os.path.dirname(csv_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", newline="", encoding="utf8") as file:
+            writer = csv.writer(file)
+            for question in normalize_rows(counted_rows(), counts):
+                writer.writerow([question])
+
+        # An empty import (wrong sheet, different layout) must not replace a good CSV
+        if counts["typed"] + counts["untyped"] == 0:
+            os.remove(tmp_path)
+            raise ValueError(f"Found no questions on the sheet {sheet_name} of {workbook_path}, the workbook has the sheets {', '.join(sheets)}")
+        os.replace(tmp_path, csv_path)
+
+    # The CSV changed, so its sidecar index is rebuilt right away instead of on the first submission
+    load_question_index(csv_path)
+
+    with open(state_path(csv_path), "w", encoding="utf8") as file:
+        json.dump({**state, "counts": counts}, file, indent=2)
+    return {**counts, "skipped_unchanged": False}
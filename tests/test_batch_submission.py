@@ -0,0 +1,86 @@
+import os
+import json
+from datetime import date
+
+import pytest
+
+from fake_openai_server import start_server, BATCH_FAILURE_MARKER
+from propeterra_internship_2025.utils.model_query import QueryModel
+from propeterra_internship_2025.utils.provider_registry import get_openai_client
+from propeterra_internship_2025.utils.documentation_templates import output_filename
+from propeterra_internship_2025.utils.batch_submission import run_batch, demultiplex_results, make_custom_id
+
+
+QUESTIONS = [("Peru", 1, "What is ROI in Peru?"),
+             ("Peru", 2, "How are rents taxed in Peru?"),
+             ("Peru", 3, f"Which districts of Lima grow fastest? {BATCH_FAILURE_MARKER}"),
+             ("Chile", 2, "How are rents taxed in Chile?"),
+             ("Peru", 4, "What does a notary cost in Peru?")]
+
+
+@pytest.fixture
+def fake_api():
+    server = start_server(0)
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def make_queries() -> list[QueryModel]:
+    return [QueryModel("gpt-4.1", country, "You are a real estate analyst.", question, prompt_number, 2, outfile_comment="_test")
+            for country, prompt_number, question in QUESTIONS]
+
+
+def question_file(query:QueryModel) -> str:
+    return os.path.join("model_output", query.country, output_filename("real_estate_questions", query.model, query.country, date.today(),
+                                                                       query.prompt_number, query.outfile_comment))
+
+
+def write_question_result(query:QueryModel, message_text:str) -> None:
+    query.initialize_real_estate_questions_file()
+    query.write_response(message_text, real_estate_questions=True)
+
+
+def test_batch_round_trip_lands_every_answer_in_its_question_file(fake_api, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("model_output")
+    queries = make_queries()
+    client = get_openai_client("fake-key", base_url=fake_api)
+
+    written, failed = run_batch(client, queries, str(tmp_path / "batches" / "questions.jsonl"), write_question_result,
+                                poll_interval=0, timeout=10)
+
+    failing = queries[2]
+    assert make_custom_id(queries[0]) == "Peru|gpt-4.1|2|1"
+    # Written in question order although the fake returns the output in reverse
+    assert written == [make_custom_id(query) for query in queries if query is not failing]
+    assert failed == [make_custom_id(failing)]
+
+    for query in queries:
+        if query is failing:
+            assert not os.path.exists(question_file(query))
+            continue
+        with open(question_file(query), encoding="utf8") as file:
+            text = file.read()
+        assert f"fake answer to: {query.user_prompt}" in text
+        assert text.count("fake answer to:") == 1
+        # Usage reported by the batch replaces the tiktoken estimate
+        assert query.response_meta["completion_tokens"] == 8
+
+
+def test_demultiplex_skips_unknown_and_reports_missing_results():
+    queries = make_queries()[:3]
+    queries_by_id = {make_custom_id(query): query for query in queries}
+    ids = list(queries_by_id)
+    answer = lambda custom_id, text: json.dumps({"custom_id": custom_id, "error": None,
+                                                 "response": {"status_code": 200, "body": {"choices": [{"message": {"content": text}}]}}})
+    output = "\n".join([answer(ids[1], "second"),
+                        answer("Peru|gpt-4.1|2|99", "unknown"),
+                        json.dumps({"custom_id": ids[0], "error": {"code": "batch_expired", "message": "expired"}, "response": None})])
+
+    results = []
+    written, failed = demultiplex_results(output, queries_by_id, lambda query, text: results.append((query.prompt_number, text)))
+
+    assert written == [ids[1]]
+    assert failed == [ids[0], ids[2]]
+    assert results == [(2, "second")]
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import subprocess
+
+from propeterra_internship_2025.utils.result_store import ResultStore
+
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Fills a few small segments, leaves a partial line after the last rollover and dies without closing the store
+CRASHING_WRITER = '''
+import os, sys
+from propeterra_internship_2025.utils.result_store import ResultStore
+store = ResultStore(runs_dir=sys.argv[1], run_id="crashed", segment_max_bytes=300)
+for number in range(3):
+    store.append({"record_type": "header", "prompt_number": number, "text": "x" * 100})
+store.sync()
+for number in range(3, 6):
+    store.append({"record_type": "header", "prompt_number": number, "text": "x" * 100})
+store.handle.write(b'{"record_type": "header", "text": "partial')
+store.handle.flush()
+os._exit(1)
+'''
+
+
+def records(store:ResultStore) -> list[dict]:
+    return [record for record in store.iter_records() if record["record_type"] == "header"]
+
+
+def test_resume_after_crash_past_a_rollover(tmp_path):
+    runs_dir = str(tmp_path)
+    writer = subprocess.run([sys.executable, "-c", CRASHING_WRITER, runs_dir], env={**os.environ, "PYTHONPATH": SRC_DIR})
+    assert writer.returncode == 1
+    run_dir = os.path.join(runs_dir, "crashed")
+    assert len([name for name in os.listdir(run_dir) if name.startswith("segment_")]) > 2
+
+    with ResultStore(runs_dir=runs_dir, run_id="crashed", segment_max_bytes=300) as store:
+        committed = [record["prompt_number"] for record in records(store)]
+        # The rollover synced the first records, what the writer appended after its last commit is gone
+        assert committed == list(range(len(committed)))
+        assert len(committed) >= 3
+        for number in range(10, 14):
+            store.append({"record_type": "header", "prompt_number": number, "text": "x" * 100})
+
+    with ResultStore(runs_dir=runs_dir, run_id="crashed", segment_max_bytes=300) as store:
+        numbers = [record["prompt_number"] for record in records(store)]
+        assert numbers == committed + [10, 11, 12, 13]
+        for record_id, number in enumerate(numbers, 1):
+            assert store.read(record_id)["prompt_number"] == number
+
+    for name in os.listdir(run_dir):
+        if name.startswith("segment_"):
+            with open(os.path.join(run_dir, name), encoding="utf8") as file:
+                for line in file:
+                    json.loads(line)
+
+
+def test_run_is_locked_while_open(tmp_path):
+    with ResultStore(runs_dir=str(tmp_path), run_id="locked"):
+        opener = subprocess.run([sys.executable, "-c", "import sys; from propeterra_internship_2025.utils.result_store import ResultStore; "
+                                 "ResultStore(runs_dir=sys.argv[1], run_id='locked')", str(tmp_path)],
+                                env={**os.environ, "PYTHONPATH": SRC_DIR}, capture_output=True, text=True)
+        assert opener.returncode == 1
+        assert "in use by another process" in opener.stderr